@@ -0,0 +1,95 @@
+import logging
+from flask import Flask
+from flask.logging import default_handler
+from app.config import Config
+
+# 日志处理器在进程内只创建一次，多次create_app不会重复输出
+_log_handler = None
+
+
+def _get_log_handler():
+    global _log_handler
+    if _log_handler is None:
+        from app.logging_config import create_log_handler
+        _log_handler = create_log_handler()
+    return _log_handler
+
+
+def configure_logging(app):
+    """配置应用、SQLAlchemy和werkzeug的日志
+
+    日志经队列由后台线程写入文件（JSON）和控制台，见 app/logging_config.py
+    """
+    log_handler = _get_log_handler()
+
+    # 配置应用日志，用异步处理器代替Flask默认的处理器，避免重复输出
+    # 各模块的 logging.getLogger(__name__) 是app的子记录器，日志也经过这里
+    app.logger.setLevel(logging.INFO)
+    app.logger.removeHandler(default_handler)
+    if log_handler not in app.logger.handlers:
+        app.logger.addHandler(log_handler)
+
+    # 配置SQLAlchemy日志（如果需要）
+    logging.getLogger('sqlalchemy').setLevel(logging.WARNING)
+
+    # 配置werkzeug日志
+    werkzeug_logger = logging.getLogger('werkzeug')
+    werkzeug_logger.setLevel(logging.INFO)
+    if log_handler not in werkzeug_logger.handlers:
+        werkzeug_logger.addHandler(log_handler)
+
+
+def create_app(config=None):
+    """创建Flask应用
+
+    config为配置类或字典，覆盖Config中的同名配置，例如测试时传入独立的数据库：
+        create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:////tmp/test.db'})
+    """
+    from app.db_routing import REPLICA_BIND, count_queries
+    from app.extensions import db, cors
+    from app.metrics_export import init_request_metrics
+    from app.profiling import init_profiling
+    from app.routes import bp
+
+    app = Flask(__name__)
+
+    # 加载配置
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(Config.SQLALCHEMY_ENGINE_OPTIONS)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    # 内存数据库使用单连接，不能设置连接池参数
+    if app.config['SQLALCHEMY_DATABASE_URI'] in ('sqlite://', 'sqlite:///:memory:'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    if app.config.get('DATABASE_REPLICA_URL'):
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], url=app.config['DATABASE_REPLICA_URL'])
+        }
+
+    # 配置JSON响应支持中文
+    app.config['JSON_AS_ASCII'] = False
+
+    configure_logging(app)
+
+    # 初始化扩展
+    db.init_app(app)
+    cors.init_app(app, resources={r"/*": {"origins": "*"}})
+
+    # 注册路由
+    app.register_blueprint(bp)
+
+    # 统计每个接口的请求数和耗时
+    init_request_metrics(app)
+
+    # 请求性能分析（默认关闭）
+    init_profiling(app)
+
+    # 按主库/副本统计SQL条数
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            count_queries(engine, bind_key or 'primary')
+
+    return app
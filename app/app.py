@@ -1,67 +1,13 @@
-from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_cors import CORS
-import os
-import logging
-from logging.handlers import RotatingFileHandler
-from dotenv import load_dotenv
+"""默认应用实例
 
-# 加载环境变量
-load_dotenv()
+gunicorn、sms_worker.py、migrate_db.py等脚本通过 app.app:app 使用默认配置的应用，
+需要独立配置时（如测试）使用 app.create_app
+"""
+from app import create_app
+from app.extensions import db
 
 # 创建Flask应用
-app = Flask(__name__)
-
-# 配置数据库
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.dirname(__file__), 'beslove.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# 配置日志
-log_dir = os.path.join(os.path.dirname(__file__), 'logs')
-os.makedirs(log_dir, exist_ok=True)
-
-# 配置日志格式
-log_format = '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
-
-# 创建文件日志处理器（轮转）
-file_handler = RotatingFileHandler(
-    os.path.join(log_dir, 'beslove.log'),
-    maxBytes=10*1024*1024,  # 10MB
-    backupCount=5
-)
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(logging.Formatter(log_format))
-
-# 创建控制台日志处理器
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(logging.Formatter(log_format))
-
-# 配置应用日志
-app.logger.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
-app.logger.addHandler(console_handler)
-
-# 配置SQLAlchemy日志（如果需要）
-db_logger = logging.getLogger('sqlalchemy')
-db_logger.setLevel(logging.WARNING)
-
-# 配置werkzeug日志
-werkzeug_logger = logging.getLogger('werkzeug')
-werkzeug_logger.setLevel(logging.INFO)
-werkzeug_logger.addHandler(file_handler)
-
-# 配置JSON响应支持中文
-app.config['JSON_AS_ASCII'] = False
-
-# 配置CORS
-CORS(app, resources={r"/*": {"origins": "*"}})
-
-# 初始化数据库
-db = SQLAlchemy(app)
-
-# 导入路由
-from app.routes import *
+app = create_app()
 
 if __name__ == '__main__':
     with app.app_context():
@@ -0,0 +1,300 @@
+"""微信授权接口的异步（ASGI）实现
+
+/api/wx/get_openid、/api/wx/login、/api/wx/phone 大部分时间在等待微信接口返回，
+这里用asyncio + aiohttp实现，单个进程可以同时等待数百个微信请求；请求参数和返回内容与routes.py中的接口完全一致。
+数据库读写仍使用Flask-SQLAlchemy，在线程池中执行，不阻塞事件循环。
+
+需要安装 starlette、aiohttp 和 uvicorn，由Nginx将 /api/wx/ 转发到本服务，其余接口仍由gunicorn处理:
+    uvicorn app.asgi:app --host 127.0.0.1 --port 5001 --workers 2
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Route
+from app.app import app as flask_app
+from app.extensions import db
+from app.models import User
+from app.utils import CryptoUtil, validate_phone
+from app.db_routing import mark_recent_write
+from app.responses import json_encoder
+from app.metrics import metrics
+from app.metrics_export import metrics_exporter
+from app.wechat import async_wx_client, token_manager, WeChatTokenError, TOKEN_INVALID_ERRCODES
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 创建加密工具实例
+crypto_util = CryptoUtil()
+
+
+# 当前请求返回的业务错误码，记入接口请求数指标
+_response_code = ContextVar('response_code', default='')
+
+
+def json_response(response_data):
+    """与Flask接口相同的JSON响应"""
+    _response_code.set(response_data.get('code'))
+    return Response(json_encoder.dumps(response_data), headers={'Content-Type': 'application/json; charset=utf-8'})
+
+
+def _save_user_phone(openid, phone_number):
+    """保存或更新用户手机号，返回是否新建了用户（在线程池中执行）"""
+    with flask_app.app_context():
+        encrypted_phone = crypto_util.encrypt(phone_number)
+        user = User.query.filter_by(openid=openid).first()
+        created = user is None
+        if created:
+            user = User(openid=openid)
+            db.session.add(user)
+        user.phone_number = encrypted_phone
+        user.phone_hash = crypto_util.blind_index(phone_number)
+        mark_recent_write(openid)
+        db.session.commit()
+        return created
+
+
+async def _get_access_token():
+    """进程内缓存有效时直接返回，否则在线程池中读取共享缓存或请求微信刷新"""
+    return token_manager.cached_token() or await asyncio.to_thread(token_manager.get_token)
+
+
+async def wx_get_openid(request):
+    """获取微信用户openid接口"""
+    try:
+        code = request.query_params.get('code')
+
+        if not code:
+            return json_response({'code': 400, 'message': '缺少code参数'})
+
+        # 调用微信API获取session_key和openid
+        wx_result = await async_wx_client.code2session(code)
+
+        logger.info('微信openid获取请求，code: %s, 微信返回: %s', code, wx_result)
+
+        if 'errcode' in wx_result:
+            return json_response({
+                'code': 400,
+                'message': '获取openid失败',
+                'wx_error': {
+                    'errcode': wx_result.get('errcode'),
+                    'errmsg': wx_result.get('errmsg')
+                }
+            })
+
+        return json_response({
+            'code': 200,
+            'message': '获取成功',
+            'data': {
+                'openid': wx_result.get('openid'),
+                'session_key': wx_result.get('session_key')
+            }
+        })
+
+    except Exception as e:
+        logger.error('获取openid失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
+
+
+async def wx_login(request):
+    """微信授权登录接口"""
+    try:
+        data = await request.json()
+        code = data.get('code')
+        encrypted_data = data.get('encryptedData')
+        iv = data.get('iv')
+
+        if not code or not encrypted_data or not iv:
+            return json_response({'code': 400, 'message': '参数错误'})
+
+        logger.info('微信登录请求，code: %s, encryptedData: %s..., iv: %s', code, encrypted_data[:10], iv)
+
+        # 1. 调用微信API获取session_key和openid
+        wx_result = await async_wx_client.code2session(code)
+
+        logger.info('微信登录，调用微信API返回: %s', wx_result)
+
+        if 'errcode' in wx_result:
+            return json_response({
+                'code': 400,
+                'message': '微信登录失败',
+                'wx_error': {
+                    'errcode': wx_result.get('errcode'),
+                    'errmsg': wx_result.get('errmsg')
+                }
+            })
+
+        openid = wx_result.get('openid')
+        session_key = wx_result.get('session_key')
+
+        logger.info('微信登录，获取到openid: %s, session_key: %s...', openid, session_key[:10])
+
+        # 2. 解密手机号
+        success, phone_number = crypto_util.decrypt_wx_phone(encrypted_data, iv, session_key)
+        if not success:
+            logger.error('微信登录，手机号解密失败: %s', phone_number)
+            return json_response({
+                'code': 400,
+                'message': '手机号解密失败',
+                'error': phone_number
+            })
+
+        # 3. 验证手机号格式
+        if not validate_phone(phone_number):
+            logger.error('微信登录，手机号格式不正确: %s', phone_number)
+            return json_response({'code': 400, 'message': '手机号格式不正确'})
+
+        # 4. 保存或更新用户信息
+        created = await asyncio.to_thread(_save_user_phone, openid, phone_number)
+        logger.info('微信登录，%s，openid: %s', '创建新用户' if created else '用户信息更新成功', openid)
+
+        # 5. 返回登录结果（脱敏手机号）
+        return json_response({
+            'code': 200,
+            'message': '登录成功',
+            'data': {
+                'openid': openid,
+                'phone': phone_number[:3] + '****' + phone_number[-4:]
+            }
+        })
+
+    except Exception as e:
+        logger.error('微信登录失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
+
+
+async def wx_get_phone(request):
+    """获取微信用户手机号接口"""
+    try:
+        code = request.query_params.get('code')
+        openid = request.query_params.get('openid')
+
+        logger.info('微信手机号获取请求，code: %s, openid: %s', code, openid)
+
+        if not code or not openid:
+            return json_response({'code': 400, 'message': '参数错误'})
+
+        # 1. 获取微信access_token
+        # 2. 调用微信phonenumber.getPhoneNumber接口，token失效时刷新后重试一次
+        try:
+            for attempt in range(2):
+                access_token = await _get_access_token()
+                phone_result = await async_wx_client.get_phone_number(access_token, code)
+                if phone_result.get('errcode') not in TOKEN_INVALID_ERRCODES:
+                    break
+                logger.warning('微信access_token已失效，重新获取: %s', phone_result)
+                await asyncio.to_thread(token_manager.invalidate, access_token)
+        except WeChatTokenError as e:
+            return json_response({
+                'code': 400,
+                'message': '获取微信access_token失败',
+                'wx_error': e.wx_result
+            })
+
+        logger.info('调用微信getPhoneNumber返回: %s', phone_result)
+
+        if 'errcode' in phone_result and phone_result['errcode'] != 0:
+            logger.error('调用微信getPhoneNumber失败: %s', phone_result)
+            return json_response({
+                'code': 400,
+                'message': '获取手机号失败',
+                'wx_error': phone_result
+            })
+
+        # 3. 获取手机号数据
+        phone_info = phone_result.get('phone_info')
+        if not phone_info:
+            logger.error('微信返回数据中缺少phone_info: %s', phone_result)
+            return json_response({'code': 400, 'message': '获取手机号数据失败'})
+
+        # 微信API可能直接返回明文手机号，否则解密
+        phone_number = phone_info.get('phoneNumber')
+        if not phone_number:
+            # 4. 解密手机号
+            success, phone_number = crypto_util.decrypt_wx_phone(
+                phone_info.get('encryptedData'), phone_info.get('iv'), phone_info.get('session_key')
+            )
+            if not success:
+                logger.error('微信手机号解密失败: %s', phone_number)
+                return json_response({
+                    'code': 400,
+                    'message': '手机号解密失败',
+                    'error': phone_number
+                })
+
+        # 5. 验证手机号格式
+        if not validate_phone(phone_number):
+            logger.error('手机号格式不正确: %s', phone_number)
+            return json_response({'code': 400, 'message': '手机号格式不正确'})
+
+        # 6. 保存或更新用户信息
+        await asyncio.to_thread(_save_user_phone, openid, phone_number)
+        logger.info('用户手机号更新成功，openid: %s', openid)
+
+        # 7. 返回完整手机号
+        return json_response({
+            'code': 200,
+            'message': '获取成功',
+            'data': {
+                'phone': phone_number
+            }
+        })
+
+    except Exception as e:
+        logger.error('获取微信手机号失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
+
+
+class RequestMetricsMiddleware:
+    """与Flask应用相同的接口请求数和耗时指标"""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = set(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope['path'] if scope['path'] in self.routes else 'unmatched'
+            metrics.observe('http_request_seconds', time.perf_counter() - started, route=route, method=scope['method'])
+            metrics.incr('http_requests', route=route, method=scope['method'], status=status, code=_response_code.get())
+            metrics_exporter.start()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_wx_client.close()
+
+
+# 接口列表
+routes = [
+    Route('/api/wx/get_openid', wx_get_openid, methods=['GET']),
+    Route('/api/wx/login', wx_login, methods=['POST']),
+    Route('/api/wx/phone', wx_get_phone, methods=['GET']),
+]
+
+middleware = [Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+if flask_app.config['METRICS_ENABLED']:
+    middleware.insert(0, Middleware(RequestMetricsMiddleware, routes=[route.path for route in routes]))
+
+# 创建ASGI应用
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
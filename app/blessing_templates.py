@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import time
+import threading
+import logging
+from app.config import Config
+from app.responses import json_encoder
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+class BlessingTemplates:
+    """祝福模板
+
+    - 模板从JSON文件加载，响应内容只序列化一次，缓存为bytes，ETag为内容的哈希
+    - 文件修改后自动重新加载并整体替换，不需要重新部署；文件内容有误时继续使用上一个版本
+    """
+
+    def __init__(self, path, check_interval=None):
+        self.path = path
+        self.check_interval = check_interval if check_interval is not None else Config.BLESSING_TEMPLATES_CHECK_INTERVAL
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0
+        self._cached = None  # (响应内容, ETag)
+        self.reload()
+
+    @staticmethod
+    def render(templates):
+        """生成接口的响应内容和ETag"""
+        response_data = {
+            "code": 200,
+            "message": "获取成功",
+            "data": templates
+        }
+        body = json_encoder.dumps(response_data)
+        return body, hashlib.sha256(body).hexdigest()[:32]
+
+    def reload(self):
+        """从模板文件重新加载"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    templates = json.load(f)
+                if not isinstance(templates, list):
+                    raise ValueError('模板文件内容必须是列表')
+            except (OSError, ValueError) as e:
+                logger.error('加载祝福模板失败: %s, %s', self.path, e)
+                return
+            self._cached = self.render(templates)
+            self._mtime = mtime
+            logger.info('祝福模板已加载，模板数: %s，文件: %s', len(templates), self.path)
+
+    def _reload_if_changed(self):
+        """每隔check_interval秒检查一次模板文件是否有修改"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def get(self):
+        """返回(响应内容, ETag)，模板从未加载成功时返回None"""
+        self._reload_if_changed()
+        return self._cached
+
+
+# 初始化祝福模板实例
+blessing_templates = BlessingTemplates(Config.BLESSING_TEMPLATES_PATH)
@@ -0,0 +1,102 @@
+import functools
+import time
+from datetime import datetime, timedelta
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from app.metrics import metrics
+
+# 只读副本在SQLALCHEMY_BINDS中的名称
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """按请求路由的会话
+
+    被read_only标记的请求中，查询发往只读副本；写入（flush）和其他请求始终使用主库。
+    未配置只读副本时与默认会话相同。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and g.get('use_replica'):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def upsert_statement(table, values, key_columns, update_values):
+    """按数据库类型生成 插入，主键冲突时更新 的语句"""
+    dialect = _db().session.get_bind(clause=table).dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        return insert(table).values(**values).on_duplicate_key_update(**update_values)
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).values(**values).on_conflict_do_update(
+        index_elements=key_columns, set_=update_values
+    )
+
+
+def mark_recent_write(key):
+    """记录用户刚刚写入过数据，随当前事务提交
+
+    之后RECENT_WRITE_WINDOW秒内该用户的只读请求仍读主库，不会因为副本延迟读不到自己刚写的数据
+    """
+    if REPLICA_BIND not in _db().engines:
+        return
+    from app.models import RecentWrite
+    table = RecentWrite.__table__
+    now = datetime.utcnow()
+    _db().session.execute(upsert_statement(
+        table, {'key': key, 'written_at': now}, [table.c.key], {'written_at': now}
+    ))
+
+
+def _recently_written(key):
+    """用户是否在读写一致窗口内写入过数据（查询主库）"""
+    from app.models import RecentWrite
+    since = datetime.utcnow() - timedelta(seconds=current_app.config['RECENT_WRITE_WINDOW'])
+    return _db().session.query(RecentWrite.key)\
+        .filter(RecentWrite.key == key, RecentWrite.written_at >= since).first() is not None
+
+
+def read_only(key_func=None):
+    """标记只读接口，查询发往只读副本
+
+    key_func返回当前请求的用户标识（如openid），该用户最近写入过数据时仍读主库
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if REPLICA_BIND in _db().engines:
+                key = key_func() if key_func else None
+                if key and _recently_written(key):
+                    metrics.incr('db_replica_fallbacks')
+                else:
+                    g.use_replica = True
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _db():
+    return current_app.extensions['sqlalchemy']
+
+
+def count_queries(engine, bind_name):
+    """按数据库（主库/副本）统计执行的SQL条数和耗时，请求中执行的SQL另外累计到请求的指标中"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        metrics.observe('db_query_seconds', elapsed, bind=bind_name)
+        if has_request_context():
+            state = g._get_current_object()
+            state.sql_queries = state.get('sql_queries', 0) + 1
+            state.sql_seconds = state.get('sql_seconds', 0.0) + elapsed
@@ -0,0 +1,24 @@
+import sqlite3
+from flask_cors import CORS
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import Config
+from app.db_routing import RoutingSession
+
+# 扩展实例不绑定应用，由create_app调用init_app初始化
+# 只读接口的查询由RoutingSession路由到只读副本
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+cors = CORS()
+
+
+# 配置SQLite连接参数
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """为每个新建的SQLite连接设置WAL、busy_timeout等参数"""
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not Config.SQLITE_TUNING:
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in Config.SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
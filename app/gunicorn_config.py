@@ -1,9 +1,68 @@
 import multiprocessing
+import os
+from dotenv import load_dotenv
+
+# gunicorn在导入应用之前读取本文件，需先加载.env中的GUNICORN_*配置
+load_dotenv()
+
+# 运行模式（GUNICORN_WORKER_CLASS）:
+#   sync    每个worker进程同一时间只处理一个请求
+#   gthread 每个worker进程用threads个线程处理请求（默认）
+#   gevent  每个worker进程用协程处理请求，最多worker_connections个并发（需安装gevent）
+# 微信登录、获取手机号等接口大部分时间在等待微信接口返回，gthread/gevent模式下等待期间可以处理其他请求，
+# 用更少的进程（内存）支撑同样的并发
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # 必须在导入应用之前打补丁（preload_app会在master中导入应用），requests、threading等才会使用协程版本
+    from gevent import monkey
+    monkey.patch_all()
 
 bind = "0.0.0.0:5000"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+if worker_class == 'sync':
+    workers = multiprocessing.cpu_count() * 2 + 1
+else:
+    workers = multiprocessing.cpu_count() + 1
+workers = int(os.environ.get('GUNICORN_WORKERS') or workers)
+# gthread每个进程的线程数，不要超过数据库连接池大小 pool_size + max_overflow；
+# 其他模式必须为1，sync模式下threads大于1时gunicorn会自动改用gthread
+threads = int(os.environ.get('GUNICORN_THREADS') or 8) if worker_class == 'gthread' else 1
+# gevent每个进程的最大并发连接数
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 200)
 timeout = 30
 accesslog = "/var/log/beslove/access.log"
 errorlog = "/var/log/beslove/error.log"
 loglevel = "info"
+
+# 在master进程中导入应用后再fork出worker，导入的模块和敏感词词典等只读数据由各worker以写时复制方式共享，
+# worker启动更快、占用内存更少；代价是修改代码后需要重启master（systemctl restart），HUP不会重新加载代码
+preload_app = os.environ.get('GUNICORN_PRELOAD_APP', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    """master启动时清空上次运行留下的各进程指标文件，/metrics 从零开始统计"""
+    from app.metrics_export import metrics_exporter
+    metrics_exporter.clear()
+
+
+def post_fork(server, worker):
+    """fork后丢弃从master继承的数据库连接，每个worker建立自己的连接"""
+    if not server.cfg.preload_app:
+        return
+    from app.app import app
+    from app.extensions import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    """worker退出前写入最后的指标，已退出worker的请求数仍计入 /metrics"""
+    from app.metrics_export import metrics_exporter
+    metrics_exporter.flush_at_exit()
+
+
+def child_exit(server, worker):
+    """worker退出后master把它的指标文件合并到已退出进程的汇总文件，文件数不随worker重启增长"""
+    from app.metrics_export import metrics_exporter
+    metrics_exporter.merge_exited(worker.pid)
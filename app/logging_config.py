@@ -0,0 +1,214 @@
+import atexit
+import copy
+import json
+import os
+import queue
+import random
+import re
+import threading
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from app.config import Config
+from app.metrics import metrics
+
+# 控制台日志格式
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
+
+# 手机号只保留前3位和后4位
+PHONE_PATTERN = re.compile(r'(?<!\d)(1[3-9]\d)\d{4}(\d{4})(?!\d)')
+# 验证码，如“验证码: 123456”，以及验证码短信的“内容: 123456”
+CODE_PATTERN = re.compile(r'((?:验证码|内容)\s*[:：=是为]\s*)\d{4,8}(?!\d)')
+# 微信登录凭证、会话密钥等键值对，如“code: xxx”、'session_key': 'xxx'、secret=xxx
+SECRET_PATTERN = re.compile(
+    r'''((?<![A-Za-z_])(?:code|js_code|session_key|access_token|encryptedData|secret)['"]?\s*[:=]\s*['"]?)'''
+    r'''[^'"\s,&}]+'''
+)
+
+# LogRecord的标准属性，其余属性为extra传入的字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+def mask_pii(text):
+    """日志内容脱敏：手机号、验证码、微信登录凭证和密钥"""
+    text = PHONE_PATTERN.sub(r'\1****\2', text)
+    text = CODE_PATTERN.sub(r'\1******', text)
+    return SECRET_PATTERN.sub(r'\1***', text)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON
+
+    固定字段为time、level、logger、message、location、process、thread，
+    通过 extra={...} 传入的字段原样加入，异常堆栈放在exception字段
+    """
+
+    def format(self, record):
+        # RotatingFileHandler判断是否轮转和写入时各格式化一次，第二次直接使用结果
+        cached = record.__dict__.get('_json_line')
+        if cached is not None:
+            return cached
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'location': f'{record.filename}:{record.lineno}',
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = mask_pii(value) if isinstance(value, str) else value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        record._json_line = json.dumps(entry, ensure_ascii=False, default=str)
+        return record._json_line
+
+
+class SamplingFilter(logging.Filter):
+    """按日志记录器抽样INFO及以下的日志，WARNING及以上全部保留
+
+    rates为{记录器名称: 保留比例}，对该记录器及其子记录器生效，按名称最长匹配
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + '.'):
+                if rate < 1 and random.random() >= rate:
+                    metrics.incr('log_records_sampled_out', logger=name)
+                    return False
+                return True
+        return True
+
+
+def parse_sample_rates(value):
+    """解析 app.routes=0.1,app.utils=0.05 格式的抽样配置"""
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, rate = item.split('=', 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def _freeze(value):
+    """日志参数在后台线程中才格式化，调用线程中只保留不会被修改的值"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (dict, list)):
+        return copy.copy(value)
+    # 其他对象（如ORM对象、异常）可能在后台线程中访问数据库或已被修改，立即转为字符串
+    return str(value)
+
+
+class MaskingQueueListener(QueueListener):
+    """后台线程：格式化消息并脱敏一次，再交给文件和控制台处理器"""
+
+    def prepare(self, record):
+        record.msg = mask_pii(record.getMessage())
+        record.args = None
+        if record.exc_text:
+            record.exc_text = mask_pii(record.exc_text)
+        return record
+
+
+class AsyncQueueHandler(QueueHandler):
+    """将日志放入队列，由后台线程格式化并写入文件和控制台
+
+    - 消息在后台线程中才用%格式化并脱敏，调用线程只复制参数；被抽样丢弃的日志不会格式化
+    - 队列满时丢弃日志并计数，不阻塞请求
+    - 后台线程按进程启动：fork前停止后台线程并写完队列（避免子进程继承写了一半的文件缓冲区和锁），
+      fork后父子进程在第一次写日志时各自启动，gunicorn preload_app时每个worker有自己的线程
+    """
+
+    def __init__(self, handlers, maxsize):
+        super().__init__(None)
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+        os.register_at_fork(before=self._before_fork,
+                            after_in_parent=self._start_lock.release,
+                            after_in_child=self._start_lock.release)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # fork后不能使用父进程的队列，重新创建
+            self.queue = queue.Queue(self.maxsize)
+            self.listener = MaskingQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = {key: _freeze(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(_freeze(arg) for arg in record.args)
+        if record.exc_info:
+            # 异常堆栈引用调用线程的栈帧，在这里格式化
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr('log_records_dropped')
+
+    def _before_fork(self):
+        self._start_lock.acquire()
+        self.stop()
+
+    def stop(self):
+        """停止后台线程，写完队列中剩余的日志"""
+        if self._pid == os.getpid() and self.listener is not None:
+            self.listener.stop()
+            self._pid = None
+
+
+def create_log_handler(log_dir=None, stream=None):
+    """创建异步日志处理器
+
+    文件日志为JSON格式，按大小轮转（10MB，保留5个）；控制台为文本格式。两者都会脱敏
+    log_dir默认为app/logs，stream默认为标准错误
+    """
+    log_dir = log_dir or os.path.join(os.path.dirname(__file__), 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+
+    # 创建文件日志处理器（轮转）
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, 'beslove.log'),
+        maxBytes=10*1024*1024,  # 10MB
+        backupCount=5,
+        encoding='utf-8'
+    )
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(JsonFormatter())
+
+    # 创建控制台日志处理器
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setLevel(logging.DEBUG)
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    handler = AsyncQueueHandler([file_handler, console_handler], Config.LOG_QUEUE_SIZE)
+    handler.addFilter(SamplingFilter(parse_sample_rates(Config.LOG_SAMPLE_RATES)))
+    return handler
@@ -0,0 +1,301 @@
+import fcntl
+import gzip
+import os
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from app.extensions import db
+from app.config import Config
+from app.metrics import metrics
+from app.responses import json_encoder
+from app.models import BlessingMessage, SmsVerification, SmsOutbox, RateLimitCounter, RecentWrite
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceRunner:
+    """过期数据清理
+
+    - 删除过期的验证码、已完成的短信队列消息和过期的限流计数；长时间停在sending的短信标记为unknown
+    - 超过保留期的祝福消息（含发送者已删除的）先写入gzip压缩的JSONL归档文件再删除
+    - 每批删除单独一个事务，按耗时自动调整批大小，单个写事务不超过lock_slice秒，
+      批与批之间暂停，线上请求可以拿到写锁
+    - 最后用incremental_vacuum归还空闲页，并更新统计信息
+    """
+
+    def __init__(self, batch_size=None, lock_slice=None, pause=None, archive_dir=None):
+        self.batch_size = batch_size or Config.MAINTENANCE_BATCH_SIZE
+        self.lock_slice = lock_slice or Config.MAINTENANCE_LOCK_SLICE
+        self.pause = pause if pause is not None else Config.MAINTENANCE_PAUSE
+        self.archive_dir = archive_dir or Config.MAINTENANCE_ARCHIVE_DIR
+
+    def _next_batch_size(self, batch_size, elapsed):
+        """超过时间片时减半，远低于时间片时加倍，最多到配置的批大小"""
+        if elapsed > self.lock_slice:
+            return max(10, batch_size // 2)
+        if elapsed < self.lock_slice / 4:
+            return min(self.batch_size, batch_size * 2)
+        return batch_size
+
+    def delete_in_batches(self, table, condition, before_delete=None):
+        """分批删除满足条件的行，返回删除的行数
+
+        按主键顺序分批，单列主键时记住上一批的最大主键，不重复扫描不满足条件的行。
+        before_delete(conn, keys)在同一事务中、删除之前调用，用于归档或删除关联数据。
+        """
+        pk_columns = list(table.primary_key.columns)
+        single_pk = len(pk_columns) == 1
+        removed = 0
+        last_pk = None
+        batch_size = self.batch_size
+        while True:
+            started = time.perf_counter()
+            with db.engine.begin() as conn:
+                query = db.select(*pk_columns).where(condition)
+                if single_pk and last_pk is not None:
+                    query = query.where(pk_columns[0] > last_pk)
+                keys = conn.execute(query.order_by(*pk_columns).limit(batch_size)).fetchall()
+                if not keys:
+                    break
+                if single_pk:
+                    keys = [key[0] for key in keys]
+                    last_pk = keys[-1]
+                    key_filter = pk_columns[0].in_(keys)
+                else:
+                    key_filter = db.tuple_(*pk_columns).in_([tuple(key) for key in keys])
+                if before_delete:
+                    before_delete(conn, keys)
+                conn.execute(table.delete().where(key_filter))
+            elapsed = time.perf_counter() - started
+
+            removed += len(keys)
+            logger.debug('%s: 删除 %s 行，耗时 %.3fs', table.name, len(keys), elapsed)
+            if len(keys) < batch_size:
+                break
+            batch_size = self._next_batch_size(batch_size, elapsed)
+            time.sleep(self.pause)
+
+        metrics.incr('maintenance_rows_removed', removed, table=table.name)
+        return removed
+
+    def purge_verifications(self, now):
+        """删除过期超过保留时间的验证码（已使用的验证码也会在过期后删除）"""
+        cutoff = now - timedelta(hours=Config.SMS_VERIFICATION_RETENTION_HOURS)
+        return self.delete_in_batches(SmsVerification.__table__, SmsVerification.expires_at < cutoff)
+
+    def purge_outbox(self, now):
+        """删除已发送、已失败或结果未知且超过保留天数的短信队列消息"""
+        cutoff = now - timedelta(days=Config.SMS_OUTBOX_RETENTION_DAYS)
+        condition = db.and_(SmsOutbox.status.in_(['sent', 'failed', 'unknown']), SmsOutbox.updated_at < cutoff)
+        return self.delete_in_batches(SmsOutbox.__table__, condition)
+
+    def expire_sending_sms(self, now):
+        """将领取后超过SMS_SENDING_TIMEOUT秒仍停在sending的短信标记为unknown，返回标记的条数
+
+        worker在调用短信接口前后崩溃或卡住，短信可能已经发出，不重新发送。
+        claimed_by保持不变，卡住后恢复的worker仍可写回确定的发送结果
+        """
+        stale_before = now - timedelta(seconds=Config.SMS_SENDING_TIMEOUT)
+        with db.engine.begin() as conn:
+            expired = conn.execute(
+                SmsOutbox.__table__.update()
+                .where(SmsOutbox.status == 'sending', SmsOutbox.updated_at < stale_before)
+                .values(status='unknown', last_error='领取后超时未完成，发送结果未知', updated_at=now)
+            ).rowcount
+        if expired:
+            logger.error('%s 条短信领取后超时未完成，发送结果未知，已标记为unknown', expired)
+            metrics.incr('sms_send_total', expired, status='unknown')
+        return expired
+
+    def purge_rate_limits(self, now):
+        """删除已超出所有限流窗口的计数"""
+        cutoff = int((now - datetime(1970, 1, 1)).total_seconds()) - Config.RATE_LIMIT_RETENTION_SECONDS
+        return self.delete_in_batches(RateLimitCounter.__table__, RateLimitCounter.bucket < cutoff)
+
+    def purge_recent_writes(self, now):
+        """删除已超出读写一致窗口的写入记录"""
+        cutoff = now - timedelta(seconds=Config.RECENT_WRITE_WINDOW)
+        return self.delete_in_batches(RecentWrite.__table__, RecentWrite.written_at < cutoff)
+
+    def archive_blessings(self, now):
+        """归档并删除超过保留期的祝福消息，返回(删除行数, 归档文件路径)
+
+        归档内容与数据库一致，手机号仍为密文。每批先写入归档文件并刷盘，再在同一事务中删除，
+        删除失败时该批可能在归档中重复出现，但不会丢失。
+        """
+        cutoff = now - timedelta(days=Config.BLESSING_RETENTION_DAYS)
+        deleted_cutoff = now - timedelta(days=Config.BLESSING_DELETED_RETENTION_DAYS)
+        condition = db.or_(
+            BlessingMessage.sent_at < cutoff,
+            db.and_(BlessingMessage.is_deleted == True, BlessingMessage.sent_at < deleted_cutoff)  # noqa: E712
+        )
+
+        table = BlessingMessage.__table__
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archive_path = os.path.join(self.archive_dir, f"blessing_messages-{now.strftime('%Y%m%d%H%M%S')}.jsonl.gz")
+        raw_file = open(archive_path, 'ab')
+        archive = gzip.GzipFile(fileobj=raw_file, mode='ab')
+
+        def archive_rows(conn, ids):
+            rows = conn.execute(db.select(table).where(table.c.id.in_(ids)).order_by(table.c.id)).mappings()
+            for row in rows:
+                archive.write(json_encoder.dumps(dict(row)) + b'\n')
+            archive.flush()
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+            # 短信队列中引用这些祝福的消息一并删除
+            conn.execute(SmsOutbox.__table__.delete().where(SmsOutbox.blessing_id.in_(ids)))
+
+        try:
+            removed = self.delete_in_batches(table, condition, before_delete=archive_rows)
+        finally:
+            archive.close()
+            raw_file.close()
+
+        if not removed:
+            os.remove(archive_path)
+            return 0, None
+        return removed, archive_path
+
+    def reclaim_space(self):
+        """归还空闲页并更新统计信息，返回回收的字节数
+
+        只有auto_vacuum为INCREMENTAL的SQLite数据库能在线回收，每次回收的页数同样按时间片调整；
+        其他情况只更新统计信息，需停服后执行一次 maintenance.py --enable-incremental-vacuum
+        """
+        if db.engine.dialect.name != 'sqlite':
+            # 服务器数据库由自身的autovacuum/purge回收空间，这里只更新统计信息
+            with db.engine.begin() as conn:
+                analyze_tables(conn, [model.__table__.name for model in
+                                      (SmsVerification, SmsOutbox, RateLimitCounter, BlessingMessage)])
+            return 0
+
+        with db.engine.connect() as conn:
+            page_size = conn.exec_driver_sql('PRAGMA page_size').scalar()
+            page_count_before = conn.exec_driver_sql('PRAGMA page_count').scalar()
+            auto_vacuum = conn.exec_driver_sql('PRAGMA auto_vacuum').scalar()
+
+        if auto_vacuum == 2:
+            pages = 1000
+            while True:
+                with db.engine.connect() as conn:
+                    if not conn.exec_driver_sql('PRAGMA freelist_count').scalar():
+                        break
+                started = time.perf_counter()
+                raw_conn = db.engine.raw_connection()
+                try:
+                    # sqlite3模块的execute只执行一步（只回收一页），executescript会执行完整条语句
+                    raw_conn.driver_connection.executescript(f'PRAGMA incremental_vacuum({pages});')
+                finally:
+                    raw_conn.close()
+                pages = self._next_batch_size(pages, time.perf_counter() - started)
+                time.sleep(self.pause)
+        else:
+            logger.warning('数据库未启用incremental auto_vacuum，空闲页不会归还给文件系统，'
+                           '可停服后执行 python maintenance.py --enable-incremental-vacuum')
+
+        self.analyze_sqlite()
+        with db.engine.connect() as conn:
+            page_count_after = conn.exec_driver_sql('PRAGMA page_count').scalar()
+        return (page_count_before - page_count_after) * page_size
+
+    def analyze_sqlite(self):
+        """逐表更新SQLite统计信息，每张表单独一个事务，表与表之间暂停
+
+        PRAGMA analysis_limit 让ANALYZE每个索引只抽样有限的行，单张表的耗时与表大小无关，
+        不会长时间持有写锁；最后的PRAGMA optimize在同样的限制下执行
+        """
+        with db.engine.connect() as conn:
+            tables = db.inspect(conn).get_table_names()
+        for table in tables + [None]:
+            started = time.perf_counter()
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql(f'PRAGMA analysis_limit={Config.MAINTENANCE_ANALYSIS_LIMIT}')
+                if table:
+                    conn.exec_driver_sql(f'ANALYZE "{table}"')
+                else:
+                    conn.exec_driver_sql('PRAGMA optimize')
+            elapsed = time.perf_counter() - started
+            if elapsed > self.lock_slice:
+                logger.warning('更新统计信息 %s 耗时%.3fs，超过时间片，可调小MAINTENANCE_ANALYSIS_LIMIT',
+                               table or 'PRAGMA optimize', elapsed)
+            time.sleep(self.pause)
+
+    def run(self):
+        """执行一次完整清理，返回清理报告；其他进程正在清理时返回None"""
+        os.makedirs(os.path.dirname(Config.MAINTENANCE_LOCK_PATH) or '.', exist_ok=True)
+        with open(Config.MAINTENANCE_LOCK_PATH, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info('其他进程正在执行数据清理，跳过本次')
+                return None
+            try:
+                return self._run()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run(self):
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        report = {
+            'sms_verifications': self.purge_verifications(now),
+            'sms_sending_expired': self.expire_sending_sms(now),
+            'sms_outbox': self.purge_outbox(now),
+            'rate_limit_counters': self.purge_rate_limits(now),
+            'recent_writes': self.purge_recent_writes(now),
+        }
+        report['blessing_messages'], report['archive_file'] = self.archive_blessings(now)
+        report['bytes_reclaimed'] = self.reclaim_space()
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        metrics.incr('maintenance_bytes_reclaimed', report['bytes_reclaimed'])
+        logger.info('数据清理完成: %s', report)
+        return report
+
+
+def analyze_tables(conn, tables=None):
+    """更新查询优化器的统计信息，tables为空时更新全部表"""
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        tables = tables or db.inspect(conn).get_table_names()
+        conn.exec_driver_sql('ANALYZE TABLE ' + ', '.join(tables))
+    elif tables:
+        for table in tables:
+            conn.exec_driver_sql(f'ANALYZE {table}')
+    else:
+        conn.exec_driver_sql('ANALYZE')
+
+
+def enable_incremental_vacuum():
+    """将SQLite数据库切换为incremental auto_vacuum模式
+
+    需要执行一次完整VACUUM重写整个数据库文件，期间阻塞所有写入，应在停服时执行
+    """
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.exec_driver_sql('VACUUM')
+        return conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2
+
+
+class MaintenanceThread(threading.Thread):
+    """后台定时清理线程，每隔interval秒执行一次"""
+
+    def __init__(self, app, interval, runner=None):
+        super().__init__(name='maintenance', daemon=True)
+        self.app = app
+        self.interval = interval
+        self.runner = runner or MaintenanceRunner()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.runner.run()
+            except Exception:
+                logger.exception('数据清理失败')
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,66 @@
+import bisect
+import os
+import threading
+from collections import defaultdict
+
+# 耗时直方图的桶上限（秒），与Prometheus客户端的默认值相同
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """进程内指标收集器
+
+    - incr: 计数器，如错误次数
+    - observe: 耗时统计，记录次数、总耗时、最大耗时和直方图各桶的次数
+    指标以(名称, 标签)为键，标签为关键字参数。
+    fork出的子进程（如gunicorn preload_app时的worker）从零开始统计，不继承父进程的指标
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.timings = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def incr(self, name, value=1, **labels):
+        """计数器加value"""
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, seconds, **labels):
+        """记录一次耗时（秒）"""
+        key = self._key(name, labels)
+        # 第一个上限不小于seconds的桶，超过最大上限的记在最后一个（+Inf）桶
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = [0, 0.0, 0.0, [0] * (len(self.buckets) + 1)]
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            timing[3][index] += 1
+
+    def snapshot(self):
+        """返回当前指标的副本
+
+        timings的值为[次数, 总耗时, 最大耗时, 各桶次数]，各桶次数不累加，最后一个为+Inf桶
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': {key: [value[0], value[1], value[2], list(value[3])] for key, value in self.timings.items()}
+            }
+
+
+# 初始化指标收集实例
+metrics = Metrics()
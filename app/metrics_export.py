@@ -0,0 +1,281 @@
+import atexit
+import json
+import os
+import threading
+import time
+import logging
+from collections import defaultdict
+from flask import g, request
+from app.config import Config
+from app.metrics import metrics
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 指标名称前缀
+METRIC_PREFIX = 'beslove_'
+# Prometheus文本格式
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 已退出进程的指标合并到这个文件
+EXITED_FILE = 'metrics-exited.json'
+# 汇总文件中保留最近合并的进程文件名的个数，读取方据此跳过已合并、尚未删除的进程文件
+MERGED_NAMES_KEPT = 100
+
+
+def _encode_snapshot(snapshot, buckets):
+    """指标的键为元组，转为可以写入JSON的列表"""
+    return {
+        'buckets': list(buckets),
+        'counters': [[name, labels, value] for (name, labels), value in snapshot['counters'].items()],
+        'timings': [[name, labels, value] for (name, labels), value in snapshot['timings'].items()],
+    }
+
+
+def _merge(merged, data, buckets):
+    """把一个进程的指标累加到merged中"""
+    for name, labels, value in data['counters']:
+        merged['counters'][(name, tuple(map(tuple, labels)))] += value
+    if list(data['buckets']) != list(buckets):
+        logger.warning('指标文件的直方图桶与当前进程不一致，跳过耗时统计')
+        return
+    for name, labels, (count, total, maximum, counts) in data['timings']:
+        key = (name, tuple(map(tuple, labels)))
+        timing = merged['timings'].get(key)
+        if timing is None:
+            merged['timings'][key] = [count, total, maximum, list(counts)]
+        else:
+            timing[0] += count
+            timing[1] += total
+            timing[2] = max(timing[2], maximum)
+            timing[3] = [a + b for a, b in zip(timing[3], counts)]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _sort_key(item):
+    # 标签值可能是数字或字符串，按输出的文本排序
+    return _format_labels(item[0])
+
+
+def render_prometheus(merged, buckets):
+    """生成Prometheus文本格式：计数器名称以_total结尾，耗时为直方图"""
+    lines = []
+    counters = defaultdict(list)
+    for (name, labels), value in merged['counters'].items():
+        counters[name].append((labels, value))
+    for name in sorted(counters):
+        metric = METRIC_PREFIX + name + ('' if name.endswith('_total') else '_total')
+        lines.append(f'# TYPE {metric} counter')
+        for labels, value in sorted(counters[name], key=_sort_key):
+            lines.append(f'{metric}{_format_labels(labels)} {_format_value(value)}')
+
+    timings = defaultdict(list)
+    for (name, labels), value in merged['timings'].items():
+        timings[name].append((labels, value))
+    bounds = [f'{bound:g}' for bound in buckets] + ['+Inf']
+    for name in sorted(timings):
+        metric = METRIC_PREFIX + name
+        lines.append(f'# TYPE {metric} histogram')
+        for labels, (count, total, _, counts) in sorted(timings[name], key=_sort_key):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{metric}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{metric}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """多进程指标汇总
+
+    每个进程（gunicorn worker、短信worker、异步服务）由后台线程每隔interval秒把本进程的指标
+    写入 directory/metrics-<pid>-<启动时间>.json，PID被新进程复用时不会覆盖旧进程的文件；
+    /metrics 接口读取所有进程的文件，用本进程的实时指标代替本进程的文件，累加后输出。
+    gunicorn worker退出后由master把它的文件合并到 metrics-exited.json 并删除，计数器不会因为
+    worker重启而减少，文件数也不会随重启增长；gunicorn master启动时清空目录
+    """
+
+    def __init__(self, metrics, directory, interval):
+        self.metrics = metrics
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._process_key = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.flush_at_exit)
+
+    @property
+    def path(self):
+        """本进程的指标文件，以PID加本进程首次使用的时间（毫秒）命名"""
+        pid = os.getpid()
+        if self._process_key is None or self._process_key[0] != pid:
+            with self._start_lock:
+                if self._process_key is None or self._process_key[0] != pid:
+                    self._process_key = (pid, int(time.time() * 1000))
+        return os.path.join(self.directory, f'metrics-{pid}-{self._process_key[1]}.json')
+
+    def start(self):
+        """启动本进程的后台写入线程，已启动时不做任何事；fork出的子进程需要再次调用"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run, name='metrics-exporter', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def _write(self, path, data):
+        """先写临时文件再替换，读取方不会读到写了一半的文件；返回是否写入成功"""
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logger.warning('写入指标文件失败: %s', e)
+            return False
+
+    def _read(self, name):
+        """读取目录下的一个指标文件，不存在或读取失败时返回None"""
+        try:
+            with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # 列出目录后文件已被合并删除
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning('读取指标文件失败: %s, %s', name, e)
+            return None
+
+    def flush(self):
+        """把本进程的指标写入文件"""
+        self._write(self.path, _encode_snapshot(self.metrics.snapshot(), self.metrics.buckets))
+
+    def flush_at_exit(self):
+        if self._pid == os.getpid():
+            self.flush()
+
+    def clear(self):
+        """删除所有进程的指标文件"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith('metrics-'):
+                os.remove(os.path.join(self.directory, name))
+
+    def _process_files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory)
+                if name.startswith('metrics-') and name.endswith('.json') and name != EXITED_FILE]
+
+    def merge_exited(self, pid):
+        """把已退出进程的指标文件合并到 metrics-exited.json 后删除，由gunicorn master在worker退出后调用
+
+        先替换汇总文件再删除进程文件，汇总文件中记录合并过的文件名，读取方跳过这些文件，不会重复计算
+        """
+        prefix = f'metrics-{pid}-'
+        names = [name for name in self._process_files() if name.startswith(prefix)]
+        if not names:
+            return
+        merged = {'counters': defaultdict(float), 'timings': {}}
+        exited = self._read(EXITED_FILE) or {'buckets': list(self.metrics.buckets), 'counters': [], 'timings': []}
+        _merge(merged, exited, self.metrics.buckets)
+        for name in names:
+            data = self._read(name)
+            if data is not None:
+                _merge(merged, data, self.metrics.buckets)
+        data = _encode_snapshot(merged, self.metrics.buckets)
+        data['merged'] = (exited.get('merged', []) + names)[-MERGED_NAMES_KEPT:]
+        if not self._write(os.path.join(self.directory, EXITED_FILE), data):
+            return
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                logger.warning('删除指标文件失败: %s, %s', name, e)
+
+    def collect(self):
+        """汇总所有进程的指标，返回(汇总的指标, 进程数)"""
+        merged = {'counters': defaultdict(float), 'timings': {}}
+        own = os.path.basename(self.path)
+        files = {}
+        for name in self._process_files():
+            if name != own:
+                data = self._read(name)
+                if data is not None:
+                    files[name] = data
+        # 汇总文件最后读取：进程文件在读取之后才被合并时，汇总文件中已记录其文件名
+        exited = self._read(EXITED_FILE)
+        if exited is not None:
+            _merge(merged, exited, self.metrics.buckets)
+            for name in exited.get('merged', []):
+                files.pop(name, None)
+        for data in files.values():
+            _merge(merged, data, self.metrics.buckets)
+        _merge(merged, _encode_snapshot(self.metrics.snapshot(), self.metrics.buckets), self.metrics.buckets)
+        return merged, len(files) + 1
+
+    def render(self):
+        """所有进程汇总后的Prometheus文本"""
+        merged, processes = self.collect()
+        body = render_prometheus(merged, self.metrics.buckets)
+        return body + f'# TYPE {METRIC_PREFIX}metrics_processes gauge\n{METRIC_PREFIX}metrics_processes {processes}\n'
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+
+
+def _after_request(response):
+    # g和request每次访问都要查找当前上下文，这里各取一次
+    state = g._get_current_object()
+    started = state.pop('request_started', None)
+    if started is None:
+        return response
+    current = request._get_current_object()
+    # 使用路由模板（如 /api/blessing/received）作为标签，未匹配的路径统一记为unmatched
+    route = current.url_rule.rule if current.url_rule is not None else 'unmatched'
+    method = current.method
+    metrics.observe('http_request_seconds', time.perf_counter() - started, route=route, method=method)
+    metrics.incr('http_requests', route=route, method=method,
+                 status=response.status_code, code=state.get('response_code', ''))
+    sql_queries = state.get('sql_queries')
+    if sql_queries:
+        metrics.incr('http_request_sql_queries', sql_queries, route=route)
+        metrics.incr('http_request_sql_seconds', state.sql_seconds, route=route)
+    metrics_exporter.start()
+    return response
+
+
+def init_request_metrics(app):
+    """统计每个接口的请求数（按HTTP状态码和业务错误码）、耗时直方图和SQL条数、耗时"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    metrics_exporter.start()
+
+
+# 初始化指标汇总实例
+metrics_exporter = MetricsExporter(metrics, Config.METRICS_DIR, Config.METRICS_FLUSH_INTERVAL)
@@ -1,4 +1,4 @@
-from app.app import db
+from app.extensions import db
 from datetime import datetime, timedelta
 
 class User(db.Model):
@@ -6,6 +6,7 @@ class User(db.Model):
     
     openid = db.Column(db.String(100), primary_key=True, unique=True, nullable=False)
     phone_number = db.Column(db.String(200), nullable=False)  # 加密存储的手机号
+    phone_hash = db.Column(db.String(64), nullable=True, index=True)  # 手机号盲索引，用于查询
     nick_name = db.Column(db.String(50), nullable=True)  # 用户微信昵称
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
@@ -14,10 +15,18 @@ class User(db.Model):
 
 class BlessingMessage(db.Model):
     __tablename__ = 'blessing_messages'
+    __table_args__ = (
+        # 收到的祝福：按接收者过滤，按发送时间倒序
+        db.Index('ix_blessing_receiver_hash_sent_at', 'receiver_phone_hash', 'sent_at'),
+        # 已发送祝福：按发送者和删除标记过滤，按发送时间倒序
+        # 发送限制由限流计数器（RateLimitCounter）统计，不需要按发送者和时间的索引
+        db.Index('ix_blessing_sender_deleted_sent_at', 'sender_openid', 'is_deleted', 'sent_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     sender_openid = db.Column(db.String(100), db.ForeignKey('users.openid'), nullable=False)
     receiver_phone = db.Column(db.String(200), nullable=False)  # 加密存储的手机号
+    receiver_phone_hash = db.Column(db.String(64), nullable=True)  # 接收者手机号盲索引，用于查询
     content = db.Column(db.String(100), nullable=False)  # 祝福内容，最多80个字符
     sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
@@ -31,9 +40,16 @@ class BlessingMessage(db.Model):
 
 class SmsVerification(db.Model):
     __tablename__ = 'sms_verifications'
+    __table_args__ = (
+        # 发送验证码时查找未使用且未过期的旧验证码
+        db.Index('ix_sms_phone_hash_used_expires_at', 'phone_hash', 'used', 'expires_at'),
+        # 校验验证码时按手机号和验证码查找最新一条
+        db.Index('ix_sms_phone_hash_code_created_at', 'phone_hash', 'verification_code', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     phone_number = db.Column(db.String(200), nullable=False)  # 加密存储的手机号
+    phone_hash = db.Column(db.String(64), nullable=True)  # 手机号盲索引，用于查询
     verification_code = db.Column(db.String(10), nullable=False)  # 验证码
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # 创建时间
     expires_at = db.Column(db.DateTime, nullable=False)  # 过期时间
@@ -51,3 +67,56 @@ class SmsVerification(db.Model):
     def is_valid(self):
         """检查验证码是否有效"""
         return not self.used and datetime.utcnow() < self.expires_at
+
+
+class SmsOutbox(db.Model):
+    """短信发送队列（发件箱），由sms_worker.py异步发送"""
+    __tablename__ = 'sms_outbox'
+    __table_args__ = (
+        # worker按状态和下次发送时间取待发送消息
+        db.Index('ix_sms_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+        db.Index('ix_sms_outbox_claimed_by', 'claimed_by'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    phone_number = db.Column(db.String(200), nullable=False)  # 加密存储的手机号
+    template_code = db.Column(db.String(50), nullable=True)  # 短信模板代码，为空时使用默认模板
+    blessing_id = db.Column(db.Integer, db.ForeignKey('blessing_messages.id'), nullable=True)  # 对应的祝福消息
+    content = db.Column(db.String(100), nullable=False)  # 模板参数content
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed, unknown（已调用但结果未知，不重发）
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # 已尝试发送次数
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # 下次可发送时间
+    claimed_by = db.Column(db.String(36), nullable=True)  # 领取该消息的worker批次
+    last_error = db.Column(db.String(200), nullable=True)  # 最近一次失败原因
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SmsOutbox {self.id} {self.status}>'
+
+
+class RecentWrite(db.Model):
+    """用户最近一次写入时间，读写一致窗口内该用户的只读请求读主库"""
+    __tablename__ = 'recent_writes'
+    
+    key = db.Column(db.String(120), primary_key=True)  # 用户标识，如openid
+    written_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RecentWrite {self.key} {self.written_at}>'
+
+
+class RateLimitCounter(db.Model):
+    """限流计数器，按(限流键, 时间桶)计数，多个worker共享"""
+    __tablename__ = 'rate_limit_counters'
+    __table_args__ = (
+        # 清理过期计数
+        db.Index('ix_rate_limit_counters_bucket', 'bucket'),
+    )
+    
+    key = db.Column(db.String(120), primary_key=True)  # 限流键，如 blessing:sender:<openid>
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 时间桶起始时间（Unix秒）
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<RateLimitCounter {self.key} {self.bucket} {self.count}>'
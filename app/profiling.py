@@ -0,0 +1,374 @@
+import cProfile
+import gzip
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from app.config import Config
+from app.logging_config import mask_pii
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 触发性能分析的请求头，值为PROFILING_TOKEN
+PROFILE_HEADER = 'X-Profile'
+# 调用树的最大深度和节点数
+MAX_DEPTH = 60
+MAX_NODES = 2000
+# 记录的SQL语句最大长度（不记录参数，避免记录手机号等数据）
+MAX_STATEMENT_LENGTH = 500
+
+
+def _node(function, file, line):
+    return {'function': function, 'file': file, 'line': line, 'seconds': 0.0, 'children': {}}
+
+
+def finish_tree(node):
+    """子节点按耗时排序并转为列表，便于写入JSON"""
+    children = sorted(node['children'].values(), key=lambda child: child['seconds'], reverse=True)
+    node['children'] = [finish_tree(child) for child in children]
+    return node
+
+
+class StackSampler:
+    """统计采样：后台线程每隔interval秒记录被观察线程的调用栈，累加为调用树
+
+    开销只与采样次数有关，与请求中的函数调用次数无关，可以对所有请求开启，只保存慢请求的结果。
+    只能观察操作系统线程，gevent模式下不可用
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # fork出的子进程没有采样线程，也不继承父进程的锁和观察中的线程
+        self._lock = threading.Lock()
+        self._watched = {}  # 线程id -> 调用树根节点
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def start(self):
+        """启动本进程的采样线程，fork出的子进程需要再次调用"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+            self._pid = os.getpid()
+
+    def watch(self, thread_id):
+        """开始记录线程的调用栈"""
+        self.start()
+        with self._lock:
+            self._watched[thread_id] = _node('root', '', 0)
+        self._wakeup.set()
+
+    def unwatch(self, thread_id):
+        """停止记录，返回调用树的根节点（未被观察时返回None），保存前需用finish_tree整理"""
+        with self._lock:
+            return self._watched.pop(thread_id, None)
+
+    def _run(self):
+        last = time.perf_counter()
+        while True:
+            if not self._watched:
+                # 没有被观察的请求时不采样
+                self._wakeup.wait()
+                self._wakeup.clear()
+                last = time.perf_counter()
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, root in self._watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self._add_stack(root, frame, elapsed)
+
+    @staticmethod
+    def _add_stack(root, frame, seconds):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        # 从Flask处理请求的入口开始，省略线程和gunicorn的调用栈
+        for index, code in enumerate(stack):
+            if code.co_name == 'full_dispatch_request':
+                stack = stack[index:]
+                break
+        node = root
+        node['seconds'] += seconds
+        for code in stack[:MAX_DEPTH]:
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            child = node['children'].get(key)
+            if child is None:
+                child = node['children'][key] = _node(*key)
+            child['seconds'] += seconds
+            node = child
+
+
+def cprofile_tree(profile, min_fraction=0.005):
+    """由cProfile的调用关系生成调用树
+
+    cProfile只记录 调用者->被调用者 的累计耗时，同一函数被多处调用时按调用者分别统计，
+    子节点耗时为该调用者调用它的总耗时；忽略占比低于min_fraction的分支
+    """
+    stats = pstats.Stats(profile).stats
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, value in callers.items():
+            callees[caller][func] = value[3]
+    roots = [func for func, value in stats.items() if not value[4]]
+    total = sum(stats[func][3] for func in roots)
+    min_seconds = total * min_fraction
+    count = 0
+
+    def build(func, seconds, path):
+        nonlocal count
+        count += 1
+        node = {'function': func[2], 'file': func[0], 'line': func[1], 'seconds': seconds, 'children': []}
+        if func in path or len(path) >= MAX_DEPTH:
+            return node
+        for child, child_seconds in sorted(callees[func].items(), key=lambda item: item[1], reverse=True):
+            if child_seconds < min_seconds or count >= MAX_NODES:
+                break
+            node['children'].append(build(child, child_seconds, path | {func}))
+        return node
+
+    children = [build(func, stats[func][3], frozenset()) for func in sorted(roots, key=lambda f: stats[f][3], reverse=True)]
+    return {'function': 'root', 'file': '', 'line': 0, 'seconds': total, 'children': children}
+
+
+def cprofile_functions(profile, limit=30):
+    """自身耗时最多的函数"""
+    stats = pstats.Stats(profile).stats
+    top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [{'function': func[2], 'file': func[0], 'line': func[1], 'calls': value[1],
+             'self_seconds': value[2], 'cumulative_seconds': value[3]} for func, value in top]
+
+
+class ProfileStore:
+    """磁盘上的环形缓冲区：每次分析结果保存为一个gzip压缩的JSON文件，超过max_captures个时删除最旧的
+
+    文件名以时间开头，按文件名排序即按时间排序；多个进程写入同一目录
+    """
+
+    def __init__(self, directory, max_captures):
+        self.directory = directory
+        self.max_captures = max_captures
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _path(self, capture_id):
+        return os.path.join(self.directory, f'{capture_id}.json.gz')
+
+    def ids(self):
+        """所有分析结果的id，从旧到新"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len('.json.gz')] for name in os.listdir(self.directory) if name.endswith('.json.gz'))
+
+    def save(self, capture):
+        """保存分析结果，返回id"""
+        with self._lock:
+            self._seq += 1
+            capture_id = f'{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{self._seq:04d}'
+        capture['id'] = capture_id
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(capture_id)
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            json.dump(capture, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        for old_id in self.ids()[:-self.max_captures]:
+            try:
+                os.remove(self._path(old_id))
+            except OSError:
+                pass  # 其他进程已删除
+        return capture_id
+
+    def load(self, capture_id):
+        """按id（或id的唯一前缀/后缀）读取分析结果，找不到时返回None"""
+        ids = self.ids()
+        matches = [capture_id] if capture_id in ids else [i for i in ids if i.startswith(capture_id) or i.endswith(capture_id)]
+        if len(matches) != 1:
+            return None
+        try:
+            with gzip.open(self._path(matches[0]), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None  # 列出id之后被其他进程轮转删除
+
+    def clear(self):
+        """删除所有分析结果，返回删除的个数"""
+        removed = 0
+        for capture_id in self.ids():
+            try:
+                os.remove(self._path(capture_id))
+                removed += 1
+            except FileNotFoundError:
+                pass  # 其他进程已删除
+        return removed
+
+
+class RequestProfiler:
+    """请求性能分析
+
+    - 请求头 X-Profile 等于 token，或按 sample_rate 随机抽中的请求：用cProfile记录完整调用关系，总是保存
+    - 其余请求在 slow_threshold 大于0时由StackSampler采样，耗时超过阈值才保存
+    两种方式都记录请求中执行的SQL语句和耗时。保存后在响应头 X-Profile-Id 中返回id
+    """
+
+    def __init__(self, store, sampler, token=None, sample_rate=0.0, slow_threshold=0.0):
+        self.store = store
+        self.sampler = sampler
+        self.token = token
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+
+    def _trigger(self):
+        if self.token:
+            value = request.headers.get(PROFILE_HEADER)
+            if value and hmac.compare_digest(value.encode('utf-8'), self.token.encode('utf-8')):
+                return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def before_request(self):
+        state = g._get_current_object()
+        state.profile_started = time.perf_counter()
+        state.profile_sql = []
+        trigger = self._trigger()
+        if trigger:
+            state.profile_trigger = trigger
+            state.profiler = cProfile.Profile()
+            state.profiler.enable()
+        elif self.slow_threshold and self.sampler is not None:
+            state.profile_trigger = 'slow'
+            self.sampler.watch(threading.get_ident())
+
+    def after_request(self, response):
+        state = g._get_current_object()
+        trigger = state.pop('profile_trigger', None)
+        if trigger is None:
+            return response
+        duration = time.perf_counter() - state.profile_started
+        profiler = state.pop('profiler', None)
+        functions = None
+        if profiler is not None:
+            profiler.disable()
+            tree = cprofile_tree(profiler)
+            functions = cprofile_functions(profiler)
+        else:
+            tree = self.sampler.unwatch(threading.get_ident())
+            if duration < self.slow_threshold or tree is None:
+                return response
+            tree = finish_tree(tree)
+
+        sql = state.pop('profile_sql', [])
+        capture = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'path': request.path,
+            'query': mask_pii(request.query_string.decode('utf-8', 'replace')),
+            'route': request.url_rule.rule if request.url_rule is not None else None,
+            'status': response.status_code,
+            'code': state.get('response_code'),
+            'seconds': duration,
+            'trigger': trigger,
+            'mode': 'cprofile' if profiler is not None else 'sampling',
+            'process': os.getpid(),
+            'sql': sql,
+            'tree': tree,
+            'functions': functions,
+        }
+        try:
+            capture_id = self.store.save(capture)
+        except OSError as e:
+            logger.warning('保存性能分析结果失败: %s', e)
+            return response
+        response.headers['X-Profile-Id'] = capture_id
+        if trigger == 'slow':
+            logger.warning('慢请求: %s %s 耗时%.3fs，SQL %s条，性能分析: %s',
+                           request.method, request.path, duration, len(sql), capture_id)
+        return response
+
+    def teardown_request(self, exc):
+        """请求异常结束、未执行after_request时停止分析"""
+        state = g._get_current_object()
+        if state.pop('profile_trigger', None) is None:
+            return
+        profiler = state.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        elif self.sampler is not None:
+            self.sampler.unwatch(threading.get_ident())
+
+
+def _record_sql(engine):
+    """被分析的请求中执行的SQL语句和耗时"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+        if has_request_context():
+            sql = g.get('profile_sql')
+            if sql is not None:
+                sql.append({'statement': statement[:MAX_STATEMENT_LENGTH], 'seconds': elapsed})
+
+
+def _gevent_patched():
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('threading')
+
+
+def init_profiling(app):
+    """按配置注册请求性能分析；PROFILING_ENABLED为false时不注册任何钩子，没有额外开销"""
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    from app.extensions import db
+
+    slow_threshold = app.config['PROFILING_SLOW_THRESHOLD']
+    sampler = None
+    if slow_threshold:
+        if _gevent_patched():
+            logger.warning('gevent模式下无法按线程采样，慢请求性能分析不可用')
+            slow_threshold = 0
+        else:
+            sampler = StackSampler(app.config['PROFILING_SAMPLE_INTERVAL'])
+    profiler = RequestProfiler(
+        ProfileStore(app.config['PROFILING_DIR'], app.config['PROFILING_MAX_CAPTURES']),
+        sampler,
+        token=app.config['PROFILING_TOKEN'],
+        sample_rate=app.config['PROFILING_SAMPLE_RATE'],
+        slow_threshold=slow_threshold,
+    )
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.teardown_request(profiler.teardown_request)
+    with app.app_context():
+        for engine in db.engines.values():
+            _record_sql(engine)
+    logger.info('请求性能分析已开启，慢请求阈值: %ss，抽样比例: %s，结果目录: %s',
+                slow_threshold, app.config['PROFILING_SAMPLE_RATE'], app.config['PROFILING_DIR'])
+
+
+# 分析结果的存储，命令行工具（profiles.py）使用
+profile_store = ProfileStore(Config.PROFILING_DIR, Config.PROFILING_MAX_CAPTURES)
@@ -0,0 +1,101 @@
+import time
+from collections import namedtuple
+from flask import current_app
+from app.extensions import db
+from app.db_routing import upsert_statement
+from app.models import RateLimitCounter
+
+# 限流规则：key 限流键，limit 窗口内最多次数，window 窗口长度（秒），bucket 时间桶长度（秒），
+# name 规则名称，用于日志和指标
+RateLimitRule = namedtuple('RateLimitRule', ['key', 'limit', 'window', 'bucket', 'name'], defaults=[None])
+
+
+class RateLimiter:
+    """基于数据库的滑动窗口限流
+
+    - 窗口被切分为固定长度的时间桶，每个(限流键, 时间桶)一行计数，
+      统计窗口内次数只需汇总少量计数行，不需要扫描业务表
+    - 窗口起点所在的时间桶整体计入，宁可多算不少算，最多多限制一个时间桶的长度
+    - hit先只读预检，已超限的请求直接拒绝，不写入也不占用写锁；
+      通过预检的再自增后检查，自增会加写锁，多个gunicorn worker并发时检查和计数是原子的
+    """
+
+    @staticmethod
+    def _bucket_start(timestamp, bucket):
+        return int(timestamp // bucket) * bucket
+
+    def _increment(self, key, bucket_start):
+        """计数加一（不存在则插入），按数据库类型使用对应的upsert语法"""
+        table = RateLimitCounter.__table__
+        db.session.execute(upsert_statement(
+            table, {'key': key, 'bucket': bucket_start, 'count': 1},
+            [table.c.key, table.c.bucket], {'count': table.c.count + 1}
+        ))
+
+    def _count(self, rule, now):
+        """统计窗口内的次数"""
+        window_start = self._bucket_start(now - rule.window, rule.bucket)
+        total = db.session.query(db.func.coalesce(db.func.sum(RateLimitCounter.count), 0))\
+            .filter(RateLimitCounter.key == rule.key, RateLimitCounter.bucket >= window_start)\
+            .scalar()
+        return int(total)
+
+    def peek(self, rules, now=None):
+        """只查询不计数，返回每条规则窗口内已有的次数"""
+        now = now if now is not None else time.time()
+        return [self._count(rule, now) for rule in rules]
+
+    def hit(self, rules, now=None):
+        """原子地检查并计数，所有规则都未超限时才计入
+
+        返回(是否允许, 每条规则计入本次前的次数)。
+        允许时计数只写入当前会话，由调用方与业务数据一起提交；拒绝时回滚。
+        调用前当前会话不应有未提交的读写，保证自增是事务中的第一条语句。
+        """
+        now = now if now is not None else time.time()
+        # 只读预检：已超限时直接拒绝；随后结束读事务，保证自增仍是写事务中的第一条语句
+        counts = self.peek(rules, now)
+        db.session.rollback()
+        if any(count >= rule.limit for count, rule in zip(counts, rules)):
+            return False, counts
+
+        for rule in rules:
+            self._increment(rule.key, self._bucket_start(now, rule.bucket))
+        counts = [self._count(rule, now) - 1 for rule in rules]
+
+        allowed = all(count < rule.limit for count, rule in zip(counts, rules))
+        if not allowed:
+            db.session.rollback()
+        return allowed, counts
+
+
+def exceeded_rules(rules, counts):
+    """返回已超限的规则名称列表"""
+    return [rule.name or rule.key for rule, count in zip(rules, counts) if count >= rule.limit]
+
+
+def blessing_rules(sender_openid, receiver_phone_hash):
+    """祝福发送的限流规则：发送者和接收者24小时内的次数"""
+    config = current_app.config
+    return [
+        RateLimitRule(f'blessing:sender:{sender_openid}', config['SENDER_DAILY_LIMIT'],
+                      86400, config['RATE_LIMIT_BUCKET_SECONDS'], 'blessing_sender'),
+        RateLimitRule(f'blessing:receiver:{receiver_phone_hash}', config['RECEIVER_DAILY_LIMIT'],
+                      86400, config['RATE_LIMIT_BUCKET_SECONDS'], 'blessing_receiver'),
+    ]
+
+
+def sms_code_rules(phone_hash, client_ip):
+    """发送验证码的限流规则：同一手机号的重发冷却、每小时和每天次数，同一IP的每小时和每天次数"""
+    config = current_app.config
+    return [
+        RateLimitRule(f'sms:cooldown:{phone_hash}', 1, config['SMS_RESEND_COOLDOWN'], 5, 'sms_cooldown'),
+        RateLimitRule(f'sms:phone:hour:{phone_hash}', config['SMS_PHONE_HOURLY_LIMIT'], 3600, 60, 'sms_phone_hourly'),
+        RateLimitRule(f'sms:phone:day:{phone_hash}', config['SMS_PHONE_DAILY_LIMIT'], 86400, 600, 'sms_phone_daily'),
+        RateLimitRule(f'sms:ip:hour:{client_ip}', config['SMS_IP_HOURLY_LIMIT'], 3600, 60, 'sms_ip_hourly'),
+        RateLimitRule(f'sms:ip:day:{client_ip}', config['SMS_IP_DAILY_LIMIT'], 86400, 600, 'sms_ip_daily'),
+    ]
+
+
+# 初始化限流实例
+rate_limiter = RateLimiter()
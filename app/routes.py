@@ -1,58 +1,96 @@
-from flask import request, jsonify, make_response
-import json
-import requests
-from app.app import app, db
-from app.config import Config
+from flask import Blueprint, request, jsonify, make_response, abort, current_app
+from app.extensions import db
 from app.models import User, BlessingMessage
-from app.utils import CryptoUtil, validate_phone
+from app.utils import CryptoUtil, validate_phone, encode_cursor, decode_cursor, sensitive_filter
+from app.metrics import metrics
+from app.metrics_export import metrics_exporter, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.ratelimit import rate_limiter, blessing_rules, sms_code_rules, exceeded_rules
+from app.db_routing import read_only, mark_recent_write
+from app.responses import json_response, handle_exception
 import logging
 
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
 # 创建加密工具实例
 crypto_util = CryptoUtil()
 
 # 导入其他需要的模块
+import hmac
 import random
 import string
-from app.sms import sms_client
+from datetime import datetime
+from app.sms_queue import enqueue_sms
+from app.blessing_templates import blessing_templates
+from app.wechat import wx_client, token_manager, WeChatTokenError, TOKEN_INVALID_ERRCODES
 from app.models import SmsVerification
 
+# 接口蓝图，由create_app注册
+bp = Blueprint('api', __name__)
+# 接口中未捕获的异常统一返回JSON格式的服务器内部错误
+bp.register_error_handler(Exception, handle_exception)
+
+def get_client_ip():
+    """获取客户端IP，经过Nginx代理时取X-Real-IP"""
+    return request.headers.get('X-Real-IP') or request.remote_addr or 'unknown'
+
+def parse_page_args():
+    """解析分页参数cursor和limit，参数无效时抛出ValueError"""
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
+    # 不使用get(type=int)：格式错误时它会静默返回默认值
+    limit = int(limit) if limit is not None else current_app.config['PAGE_DEFAULT_LIMIT']
+    if limit <= 0:
+        raise ValueError('limit必须为正整数')
+    limit = min(limit, current_app.config['PAGE_MAX_LIMIT'])
+    return (decode_cursor(cursor) if cursor else None), limit
+
+def paginate_blessings(query, cursor, limit):
+    """按(sent_at, id)倒序做游标分页，返回(当前页记录, 下一页游标)
+    
+    使用游标而不是OFFSET，翻到多深每页的查询代价都相同
+    """
+    if cursor:
+        query = query.filter(db.tuple_(BlessingMessage.sent_at, BlessingMessage.id) < cursor)
+    rows = query.order_by(BlessingMessage.sent_at.desc(), BlessingMessage.id.desc())\
+        .limit(limit + 1).all()
+    
+    # 多取一条用于判断是否还有下一页
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sent_at, rows[-1].id)
+    return rows, next_cursor
+
 # 测试接口
-@app.route('/api/test', methods=['GET'])
+@bp.route('/api/test', methods=['GET'])
 def test():
     return jsonify({'message': 'Hello, World!'})
 
 # 获取openid接口
-@app.route('/api/wx/get_openid', methods=['GET'])
+@bp.route('/api/wx/get_openid', methods=['GET'])
 def wx_get_openid():
     """获取微信用户openid接口"""
     try:
         code = request.args.get('code')
         
         if not code:
-            response_data = {'code': 400, 'message': '缺少code参数'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '缺少code参数'})
         
         # 调用微信API获取session_key和openid
-        wx_url = f'https://api.weixin.qq.com/sns/jscode2session?appid={Config.WX_APP_ID}&secret={Config.WX_APP_SECRET}&js_code={code}&grant_type=authorization_code'
-        wx_response = requests.get(wx_url)
-        wx_result = wx_response.json()
+        wx_result = wx_client.code2session(code)
         
-        app.logger.info(f'微信openid获取请求，code: {code}, 微信返回: {wx_result}')
+        logger.info('微信openid获取请求，code: %s, 微信返回: %s', code, wx_result)
         
         if 'errcode' in wx_result:
-            response_data = {
+            return json_response({
                 'code': 400, 
                 'message': '获取openid失败',
                 'wx_error': {
                     'errcode': wx_result.get('errcode'),
                     'errmsg': wx_result.get('errmsg')
                 }
-            }
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            })
         
         openid = wx_result.get('openid')
         session_key = wx_result.get('session_key')
@@ -60,30 +98,24 @@ def wx_get_openid():
         # 验证用户是否存在
         # user = User.query.filter_by(openid=openid).first()
         # if not user:
-        #     app.logger.info(f'openid获取成功但用户不存在，openid: {openid}')
+        #     logger.info(f'openid获取成功但用户不存在，openid: {openid}')
         
         # 返回openid和session_key
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '获取成功',
             'data': {
                 'openid': openid,
                 'session_key': session_key
             }
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'获取openid失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('获取openid失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
 # 微信登录接口
-@app.route('/api/wx/login', methods=['POST'])
+@bp.route('/api/wx/login', methods=['POST'])
 def wx_login():
     """微信授权登录接口"""
     try:
@@ -92,170 +124,136 @@ def wx_login():
         encrypted_data = data.get('encryptedData')
         iv = data.get('iv')
         
-        app.logger.info(f'微信登录请求，code: {code}, encryptedData: {encrypted_data[:10]}..., iv: {iv}')
-        
         if not code or not encrypted_data or not iv:
-            response_data = {'code': 400, 'message': '参数错误'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '参数错误'})
+        
+        logger.info('微信登录请求，code: %s, encryptedData: %s..., iv: %s', code, encrypted_data[:10], iv)
         
         # 1. 调用微信API获取session_key和openid
-        wx_url = f'https://api.weixin.qq.com/sns/jscode2session?appid={Config.WX_APP_ID}&secret={Config.WX_APP_SECRET}&js_code={code}&grant_type=authorization_code'
-        wx_response = requests.get(wx_url)
-        wx_result = wx_response.json()
+        wx_result = wx_client.code2session(code)
         
-        app.logger.info(f'微信登录，调用微信API返回: {wx_result}')
+        logger.info('微信登录，调用微信API返回: %s', wx_result)
         
         if 'errcode' in wx_result:
-            response_data = {
+            return json_response({
                 'code': 400, 
                 'message': '微信登录失败',
                 'wx_error': {
                     'errcode': wx_result.get('errcode'),
                     'errmsg': wx_result.get('errmsg')
                 }
-            }
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            })
         
         openid = wx_result.get('openid')
         session_key = wx_result.get('session_key')
         
-        app.logger.info(f'微信登录，获取到openid: {openid}, session_key: {session_key[:10]}...')
+        logger.info('微信登录，获取到openid: %s, session_key: %s...', openid, session_key[:10])
         
         # 2. 解密手机号
         success, phone_number = crypto_util.decrypt_wx_phone(encrypted_data, iv, wx_result.get('session_key'))
         if not success:
-            app.logger.error(f'微信登录，手机号解密失败: {phone_number}')
-            response_data = {
+            logger.error('微信登录，手机号解密失败: %s', phone_number)
+            return json_response({
                 'code': 400, 
                 'message': '手机号解密失败',
                 'error': phone_number
-            }
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            })
         
-        app.logger.info(f'微信登录，解密得到手机号: {phone_number}')
+        logger.info('微信登录，解密得到手机号: %s', phone_number)
         
         # 3. 验证手机号格式
         if not validate_phone(phone_number):
-            app.logger.error(f'微信登录，手机号格式不正确: {phone_number}')
-            response_data = {
+            logger.error('微信登录，手机号格式不正确: %s', phone_number)
+            return json_response({
                 'code': 400, 
                 'message': '手机号格式不正确'
-            }
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            })
         
         # 4. 保存或更新用户信息
         user = User.query.filter_by(openid=openid).first()
         if not user:
             # 创建新用户
-            app.logger.info(f'微信登录，创建新用户，openid: {openid}, 手机号: {phone_number}')
+            logger.info('微信登录，创建新用户，openid: %s, 手机号: %s', openid, phone_number)
             encrypted_phone = crypto_util.encrypt(phone_number)
             user = User(
                 openid=openid,
-                phone_number=encrypted_phone
+                phone_number=encrypted_phone,
+                phone_hash=crypto_util.blind_index(phone_number)
             )
             db.session.add(user)
+            mark_recent_write(openid)
             db.session.commit()
         else:
-            app.logger.info(f'微信登录，用户已存在，更新信息，openid: {openid}')
+            logger.info('微信登录，用户已存在，更新信息，openid: %s', openid)
             # 更新手机号
             encrypted_phone = crypto_util.encrypt(phone_number)
             user.phone_number = encrypted_phone
+            user.phone_hash = crypto_util.blind_index(phone_number)
+            mark_recent_write(openid)
             db.session.commit()
-            app.logger.info(f'微信登录，用户信息更新成功，openid: {openid}')
+            logger.info('微信登录，用户信息更新成功，openid: %s', openid)
         
         # 5. 返回登录结果（脱敏手机号）
         desensitized_phone = phone_number[:3] + '****' + phone_number[-4:]
-        app.logger.info(f'微信登录成功，openid: {openid}, 返回脱敏手机号: {desensitized_phone}')
-        response_data = {
+        logger.info('微信登录成功，openid: %s, 返回脱敏手机号: %s', openid, desensitized_phone)
+        return json_response({
             'code': 200,
             'message': '登录成功',
             'data': {
                 'openid': openid,
                 'phone': desensitized_phone  # 返回脱敏后的手机号
             }
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'微信登录失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('微信登录失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
 # 微信手机号获取接口
-@app.route('/api/wx/phone', methods=['GET'])
+@bp.route('/api/wx/phone', methods=['GET'])
 def wx_get_phone():
     """获取微信用户手机号接口"""
     try:
         code = request.args.get('code')
         openid = request.args.get('openid')
         
-        app.logger.info(f'微信手机号获取请求，code: {code}, openid: {openid}')
+        logger.info('微信手机号获取请求，code: %s, openid: %s', code, openid)
         
         if not code or not openid:
-            response_data = {'code': 400, 'message': '参数错误'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
-        
-        # 1. 获取微信access_token
-        access_token_url = f'https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={Config.WX_APP_ID}&secret={Config.WX_APP_SECRET}'
-        access_token_response = requests.get(access_token_url)
-        access_token_result = access_token_response.json()
-        
-        app.logger.info(f'获取微信access_token返回: {access_token_result}')
-        
-        if 'errcode' in access_token_result:
-            app.logger.error(f'获取微信access_token失败: {access_token_result}')
-            response_data = {
+            return json_response({'code': 400, 'message': '参数错误'})
+        
+        # 1. 获取微信access_token（共享缓存，过期前才会重新请求微信）
+        # 2. 调用微信phonenumber.getPhoneNumber接口，token失效时刷新后重试一次
+        try:
+            for attempt in range(2):
+                access_token = token_manager.get_token()
+                phone_result = wx_client.get_phone_number(access_token, code)
+                if phone_result.get('errcode') not in TOKEN_INVALID_ERRCODES:
+                    break
+                logger.warning('微信access_token已失效，重新获取: %s', phone_result)
+                token_manager.invalidate(access_token)
+        except WeChatTokenError as e:
+            return json_response({
                 'code': 400,
                 'message': '获取微信access_token失败',
-                'wx_error': access_token_result
-            }
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
-        
-        access_token = access_token_result.get('access_token')
-        
-        # 2. 调用微信phonenumber.getPhoneNumber接口
-        phone_url = f'https://api.weixin.qq.com/wxa/business/getuserphonenumber?access_token={access_token}'
-        phone_payload = {'code': code}
-        phone_response = requests.post(phone_url, json=phone_payload)
-        phone_result = phone_response.json()
+                'wx_error': e.wx_result
+            })
         
-        app.logger.info(f'调用微信getPhoneNumber返回: {phone_result}')
+        logger.info('调用微信getPhoneNumber返回: %s', phone_result)
         
         if 'errcode' in phone_result and phone_result['errcode'] != 0:
-            app.logger.error(f'调用微信getPhoneNumber失败: {phone_result}')
-            response_data = {
+            logger.error('调用微信getPhoneNumber失败: %s', phone_result)
+            return json_response({
                 'code': 400,
                 'message': '获取手机号失败',
                 'wx_error': phone_result
-            }
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            })
         
         # 3. 获取手机号数据
         phone_info = phone_result.get('phone_info')
         if not phone_info:
-            app.logger.error(f'微信返回数据中缺少phone_info: {phone_result}')
-            response_data = {'code': 400, 'message': '获取手机号数据失败'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            logger.error('微信返回数据中缺少phone_info: %s', phone_result)
+            return json_response({'code': 400, 'message': '获取手机号数据失败'})
         
         # 检查是否有直接的手机号字段（微信API可能直接返回明文）
         phone_number = phone_info.get('phoneNumber')
@@ -268,70 +266,61 @@ def wx_get_phone():
             # 4. 解密手机号
             success, phone_number = crypto_util.decrypt_wx_phone(encrypted_data, iv, session_key)
             if not success:
-                app.logger.error(f'微信手机号解密失败: {phone_number}')
-                response_data = {
+                logger.error('微信手机号解密失败: %s', phone_number)
+                return json_response({
                     'code': 400,
                     'message': '手机号解密失败',
                     'error': phone_number
-                }
-                response = make_response(json.dumps(response_data, ensure_ascii=False))
-                response.headers['Content-Type'] = 'application/json; charset=utf-8'
-                return response
+                })
         
-        app.logger.info(f'获取微信手机号成功: {phone_number}')
+        logger.info('获取微信手机号成功: %s', phone_number)
         
         # 5. 验证手机号格式
         if not validate_phone(phone_number):
-            app.logger.error(f'手机号格式不正确: {phone_number}')
-            response_data = {
+            logger.error('手机号格式不正确: %s', phone_number)
+            return json_response({
                 'code': 400,
                 'message': '手机号格式不正确'
-            }
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            })
         
         # 6. 保存或更新用户信息
         user = User.query.filter_by(openid=openid).first()
         if not user:
             # 创建新用户
-            app.logger.info(f'创建新用户，openid: {openid}, 手机号: {phone_number}')
+            logger.info('创建新用户，openid: %s, 手机号: %s', openid, phone_number)
             encrypted_phone = crypto_util.encrypt(phone_number)
             user = User(
                 openid=openid,
-                phone_number=encrypted_phone
+                phone_number=encrypted_phone,
+                phone_hash=crypto_util.blind_index(phone_number)
             )
             db.session.add(user)
         else:
-            app.logger.info(f'用户已存在，更新手机号，openid: {openid}, 手机号: {phone_number}')
+            logger.info('用户已存在，更新手机号，openid: %s, 手机号: %s', openid, phone_number)
             # 更新手机号
             encrypted_phone = crypto_util.encrypt(phone_number)
             user.phone_number = encrypted_phone
+            user.phone_hash = crypto_util.blind_index(phone_number)
         
+        mark_recent_write(openid)
         db.session.commit()
-        app.logger.info(f'用户手机号更新成功，openid: {openid}')
+        logger.info('用户手机号更新成功，openid: %s', openid)
         
         # 7. 返回完整手机号
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '获取成功',
             'data': {
                 'phone': phone_number
             }
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'获取微信手机号失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('获取微信手机号失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
 # 生成并发送短信验证码接口
-@app.route('/api/sms/send-code', methods=['POST'])
+@bp.route('/api/sms/send-code', methods=['POST'])
 def send_sms_verification():
     """发送短信验证码接口"""
     try:
@@ -339,80 +328,70 @@ def send_sms_verification():
         data = request.get_json()
         phone_number = data.get('phone')
         
-        app.logger.info(f'短信验证码发送请求，手机号: {phone_number}')
+        logger.info('短信验证码发送请求，手机号: %s', phone_number)
         
         # 验证参数
         if not phone_number:
-            response_data = {'code': 400, 'message': '缺少手机号参数'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '缺少手机号参数'})
         
         # 验证手机号格式
         if not validate_phone(phone_number):
-            response_data = {'code': 400, 'message': '手机号格式不正确'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '手机号格式不正确'})
+        
+        # 按手机号和客户端IP限流，超限时回滚计数，不写入验证码也不发送短信
+        phone_hash = crypto_util.blind_index(phone_number)
+        client_ip = get_client_ip()
+        rules = sms_code_rules(phone_hash, client_ip)
+        allowed, counts = rate_limiter.hit(rules)
+        if not allowed:
+            exceeded = exceeded_rules(rules, counts)
+            for rule_name in exceeded:
+                metrics.incr('rate_limit_rejections', rule=rule_name)
+            logger.warning('短信验证码发送过于频繁，手机号: %s，IP: %s，触发规则: %s', phone_number, client_ip, exceeded)
+            cooldown_only = exceeded == ['sms_cooldown']
+            return json_response({
+                'code': 429,
+                'message': '发送过于频繁，请稍后再试' if cooldown_only else '发送次数超过限制，请稍后再试'
+            })
         
         # 生成6位数字验证码
         verification_code = ''.join(random.choices(string.digits, k=6))
-        app.logger.info(f'生成验证码: {verification_code}，手机号: {phone_number}')
+        logger.info('生成验证码: %s，手机号: %s', verification_code, phone_number)
         
         # 加密手机号
         encrypted_phone = crypto_util.encrypt(phone_number)
         
-        # 检查是否已有未过期的验证码
-        existing_verifications = SmsVerification.query.filter_by(
-            phone_number=encrypted_phone,
-            used=False
-        ).filter(SmsVerification.expires_at > datetime.utcnow()).all()
-        
-        # 将已有未过期验证码标记为已使用
-        for verification in existing_verifications:
-            verification.used = True
-            app.logger.info(f'标记旧验证码为已使用: {verification.id}')
+        # 一条UPDATE语句将已有未过期验证码标记为已使用
+        invalidated = SmsVerification.query.filter_by(phone_hash=phone_hash, used=False)\
+            .filter(SmsVerification.expires_at > datetime.utcnow())\
+            .update({'used': True}, synchronize_session=False)
+        if invalidated:
+            logger.info('标记旧验证码为已使用: %s 条', invalidated)
         
         # 创建新的验证码记录
         new_verification = SmsVerification(
             phone_number=encrypted_phone,
+            phone_hash=phone_hash,
             verification_code=verification_code
         )
         
-        # 调用短信服务发送验证码
-        sms_content = f'您的验证码是：{verification_code}，请勿泄露给他人。'
-        sms_success, sms_message = sms_client.send_sms(phone_number, verification_code)
-        
-        if sms_success:
-            # 保存到数据库
-            db.session.add(new_verification)
-            db.session.commit()
-            app.logger.info(f'短信验证码发送成功，手机号: {phone_number}，验证码: {verification_code}')
-            
-            response_data = {
-                'code': 200,
-                'message': '验证码发送成功，请注意查收'
-            }
-        else:
-            app.logger.error(f'短信验证码发送失败，手机号: {phone_number}，错误信息: {sms_message}')
-            response_data = {
-                'code': 500,
-                'message': f'验证码发送失败：{sms_message}'
-            }
+        # 验证码和待发送短信在同一事务中写入，短信由sms_worker异步发送
+        db.session.add(new_verification)
+        enqueue_sms(phone_number, verification_code)
+        db.session.commit()
+        logger.info('短信验证码已加入发送队列，手机号: %s，验证码: %s', phone_number, verification_code)
         
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        return json_response({
+            'code': 200,
+            'message': '验证码发送成功，请注意查收'
+        })
         
     except Exception as e:
-        app.logger.error(f'发送短信验证码异常: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('发送短信验证码异常: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
 # 验证短信验证码接口
-@app.route('/api/sms/verify-code', methods=['POST'])
+@bp.route('/api/sms/verify-code', methods=['POST'])
 def verify_sms_code():
     """验证短信验证码接口"""
     try:
@@ -421,131 +400,91 @@ def verify_sms_code():
         phone_number = data.get('phone')
         verification_code = data.get('code')
         
-        app.logger.info(f'短信验证码验证请求，手机号: {phone_number}，验证码: {verification_code}')
+        logger.info('短信验证码验证请求，手机号: %s，验证码: %s', phone_number, verification_code)
         
         # 验证参数
         if not phone_number or not verification_code:
-            response_data = {'code': 400, 'message': '缺少手机号或验证码参数'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '缺少手机号或验证码参数'})
         
         # 验证手机号格式
         if not validate_phone(phone_number):
-            response_data = {'code': 400, 'message': '手机号格式不正确'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '手机号格式不正确'})
         
-        # 加密手机号
-        encrypted_phone = crypto_util.encrypt(phone_number)
+        # 计算手机号盲索引用于查询
+        phone_hash = crypto_util.blind_index(phone_number)
         
         # 查询最新的未过期未使用的验证码
         verification = SmsVerification.query.filter_by(
-            phone_number=encrypted_phone,
+            phone_hash=phone_hash,
             verification_code=verification_code
         ).order_by(SmsVerification.created_at.desc()).first()
         
         if not verification:
-            response_data = {'code': 400, 'message': '验证码不存在或已失效'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '验证码不存在或已失效'})
         
         # 检查验证码是否有效
         if not verification.is_valid():
-            response_data = {'code': 400, 'message': '验证码已过期或已使用'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '验证码已过期或已使用'})
         
         # 标记验证码为已使用
         verification.used = True
         db.session.commit()
         
-        app.logger.info(f'短信验证码验证成功，手机号: {phone_number}，验证码: {verification_code}')
+        logger.info('短信验证码验证成功，手机号: %s，验证码: %s', phone_number, verification_code)
         
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '验证码验证成功'
-        }
-        
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'验证短信验证码异常: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('验证短信验证码异常: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
+
+# Prometheus指标接口
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus指标接口，汇总所有进程的指标
+
+    配置了METRICS_TOKEN时需要 Authorization: Bearer <token>
+    """
+    metrics_token = current_app.config['METRICS_TOKEN']
+    if metrics_token:
+        expected = f'Bearer {metrics_token}'.encode('utf-8')
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), expected):
+            abort(403)
+    response = make_response(metrics_exporter.render())
+    response.headers['Content-Type'] = METRICS_CONTENT_TYPE
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 # 获取祝福模板接口
-@app.route('/api/blessing/templates', methods=['GET'])
+@bp.route('/api/blessing/templates', methods=['GET'])
 def get_blessing_templates():
-    """获取祝福模板接口"""
+    """获取祝福模板接口
+
+    响应内容在模板加载时已序列化，客户端带If-None-Match且模板未修改时返回304
+    """
     try:
-        # 返回祝福模板列表
-        templates = [
-            {
-                "id": 1,
-                "type": "love",
-                "title": "爱情表白",
-                "content": "亲爱的{name}，今天特别想告诉你：与你相遇是我生命中最美好的事情，你的笑容照亮了我的每一天。愿我们的爱情永远甜蜜幸福！"
-            },
-            {
-                "id": 2,
-                "type": "apology",
-                "title": "道歉信",
-                "content": "{name}，我知道我错了，让你伤心难过。请你原谅我的冲动和自私，我会努力改正，给你更多的理解和关心。对不起，我爱你！"
-            },
-            {
-                "id": 3,
-                "type": "birthday",
-                "title": "生日祝福",
-                "content": "亲爱的{name}，祝你生日快乐！愿你的每一天都充满阳光和快乐，所有的梦想都能实现。在这个特别的日子里，我想对你说：有你在真好！"
-            },
-            {
-                "id": 4,
-                "type": "thanks",
-                "title": "感谢有你",
-                "content": "{name}，谢谢你一直以来的陪伴和支持。在我遇到困难的时候，你总是第一个伸出援手；在我开心的时候，你总是和我分享喜悦。有你这样的朋友，我感到无比幸运！"
-            },
-            {
-                "id": 5,
-                "type": "friendship",
-                "title": "友情祝福",
-                "content": "{name}，我们的友谊就像美酒一样，越陈越香。无论距离多远，时间多久，我都会珍惜这份情谊。愿我们的友谊天长地久！"
-            },
-            {
-                "id": 6,
-                "type": "encouragement",
-                "title": "鼓励支持",
-                "content": "{name}，我知道你现在面临挑战，但请相信自己的能力。你是最棒的，一定能够克服困难，实现目标。我会一直支持你！"
-            }
-        ]
-        
-        response_data = {
-            "code": 200,
-            "message": "获取成功",
-            "data": templates
-        }
+        cached = blessing_templates.get()
+        if cached is None:
+            raise RuntimeError('祝福模板未加载')
+        body, etag = cached
         
-        # 使用json.dumps和make_response解决中文乱码问题
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
+        response = make_response(body)
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        max_age = current_app.config['BLESSING_TEMPLATES_MAX_AGE']
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+        response.set_etag(etag)
+        return response.make_conditional(request)
         
     except Exception as e:
-        app.logger.error(f'获取祝福模板失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('获取祝福模板失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
 # 检查祝福发送限制接口
-@app.route('/api/blessing/check-limit', methods=['POST'])
+@bp.route('/api/blessing/check-limit', methods=['POST'])
+@read_only(lambda: (request.get_json(silent=True) or {}).get('sender_openid'))
 def check_blessing_limit():
     """检查祝福发送限制接口"""
     try:
@@ -553,37 +492,25 @@ def check_blessing_limit():
         sender_openid = data.get('sender_openid')
         receiver_phone = data.get('receiver_phone')
         
-        app.logger.info(f'检查祝福发送限制，发送者openid: {sender_openid}, 接收者手机号: {receiver_phone}')
+        logger.info('检查祝福发送限制，发送者openid: %s, 接收者手机号: %s', sender_openid, receiver_phone)
         
         if not sender_openid or not receiver_phone:
-            response_data = {'code': 400, 'message': '参数错误，缺少必要参数'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '参数错误，缺少必要参数'})
         
-        # 加密接收者手机号用于查询
-        encrypted_receiver_phone = crypto_util.encrypt(receiver_phone)
-        
-        # 计算24小时前的时间
-        from datetime import datetime, timedelta
-        one_day_ago = datetime.utcnow() - timedelta(days=1)
+        # 计算接收者手机号盲索引用于查询
+        receiver_phone_hash = crypto_util.blind_index(receiver_phone)
         
-        # 检查发送者今日发送次数
-        sender_count = BlessingMessage.query.filter_by(sender_openid=sender_openid)\
-            .filter(BlessingMessage.sent_at >= one_day_ago).count()
-            
-        # 检查接收者今日接收次数
-        receiver_count = BlessingMessage.query.filter_by(receiver_phone=encrypted_receiver_phone)\
-            .filter(BlessingMessage.sent_at >= one_day_ago).count()
+        # 从限流计数器读取发送者和接收者24小时内的次数，不扫描祝福表
+        sender_count, receiver_count = rate_limiter.peek(blessing_rules(sender_openid, receiver_phone_hash))
         
         # 获取配置的限制值
-        sender_limit = Config.SENDER_DAILY_LIMIT
-        receiver_limit = Config.RECEIVER_DAILY_LIMIT
+        sender_limit = current_app.config['SENDER_DAILY_LIMIT']
+        receiver_limit = current_app.config['RECEIVER_DAILY_LIMIT']
         
         # 检查是否超过限制
         is_over_limit = sender_count >= sender_limit or receiver_count >= receiver_limit
         
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '检查成功',
             'data': {
@@ -593,37 +520,36 @@ def check_blessing_limit():
                 'receiver_count': receiver_count,
                 'receiver_limit': receiver_limit
             }
-        }
-        
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'检查祝福发送限制失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('检查祝福发送限制失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
 # 查看收到的祝福接口
-@app.route('/api/blessing/received', methods=['GET'])
+@bp.route('/api/blessing/received', methods=['GET'])
+@read_only()
 def get_received_blessings():
     """查看收到的祝福接口"""
     try:
         phone = request.args.get('phone')
         
         if not phone:
-            response_data = {'code': 400, 'message': '参数错误'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '参数错误'})
         
-        # 加密手机号用于查询
-        encrypted_phone = crypto_util.encrypt(phone)
+        try:
+            cursor, limit = parse_page_args()
+        except ValueError as e:
+            logger.warning('查询收到的祝福，分页参数错误: %s', e)
+            return json_response({'code': 400, 'message': '分页参数错误'})
         
-        # 查询该手机号收到的所有祝福，包含发送者信息
-        blessings = BlessingMessage.query.filter_by(receiver_phone=encrypted_phone).order_by(BlessingMessage.sent_at.desc()).all()
+        # 计算手机号盲索引用于查询
+        phone_hash = crypto_util.blind_index(phone)
+        
+        # 分页查询该手机号收到的祝福，发送者昵称通过JOIN一次取回，避免逐条查询发送者
+        query = BlessingMessage.query.filter_by(receiver_phone_hash=phone_hash)\
+            .options(db.joinedload(BlessingMessage.sender).load_only(User.nick_name))
+        blessings, next_cursor = paginate_blessings(query, cursor, limit)
         
         # 格式化返回数据
         blessing_list = []
@@ -636,31 +562,26 @@ def get_received_blessings():
                 'sender_openid': blessing.sender_openid,
                 'sender_name': sender_name,  # 添加发送者微信名称
                 'content': blessing.content,
-                'sent_at': blessing.sent_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'sent_at': blessing.sent_at,
                 'status': blessing.status
             })
         
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '查询成功',
             'data': {
                 'blessings': blessing_list,
-                'total': len(blessing_list)
+                'total': len(blessing_list),
+                'next_cursor': next_cursor
             }
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
     
     except Exception as e:
-        app.logger.error(f'查询收到的祝福失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('查询收到的祝福失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器错误'})
 
 # 删除祝福接口
-@app.route('/api/blessing/delete', methods=['POST'])
+@bp.route('/api/blessing/delete', methods=['POST'])
 def delete_blessing():
     """删除祝福接口"""
     try:
@@ -668,53 +589,39 @@ def delete_blessing():
         blessing_id = data.get('id')
         openid = data.get('openid')
         
-        app.logger.info(f'删除祝福请求，祝福id: {blessing_id}, 用户openid: {openid}')
+        logger.info('删除祝福请求，祝福id: %s, 用户openid: %s', blessing_id, openid)
         
         if not blessing_id or not openid:
-            response_data = {'code': 400, 'message': '参数错误'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '参数错误'})
         
         # 查询祝福记录
         blessing = BlessingMessage.query.filter_by(id=blessing_id).first()
         
         if not blessing:
-            response_data = {'code': 404, 'message': '祝福不存在'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 404, 'message': '祝福不存在'})
         
         # 验证是否是发送者本人删除
         if blessing.sender_openid != openid:
-            response_data = {'code': 403, 'message': '没有权限删除此祝福'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 403, 'message': '没有权限删除此祝福'})
         
         # 逻辑删除祝福记录（仅对发送者隐藏，接收者仍可见）
         blessing.is_deleted = True
+        mark_recent_write(openid)
         db.session.commit()
         
-        app.logger.info(f'删除祝福成功，祝福id: {blessing_id}, 用户openid: {openid}')
+        logger.info('删除祝福成功，祝福id: %s, 用户openid: %s', blessing_id, openid)
         
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '删除成功'
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
     
     except Exception as e:
-        app.logger.error(f'删除祝福失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('删除祝福失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器错误'})
 
 # 发送祝福接口
-@app.route('/api/blessing/send', methods=['POST'])
+@bp.route('/api/blessing/send', methods=['POST'])
 def send_blessing():
     """发送祝福接口"""
     try:
@@ -724,38 +631,70 @@ def send_blessing():
         receiver_phone = data.get('receiver_phone')
         content = data.get('content')
         
-        app.logger.info(f'发送祝福请求，发送者openid: {sender_openid}, 接收者手机号: {receiver_phone}, 发送者昵称: {sender_nickname}')
+        logger.info('发送祝福请求，发送者openid: %s, 接收者手机号: %s, 发送者昵称: %s', sender_openid, receiver_phone, sender_nickname)
         
         if not sender_openid or not receiver_phone or not content:
-            response_data = {'code': 400, 'message': '参数错误'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '参数错误'})
+        
+        # 敏感词检查
+        if sensitive_filter.contains_sensitive_word(content):
+            metrics.incr('sensitive_filter_hits', route='send_blessing')
+            logger.warning('发送祝福失败：内容包含敏感词，发送者openid: %s', sender_openid)
+            return json_response({'code': 400, 'message': '内容包含敏感词'})
         
         # 更新用户微信昵称
         if sender_nickname:
             user = User.query.filter_by(openid=sender_openid).first()
             if user:
                 user.nick_name = sender_nickname
-                db.session.commit()
-                app.logger.info(f'更新用户昵称成功: {sender_openid} -> {sender_nickname}')
+            # 结束当前事务，保证随后的限流计数是新事务中的第一条语句
+            db.session.commit()
+            if user:
+                logger.info('更新用户昵称成功: %s -> %s', sender_openid, sender_nickname)
+        
+        # 1. 检查并计入发送者和接收者的24小时发送次数，与祝福记录在同一事务中提交
+        receiver_phone_hash = crypto_util.blind_index(receiver_phone)
+        rules = blessing_rules(sender_openid, receiver_phone_hash)
+        allowed, (sender_count, receiver_count) = rate_limiter.hit(rules)
+        if not allowed:
+            for rule_name in exceeded_rules(rules, (sender_count, receiver_count)):
+                metrics.incr('rate_limit_rejections', rule=rule_name)
+            logger.warning('发送祝福失败：超过发送限制，发送者openid: %s, 发送者次数: %s, 接收者次数: %s', sender_openid, sender_count, receiver_count)
+            return json_response({
+                'code': 429,
+                'message': '发送次数超过限制',
+                'data': {
+                    'sender_count': sender_count,
+                    'sender_limit': current_app.config['SENDER_DAILY_LIMIT'],
+                    'receiver_count': receiver_count,
+                    'receiver_limit': current_app.config['RECEIVER_DAILY_LIMIT']
+                }
+            })
         
-        # 1. 加密接收者手机号
+        # 2. 加密接收者手机号
         encrypted_receiver_phone = crypto_util.encrypt(receiver_phone)
         
-        # 2. 存储祝福记录
-        from datetime import datetime
+        # 3. 存储祝福记录
         blessing_msg = BlessingMessage(
             sender_openid=sender_openid,
             receiver_phone=encrypted_receiver_phone,
+            receiver_phone_hash=receiver_phone_hash,
             content=content,
             sent_at=datetime.utcnow(),
-            status='stored'  # 标记为已存储，不发送短信
+            # 开启短信发送时进入发送队列，否则仅存储
+            status='pending' if current_app.config['BLESSING_SMS_ENABLED'] else 'stored'
         )
         db.session.add(blessing_msg)
+        
+        # 4. 加入短信发送队列，由sms_worker批量发送并回写祝福状态
+        if current_app.config['BLESSING_SMS_ENABLED']:
+            db.session.flush()
+            enqueue_sms(receiver_phone, content, template_code=current_app.config['ALIYUN_SMS_TEMPLATE_CODE'],
+                        blessing_id=blessing_msg.id)
+        mark_recent_write(sender_openid)
         db.session.commit()
         
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '发送成功',
             'data': {
@@ -763,131 +702,108 @@ def send_blessing():
                 'receiver_phone': receiver_phone,
                 'content': content
             }
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'发送祝福失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('发送祝福失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
-@app.route('/api/user/phone', methods=['GET'])
+@bp.route('/api/user/phone', methods=['GET'])
+@read_only(lambda: request.args.get('openid'))
 def get_user_phone():
     """获取用户手机号接口"""
     try:
         # 获取请求参数
         openid = request.args.get('openid')
         
-        app.logger.info(f'获取用户手机号请求，openid: {openid}')
+        logger.info('获取用户手机号请求，openid: %s', openid)
         
         if not openid:
-            response_data = {'code': 400, 'message': '参数错误'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '参数错误'})
         
         # 查询用户信息
         user = User.query.filter_by(openid=openid).first()
         if not user:
-            app.logger.warning(f'获取用户手机号失败：用户不存在，openid: {openid}')
-            response_data = {'code': 404, 'message': '用户不存在'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            logger.warning('获取用户手机号失败：用户不存在，openid: %s', openid)
+            return json_response({'code': 404, 'message': '用户不存在'})
         
         # 解密手机号并脱敏
         phone_number = crypto_util.decrypt(user.phone_number)
         desensitized_phone = phone_number[:3] + '****' + phone_number[-4:]
         
-        app.logger.info(f'获取用户手机号成功，openid: {openid}, 脱敏手机号: {desensitized_phone}')
+        logger.info('获取用户手机号成功，openid: %s, 脱敏手机号: %s', openid, desensitized_phone)
         
         # 返回结果
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '获取成功',
             'data': {
                 'phone': desensitized_phone
             }
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'获取用户手机号失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        logger.error('获取用户手机号失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
 
-@app.route('/api/user/sent-blessings', methods=['GET'])
+@bp.route('/api/user/sent-blessings', methods=['GET'])
+@read_only(lambda: request.args.get('openid'))
 def get_user_sent_blessings():
     """查询用户已发送祝福接口"""
     try:
         # 获取请求参数
         openid = request.args.get('openid')
         
-        app.logger.info(f'查询用户已发送祝福请求，openid: {openid}')
+        logger.info('查询用户已发送祝福请求，openid: %s', openid)
         
         if not openid:
-            response_data = {'code': 400, 'message': '参数错误'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            return json_response({'code': 400, 'message': '参数错误'})
+        
+        try:
+            cursor, limit = parse_page_args()
+        except ValueError as e:
+            logger.warning('查询用户已发送祝福，分页参数错误: %s', e)
+            return json_response({'code': 400, 'message': '分页参数错误'})
         
         # 查询用户信息
         user = User.query.filter_by(openid=openid).first()
         if not user:
-            app.logger.warning(f'查询用户已发送祝福失败：用户不存在，openid: {openid}')
-            response_data = {'code': 404, 'message': '用户不存在'}
-            response = make_response(json.dumps(response_data, ensure_ascii=False))
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            logger.warning('查询用户已发送祝福失败：用户不存在，openid: %s', openid)
+            return json_response({'code': 404, 'message': '用户不存在'})
         
-        # 查询用户发送的所有未删除的祝福消息
-        blessings = BlessingMessage.query.filter_by(sender_openid=openid, is_deleted=False)\
-            .order_by(BlessingMessage.sent_at.desc())\
-            .all()
+        # 分页查询用户发送的未删除的祝福消息
+        blessings, next_cursor = paginate_blessings(
+            BlessingMessage.query.filter_by(sender_openid=openid, is_deleted=False), cursor, limit)
+        
+        # 批量解密接收者手机号并脱敏，同一接收者只解密一次
+        desensitized_receivers = crypto_util.decrypt_phones_masked(
+            [blessing.receiver_phone for blessing in blessings],
+            keys=[blessing.receiver_phone_hash for blessing in blessings]
+        )
         
         # 处理返回数据
         blessing_list = []
-        for blessing in blessings:
-            # 解密接收者手机号并脱敏
-            receiver_phone = crypto_util.decrypt(blessing.receiver_phone)
-            desensitized_receiver = receiver_phone[:3] + '****' + receiver_phone[-4:]
-            
+        for blessing, desensitized_receiver in zip(blessings, desensitized_receivers):
             blessing_list.append({
                 'id': blessing.id,
                 'receiver_phone': desensitized_receiver,
                 'content': blessing.content,
-                'sent_at': blessing.sent_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'sent_at': blessing.sent_at,
                 'status': blessing.status
             })
         
-        app.logger.info(f'查询用户已发送祝福成功，openid: {openid}, 数量: {len(blessing_list)}')
+        logger.info('查询用户已发送祝福成功，openid: %s, 数量: %s', openid, len(blessing_list))
         
         # 返回结果
-        response_data = {
+        return json_response({
             'code': 200,
             'message': '获取成功',
             'data': {
-                'blessings': blessing_list
+                'blessings': blessing_list,
+                'next_cursor': next_cursor
             }
-        }
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        })
         
     except Exception as e:
-        app.logger.error(f'查询用户已发送祝福失败: {str(e)}')
-        response_data = {'code': 500, 'message': '服务器内部错误'}
-        response = make_response(json.dumps(response_data, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
-
-if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+        logger.error('查询用户已发送祝福失败: %s', e)
+        return json_response({'code': 500, 'message': '服务器内部错误'})
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+import logging
+from app.config import Config
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 全角字符转半角：全角空格U+3000，其余全角ASCII字符U+FF01~U+FF5E
+FULLWIDTH_TO_HALFWIDTH = {0x3000: 0x20}
+FULLWIDTH_TO_HALFWIDTH.update({code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)})
+
+
+def normalize_text(text):
+    """全角转半角并转小写，保证结果与原文逐字符对应"""
+    normalized = text.translate(FULLWIDTH_TO_HALFWIDTH).lower()
+    if len(normalized) != len(text):
+        # 个别字符转小写后长度会变化（如'İ'），逐字符处理以保持位置对应
+        normalized = ''.join(
+            ch.lower() if len(ch.lower()) == 1 else ch
+            for ch in text.translate(FULLWIDTH_TO_HALFWIDTH)
+        )
+    return normalized
+
+
+class AhoCorasick:
+    """Aho–Corasick多模式匹配自动机，匹配耗时与文本长度成线性，与词典大小无关"""
+
+    def __init__(self, words):
+        self._goto = [{}]  # 每个状态的转移表
+        self._fail = [0]  # 失配指针
+        self._length = [0]  # 以该状态结尾的最长词长度（含失配链上的词），0表示不是词尾
+        for word in words:
+            self._add(word)
+        self._build()
+
+    def _add(self, word):
+        node = 0
+        for ch in word:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._length.append(0)
+            node = next_node
+        self._length[node] = max(self._length[node], len(word))
+
+    def _build(self):
+        """按层次遍历计算失配指针"""
+        # 第一层状态的失配指针都指向根
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._length[child] = max(self._length[child], self._length[self._fail[child]])
+                queue.append(child)
+
+    def iter_matches(self, text):
+        """依次返回每个位置结尾的最长匹配(start, end)"""
+        goto, fail, length = self._goto, self._fail, self._length
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if length[node]:
+                yield i + 1 - length[node], i + 1
+
+    def __len__(self):
+        return len(self._goto)
+
+
+class SensitiveWordFilter:
+    """敏感词过滤器
+
+    - 词典从文件加载，每行一个词
+    - 文件修改后自动重新构建自动机并整体替换，正在进行的匹配不受影响
+    - 匹配前对文本做全角/半角和大小写归一化
+    """
+
+    def __init__(self, words_path=None, check_interval=None, words=None):
+        self.words_path = words_path
+        self.check_interval = check_interval if check_interval is not None else Config.SENSITIVE_WORDS_CHECK_INTERVAL
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0
+        self._automaton = AhoCorasick([])
+        if words is not None:
+            self.load_words(words)
+        elif words_path:
+            self.reload()
+
+    def load_words(self, words):
+        """用给定词列表重建自动机，构建完成后一次性替换"""
+        normalized = {normalize_text(word.strip()) for word in words if word.strip()}
+        automaton = AhoCorasick(normalized)
+        self._automaton = automaton
+        return len(normalized)
+
+    def reload(self):
+        """从词典文件重新加载"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.words_path)
+                with open(self.words_path, 'r', encoding='utf-8') as f:
+                    words = [line for line in f if line.strip() and not line.lstrip().startswith('#')]
+            except OSError as e:
+                logger.error('加载敏感词词典失败: %s, %s', self.words_path, e)
+                return
+            count = self.load_words(words)
+            self._mtime = mtime
+            logger.info('敏感词词典已加载，词数: %s，文件: %s', count, self.words_path)
+
+    def _reload_if_changed(self):
+        """每隔check_interval秒检查一次词典文件是否有修改"""
+        if not self.words_path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.path.getmtime(self.words_path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def find(self, text):
+        """返回文本中所有敏感词的位置列表[(start, end)]"""
+        self._reload_if_changed()
+        return list(self._automaton.iter_matches(normalize_text(text)))
+
+    def contains_sensitive_word(self, text):
+        """检查文本是否包含敏感词"""
+        self._reload_if_changed()
+        for _ in self._automaton.iter_matches(normalize_text(text)):
+            return True
+        return False
+
+    def filter_sensitive_words(self, text):
+        """过滤敏感词，每个字符用*替换"""
+        matches = self.find(text)
+        if not matches:
+            return text
+        chars = list(text)
+        for start, end in matches:
+            for i in range(start, end):
+                chars[i] = '*'
+        return ''.join(chars)
+
+
+# 初始化敏感词过滤实例
+sensitive_filter = SensitiveWordFilter(Config.SENSITIVE_WORDS_PATH)
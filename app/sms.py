@@ -1,30 +1,59 @@
 import uuid
+import time
+import threading
 import logging
 from app.config import Config
-from aliyunsdkcore.client import AcsClient
-from aliyunsdkcore.request import CommonRequest
+from app.metrics import metrics
 
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
+
+def request_failure(e, api):
+    """调用阿里云接口（api为SendSms或SendBatchSms）时的异常对应的发送结果
+    
+    服务端明确拒绝（4xx错误码）时短信一定没有发出，返回(False, 信息)；
+    超时、网络错误和服务端5xx时阿里云可能已经受理，重发会导致重复短信，返回(None, 信息)表示结果未知
+    """
+    from aliyunsdkcore.acs_exception.exceptions import ServerException
+    if isinstance(e, ServerException):
+        metrics.incr('aliyun_sms_errors', api=api, code=e.get_error_code())
+        if e.get_http_status() and e.get_http_status() < 500:
+            return False, f"{e.get_error_msg()} (Code: {e.get_error_code()})"
+    else:
+        metrics.incr('aliyun_sms_errors', api=api, code='exception')
+    return None, f"发送结果未知: {str(e)}"
+
 class AliyunSMS:
     """阿里云短信发送类"""
     
     def __init__(self):
-        # 初始化阿里云客户端
-        self.client = AcsClient(
-            Config.ALIYUN_ACCESS_KEY_ID,
-            Config.ALIYUN_ACCESS_KEY_SECRET,
-            'cn-hangzhou'
-        )
+        # 阿里云客户端在第一次发送时创建，只导入本模块的进程（如Web服务）不需要加载阿里云SDK；
+        # 每个线程使用各自的客户端，sms_worker线程池和gthread/gevent模式下并发发送互不影响
+        self._local = threading.local()
         
         self.sign_name = Config.ALIYUN_SMS_SIGN_NAME
         self.template_code = Config.ALIYUN_SMS_TEMPLATE_CODE
     
-    def send_sms(self, phone_number, content):
-        """发送短信"""
+    @property
+    def client(self):
+        """当前线程的阿里云客户端，首次使用时创建"""
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            from aliyunsdkcore.client import AcsClient
+            client = AcsClient(
+                Config.ALIYUN_ACCESS_KEY_ID,
+                Config.ALIYUN_ACCESS_KEY_SECRET,
+                'cn-hangzhou'
+            )
+            self._local.client = client
+        return client
+    
+    def send_sms(self, phone_number, content, template_code=None):
+        """发送短信，template_code为空时使用默认模板"""
+        template_code = template_code or self.template_code
         try:
-            logger.info(f"开始发送短信，手机号: {phone_number}, 内容: {content}")
+            logger.info('开始发送短信，手机号: %s, 内容: %s', phone_number, content)
             
             # 验证参数
             if not phone_number or not content:
@@ -33,9 +62,10 @@ class AliyunSMS:
             
             # 构建短信内容
             sms_content = Config.SMS_TEMPLATE.format(content=content)
-            logger.debug(f"构建的短信内容: {sms_content}")
+            logger.debug('构建的短信内容: %s', sms_content)
             
             # 创建请求
+            from aliyunsdkcore.request import CommonRequest
             request = CommonRequest()
             request.set_method('POST')
             request.set_domain('dysmsapi.aliyuncs.com')
@@ -46,7 +76,7 @@ class AliyunSMS:
             out_id = str(uuid.uuid4())
             request.add_query_param('PhoneNumbers', phone_number)
             request.add_query_param('SignName', self.sign_name)
-            request.add_query_param('TemplateCode', self.template_code)
+            request.add_query_param('TemplateCode', template_code)
             
             # 处理模板参数 - 根据阿里云模板要求调整
             import json
@@ -56,42 +86,136 @@ class AliyunSMS:
             request.add_query_param('TemplateParam', template_param_json)
             request.add_query_param('OutId', out_id)
             
-            logger.debug(f"请求参数：手机号={phone_number}, 签名={self.sign_name}, 模板={self.template_code}")
-            logger.debug(f"模板参数对象：{template_param}")
-            logger.debug(f"模板参数JSON：{template_param_json}, OutId={out_id}")
+            logger.debug('请求参数：手机号=%s, 签名=%s, 模板=%s', phone_number, self.sign_name, template_code)
+            logger.debug('模板参数对象：%s', template_param)
+            logger.debug('模板参数JSON：%s, OutId=%s', template_param_json, out_id)
             
             # 发送请求
             logger.info("发送短信请求到阿里云")
-            response = self.client.do_action_with_exception(request)
-            
-            # 解析响应
-            response_str = response.decode('utf-8')
-            logger.debug(f"阿里云响应原始数据: {response_str}")
-            
-            import json
-            response_data = json.loads(response_str)
-            logger.info(f"阿里云响应解析后: {response_data}")
+            try:
+                response = self.client.do_action_with_exception(request)
+                
+                # 解析响应
+                response_str = response.decode('utf-8')
+                logger.debug('阿里云响应原始数据: %s', response_str)
+                response_data = json.loads(response_str)
+            except Exception as e:
+                logger.exception('调用阿里云短信接口异常，手机号: %s', phone_number)
+                return request_failure(e, 'SendSms')
+            logger.info('阿里云响应解析后: %s', response_data)
             
             code = response_data.get('Code')
             message = response_data.get('Message', '未知消息')
             request_id = response_data.get('RequestId')
             
-            logger.info(f"短信发送结果：Code={code}, Message={message}, RequestId={request_id}")
+            logger.info('短信发送结果：Code=%s, Message=%s, RequestId=%s', code, message, request_id)
             
             if code == 'OK':
-                logger.info(f"短信发送成功，手机号: {phone_number}, RequestId: {request_id}")
+                logger.info('短信发送成功，手机号: %s, RequestId: %s', phone_number, request_id)
                 return True, message
             else:
-                logger.error(f"短信发送失败，手机号: {phone_number}, Code: {code}, Message: {message}, RequestId: {request_id}")
+                metrics.incr('aliyun_sms_errors', api='SendSms', code=code)
+                logger.error('短信发送失败，手机号: %s, Code: %s, Message: %s, RequestId: %s', phone_number, code, message, request_id)
                 return False, f"{message} (Code: {code})"
                 
         except Exception as e:
-            import traceback
-            logger.error(f"发送短信异常，手机号: {phone_number}, 异常信息: {str(e)}")
-            logger.error("异常堆栈:")
-            traceback.print_exc()
-            return False, f"发送异常: {str(e)}"
+            # 请求可能已经发出（如解析响应时出错），按结果未知处理，避免重发
+            metrics.incr('aliyun_sms_errors', api='SendSms', code='exception')
+            logger.exception('发送短信异常，手机号: %s', phone_number)
+            return None, f"发送结果未知: {str(e)}"
+    
+    def send_batch_sms(self, phone_numbers, contents, template_code=None):
+        """批量发送同一模板的短信（SendBatchSms），单次最多SMS_BATCH_MAX_NUMBERS个号码
+        
+        阿里云批量接口只返回整批的结果，返回与phone_numbers顺序一致的[(是否成功, 信息)]
+        """
+        template_code = template_code or self.template_code
+        try:
+            logger.info('开始批量发送短信，号码数: %s, 模板: %s', len(phone_numbers), template_code)
+            
+            if not phone_numbers or len(phone_numbers) != len(contents):
+                return [(False, "手机号与内容数量不一致")] * len(phone_numbers)
+            if len(phone_numbers) > Config.SMS_BATCH_MAX_NUMBERS:
+                return [(False, f"单次批量发送不能超过{Config.SMS_BATCH_MAX_NUMBERS}个号码")] * len(phone_numbers)
+            
+            import json
+            from aliyunsdkcore.request import CommonRequest
+            request = CommonRequest()
+            request.set_method('POST')
+            request.set_domain('dysmsapi.aliyuncs.com')
+            request.set_version('2017-05-25')
+            request.set_action_name('SendBatchSms')
+            request.add_query_param('PhoneNumberJson', json.dumps(phone_numbers))
+            request.add_query_param('SignNameJson', json.dumps([self.sign_name] * len(phone_numbers)))
+            request.add_query_param('TemplateCode', template_code)
+            request.add_query_param('TemplateParamJson', json.dumps([{"content": content} for content in contents]))
+            
+            try:
+                response = self.client.do_action_with_exception(request)
+                response_data = json.loads(response.decode('utf-8'))
+            except Exception as e:
+                logger.exception('调用阿里云批量短信接口异常，号码数: %s', len(phone_numbers))
+                return [request_failure(e, 'SendBatchSms')] * len(phone_numbers)
+            
+            code = response_data.get('Code')
+            message = response_data.get('Message', '未知消息')
+            request_id = response_data.get('RequestId')
+            logger.info('批量短信发送结果：Code=%s, Message=%s, RequestId=%s, BizId=%s', code, message, request_id, response_data.get('BizId'))
+            
+            if code == 'OK':
+                return [(True, message)] * len(phone_numbers)
+            metrics.incr('aliyun_sms_errors', api='SendBatchSms', code=code)
+            return [(False, f"{message} (Code: {code})")] * len(phone_numbers)
+        
+        except Exception as e:
+            # 请求可能已经发出（如解析响应时出错），按结果未知处理，避免重发
+            metrics.incr('aliyun_sms_errors', api='SendBatchSms', code='exception')
+            logger.exception('批量发送短信异常，号码数: %s', len(phone_numbers))
+            return [(None, f"发送结果未知: {str(e)}")] * len(phone_numbers)
+
+
+class FakeSMS:
+    """本地假短信客户端，接口与AliyunSMS一致，用于离线测试和压测
+    
+    latency: 模拟每次调用的耗时（秒）
+    fail_numbers: 这些手机号发送时返回失败
+    timeout_numbers: 包含这些手机号的调用模拟已受理但响应超时，短信已发出，结果未知
+    """
+    
+    def __init__(self, latency=0.0, fail_numbers=None, timeout_numbers=None):
+        self.latency = latency
+        self.fail_numbers = set(fail_numbers or [])
+        self.timeout_numbers = set(timeout_numbers or [])
+        self.sent = []
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def send_sms(self, phone_number, content, template_code=None):
+        """模拟发送短信"""
+        return self.send_batch_sms([phone_number], [content], template_code)[0]
+    
+    def send_batch_sms(self, phone_numbers, contents, template_code=None):
+        """模拟批量发送，与阿里云一致：任一号码无效则整批失败"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.fail_numbers.intersection(phone_numbers):
+                return [(False, "模拟发送失败 (Code: isv.MOBILE_NUMBER_ILLEGAL)")] * len(phone_numbers)
+            self.sent.extend(zip(phone_numbers, contents))
+            if self.timeout_numbers.intersection(phone_numbers):
+                return [(None, "发送结果未知: 模拟读取超时")] * len(phone_numbers)
+        logger.info('[FakeSMS] 模拟发送短信，号码数: %s', len(phone_numbers))
+        return [(True, "OK")] * len(phone_numbers)
+
+
+def create_sms_client(backend=None):
+    """根据配置创建短信客户端：aliyun（默认）或 fake"""
+    backend = backend or Config.SMS_BACKEND
+    if backend == 'fake':
+        return FakeSMS()
+    return AliyunSMS()
 
 
 # 初始化短信发送实例
-sms_client = AliyunSMS()
+sms_client = create_sms_client()
@@ -0,0 +1,236 @@
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.extensions import db
+from app.config import Config
+from app.metrics import metrics
+from app.models import SmsOutbox, BlessingMessage
+from app.utils import crypto_util
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+def enqueue_sms(phone_number, content, template_code=None, blessing_id=None):
+    """将短信加入发送队列
+
+    只添加到当前会话，由调用方提交事务，保证与业务数据同时写入
+    """
+    message = SmsOutbox(
+        phone_number=crypto_util.encrypt(phone_number),
+        content=content,
+        template_code=template_code,
+        blessing_id=blessing_id
+    )
+    db.session.add(message)
+    return message
+
+
+class SmsWorker:
+    """短信队列消费者
+
+    - 每次领取一批待发送消息，领取通过条件UPDATE完成，多个worker进程不会重复领取
+    - 同一模板的消息合并为批量调用（SendBatchSms），每批不超过batch_max_numbers个号码
+    - 短信接口调用在线程池中并发执行，并发数有上限；数据库读写只在主线程进行
+    - 失败的消息按退避时间重新入队，超过最大次数标记为failed
+    - 超时、网络错误等无法确定是否已发出的消息标记为unknown，不重发，避免用户收到重复短信；
+      领取后worker崩溃或卡住、长时间停在sending的消息同样结果未知，由数据清理标记为unknown（MaintenanceRunner.expire_sending_sms）
+    - 发送结果只写回仍属于本次领取（claimed_by一致）的消息
+    """
+
+    def __init__(self, client, concurrency=None, batch_size=None, poll_interval=None,
+                 max_attempts=None, retry_backoff=None, batch_max_numbers=None):
+        self.client = client
+        self.concurrency = concurrency or Config.SMS_WORKER_CONCURRENCY
+        self.batch_size = batch_size or Config.SMS_WORKER_BATCH_SIZE
+        self.poll_interval = poll_interval or Config.SMS_WORKER_POLL_INTERVAL
+        self.max_attempts = max_attempts or Config.SMS_MAX_ATTEMPTS
+        self.retry_backoff = retry_backoff if retry_backoff is not None else Config.SMS_RETRY_BACKOFF
+        self.batch_max_numbers = batch_max_numbers or Config.SMS_BATCH_MAX_NUMBERS
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.running = False
+
+    def _claimable(self, now):
+        """可领取的消息：到期的pending消息
+
+        停在sending的消息可能已经发出，不重新领取，见MaintenanceRunner.expire_sending_sms
+        """
+        return db.and_(SmsOutbox.status == 'pending', SmsOutbox.next_attempt_at <= now)
+
+    def claim_batch(self):
+        """领取一批待发送消息"""
+        now = datetime.utcnow()
+        claim_token = str(uuid.uuid4())
+        ids = db.session.execute(
+            db.select(SmsOutbox.id).where(self._claimable(now)).order_by(SmsOutbox.id).limit(self.batch_size)
+        ).scalars().all()
+        if not ids:
+            db.session.rollback()
+            return []
+
+        # 再次带上领取条件，已被其他worker领取的消息不会被更新
+        db.session.execute(
+            db.update(SmsOutbox)
+            .where(SmsOutbox.id.in_(ids), self._claimable(now))
+            .values(status='sending', claimed_by=claim_token, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return SmsOutbox.query.filter_by(claimed_by=claim_token).order_by(SmsOutbox.id).all()
+
+    def _send_one(self, phone_number, content, template_code):
+        """调用单条发送接口，异常时无法确定是否已发出，视为结果未知"""
+        started = time.perf_counter()
+        try:
+            return self.client.send_sms(phone_number, content, template_code)
+        except Exception as e:
+            logger.exception('短信发送异常')
+            return None, f'发送结果未知: {str(e)}'
+        finally:
+            metrics.observe('sms_send_seconds', time.perf_counter() - started, api='SendSms')
+
+    def _send_chunk(self, template_code, phone_numbers, contents):
+        """在线程池中发送一组同模板短信，返回每个号码的(是否成功, 信息)，是否成功为None表示结果未知
+
+        批量接口只返回整批结果，阿里云明确拒绝整批时逐条重发，找出真正失败的号码；
+        超时或网络错误时整批可能已经发出，不重发
+        """
+        if len(phone_numbers) == 1 or not hasattr(self.client, 'send_batch_sms'):
+            return [self._send_one(p, c, template_code) for p, c in zip(phone_numbers, contents)]
+
+        started = time.perf_counter()
+        try:
+            results = self.client.send_batch_sms(phone_numbers, contents, template_code)
+        except Exception as e:
+            logger.exception('批量短信发送异常')
+            results = [(None, f'发送结果未知: {str(e)}')] * len(phone_numbers)
+        finally:
+            metrics.observe('sms_send_seconds', time.perf_counter() - started, api='SendBatchSms')
+
+        if all(success for success, _ in results):
+            return results
+        if any(success is None for success, _ in results):
+            logger.error('批量短信发送结果未知，不重发 %s 条: %s', len(phone_numbers), results[0][1])
+            return results
+        logger.warning('批量短信发送失败，逐条重发 %s 条: %s', len(phone_numbers), results[0][1])
+        return [self._send_one(p, c, template_code) for p, c in zip(phone_numbers, contents)]
+
+    def record_result(self, message, claim_token, success, info, retry=True):
+        """根据发送结果更新消息状态，返回新状态
+
+        success为None（结果未知）时标记为unknown，不再重发；retry为False时失败直接标记为failed。
+        只更新claimed_by仍为claim_token（本次领取）的消息，消息已不属于本次领取时不更新，返回None
+        """
+        now = datetime.utcnow()
+        attempts = message.attempts + 1
+        values = {'attempts': attempts, 'claimed_by': None, 'updated_at': now,
+                  'last_error': None if success else (info or '')[:200]}
+        if success:
+            values['status'] = 'sent'
+        elif success is None:
+            values['status'] = 'unknown'
+        elif not retry or attempts >= self.max_attempts:
+            values['status'] = 'failed'
+        else:
+            values['status'] = 'pending'
+            values['next_attempt_at'] = now + timedelta(seconds=attempts * self.retry_backoff)
+
+        result = db.session.execute(
+            db.update(SmsOutbox)
+            .where(SmsOutbox.id == message.id, SmsOutbox.claimed_by == claim_token)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            logger.warning('短信队列消息已不属于本次领取，不写回发送结果，队列消息id: %s，结果: %s', message.id, values['status'])
+            return None
+        metrics.incr('sms_send_total', status=values['status'])
+        return values['status']
+
+    def process_batch(self):
+        """领取并发送一批消息，返回处理的消息数"""
+        messages = self.claim_batch()
+        if not messages:
+            return 0
+
+        # 领取时的批次标识，写回结果时用于确认消息仍属于本次领取
+        claim_token = messages[0].claimed_by
+        statuses = {}
+        sendable = []
+        for message in messages:
+            try:
+                sendable.append((message, crypto_util.decrypt(message.phone_number)))
+            except Exception as e:
+                # 手机号无法解密，重试也不会成功
+                statuses[message.id] = self.record_result(message, claim_token, False, f'手机号解密失败: {str(e)}',
+                                                         retry=False)
+
+        # 按模板分组并切分为不超过批量上限的小批
+        groups = {}
+        for message, phone in sendable:
+            groups.setdefault(message.template_code, []).append((message, phone))
+        chunks = []
+        for template_code, items in groups.items():
+            for i in range(0, len(items), self.batch_max_numbers):
+                chunks.append((template_code, items[i:i + self.batch_max_numbers]))
+
+        futures = [
+            self.executor.submit(self._send_chunk, template_code,
+                                 [phone for _, phone in items], [message.content for message, _ in items])
+            for template_code, items in chunks
+        ]
+
+        succeeded = 0
+        for (_, items), future in zip(chunks, futures):
+            for (message, _), (success, info) in zip(items, future.result()):
+                statuses[message.id] = self.record_result(message, claim_token, success, info)
+                if success:
+                    succeeded += 1
+                elif success is None:
+                    logger.error('短信发送结果未知，不再重发，队列消息id: %s，错误信息: %s', message.id, info)
+                else:
+                    logger.error('短信发送失败，队列消息id: %s，第%s次，错误信息: %s',
+                                 message.id, message.attempts + 1, info)
+
+        self.update_blessing_status(messages, statuses)
+        db.session.commit()
+
+        logger.info('短信队列处理完成，本批 %s 条，调用 %s 次，成功 %s 条', len(messages), len(chunks), succeeded)
+        return len(messages)
+
+    def update_blessing_status(self, messages, statuses):
+        """将发送结果同步到对应的祝福消息（sent或failed，重试中的保持pending）
+
+        statuses为record_result返回的{队列消息id: 新状态}
+        """
+        blessing_ids = {'sent': [], 'failed': []}
+        for message in messages:
+            status = statuses.get(message.id)
+            if message.blessing_id and status in blessing_ids:
+                blessing_ids[status].append(message.blessing_id)
+        for status, ids in blessing_ids.items():
+            if ids:
+                BlessingMessage.query.filter(BlessingMessage.id.in_(ids))\
+                    .update({'status': status}, synchronize_session=False)
+
+    def run(self, once=False):
+        """持续消费队列；once为True时处理完当前积压消息后退出"""
+        self.running = True
+        logger.info('短信worker启动，并发数: %s，批大小: %s', self.concurrency, self.batch_size)
+        try:
+            while self.running:
+                processed = self.process_batch()
+                if processed:
+                    continue
+                if once:
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            self.executor.shutdown(wait=True)
+            logger.info('短信worker已停止')
+
+    def stop(self):
+        """请求worker在当前批次完成后退出"""
+        self.running = False
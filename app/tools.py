@@ -2,6 +2,7 @@ from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 import re
 from app.config import Config
+from app.sensitive import sensitive_filter
 
 # 加密函数 - AES-256
 def encrypt(data):
@@ -28,25 +29,12 @@ def validate_phone(phone):
 # 敏感词过滤
 def filter_sensitive_words(content):
     """过滤敏感词，返回过滤后的内容"""
-    # 简单敏感词列表，实际项目中应从数据库或配置文件加载
-    sensitive_words = ['敏感词1', '敏感词2', '广告', '联系方式', '政治', '辱骂']
-    
-    filtered_content = content
-    for word in sensitive_words:
-        filtered_content = filtered_content.replace(word, '*' * len(word))
-    
-    return filtered_content
+    return sensitive_filter.filter_sensitive_words(content)
 
 # 检查内容是否包含敏感词
 def contains_sensitive_words(content):
     """检查内容是否包含敏感词"""
-    sensitive_words = ['敏感词1', '敏感词2', '广告', '联系方式', '政治', '辱骂']
-    
-    for word in sensitive_words:
-        if word in content:
-            return True
-    
-    return False
+    return sensitive_filter.contains_sensitive_word(content)
 
 # 格式化手机号（脱敏显示）
 def format_phone(phone):
@@ -1,9 +1,14 @@
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
+from Crypto.Random import get_random_bytes
 import re
 import base64
+import hmac
+import hashlib
 import json
+from datetime import datetime
 from app.config import Config
+from app.sensitive import SensitiveWordFilter, sensitive_filter
 import logging
 
 # 使用应用的日志配置
@@ -12,23 +17,58 @@ logger = logging.getLogger(__name__)
 class CryptoUtil:
     """加密解密工具类"""
     
+    # 随机IV密文的前缀，无前缀的是旧版固定IV密文
+    RANDOM_IV_PREFIX = 'v2:'
+    
     def __init__(self):
         self.key = Config.AES_KEY.encode('utf-8')
         self.iv = Config.AES_IV.encode('utf-8')
+        self.hash_key = Config.PHONE_HASH_KEY.encode('utf-8')
     
     def encrypt(self, text):
-        """AES加密"""
-        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        """AES加密，每次使用随机IV，IV拼接在密文前"""
+        iv = get_random_bytes(AES.block_size)
+        cipher = AES.new(self.key, AES.MODE_CBC, iv)
         encrypted_data = cipher.encrypt(pad(text.encode('utf-8'), AES.block_size))
-        return base64.b64encode(encrypted_data).decode('utf-8')
+        return self.RANDOM_IV_PREFIX + base64.b64encode(iv + encrypted_data).decode('utf-8')
     
     def decrypt(self, encrypted_text):
-        """AES解密"""
-        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
-        encrypted_data = base64.b64decode(encrypted_text)
+        """AES解密，兼容旧版固定IV密文"""
+        if encrypted_text.startswith(self.RANDOM_IV_PREFIX):
+            raw = base64.b64decode(encrypted_text[len(self.RANDOM_IV_PREFIX):])
+            iv, encrypted_data = raw[:AES.block_size], raw[AES.block_size:]
+        else:
+            iv, encrypted_data = self.iv, base64.b64decode(encrypted_text)
+        cipher = AES.new(self.key, AES.MODE_CBC, iv)
         decrypted_data = unpad(cipher.decrypt(encrypted_data), AES.block_size)
         return decrypted_data.decode('utf-8')
     
+    def decrypt_phones_masked(self, encrypted_phones, keys=None):
+        """批量解密手机号并脱敏，返回与输入顺序一致的列表
+        
+        相同手机号只解密一次：keys为每条密文对应的去重键（如盲索引），
+        随机IV密文即使手机号相同也互不相同，因此优先按盲索引去重，缺失时按密文去重
+        """
+        if keys is None:
+            keys = encrypted_phones
+        memo = {}
+        result = []
+        for encrypted_phone, key in zip(encrypted_phones, keys):
+            memo_key = key or encrypted_phone
+            masked = memo.get(memo_key)
+            if masked is None:
+                masked = mask_phone(self.decrypt(encrypted_phone))
+                memo[memo_key] = masked
+            result.append(masked)
+        return result
+    
+    def blind_index(self, text):
+        """计算手机号的盲索引（HMAC-SHA256），用于等值查询
+        
+        密文使用随机IV后无法直接比较，查询统一使用盲索引列
+        """
+        return hmac.new(self.hash_key, text.encode('utf-8'), hashlib.sha256).hexdigest()
+    
     def decrypt_wx_phone(self, encrypted_data, iv, session_key):
         """微信手机号解密"""
         try:
@@ -38,7 +78,7 @@ class CryptoUtil:
                            encrypted_data is not None, iv is not None, session_key is not None)
                 return False, '参数不能为空'
             
-            logger.info(f'开始解密微信手机号，encrypted_data长度: {len(encrypted_data)}, iv长度: {len(iv)}, session_key长度: {len(session_key)}')
+            logger.info('开始解密微信手机号，encrypted_data长度: %s, iv长度: %s, session_key长度: %s', len(encrypted_data), len(iv), len(session_key))
             
             # 解密前的数据格式转换
             try:
@@ -99,39 +139,34 @@ class CryptoUtil:
             return False, str(e)
 
 
-class SensitiveWordFilter:
-    """敏感词过滤器"""
-    
-    def __init__(self):
-        # 基础敏感词列表
-        self.sensitive_words = [
-            # 政治敏感词
-            '敏感词1', '敏感词2',
-            # 广告联系方式
-            '微信', 'wx', 'QQ', 'qq', '电话', '手机号',
-            # 辱骂词汇
-            '傻逼', 'fuck', 'shit',
-            # 其他敏感内容
-            '赌博', '色情', '毒品'
-        ]
-        self.pattern = re.compile('|'.join(re.escape(word) for word in self.sensitive_words), re.IGNORECASE)
-    
-    def contains_sensitive_word(self, text):
-        """检查文本是否包含敏感词"""
-        return bool(self.pattern.search(text))
-    
-    def filter_sensitive_words(self, text):
-        """过滤敏感词，用*替换"""
-        return self.pattern.sub('*' * 4, text)
+# 验证工具函数
+def mask_phone(phone):
+    """手机号脱敏，格式为138****1234"""
+    return phone[:3] + '****' + phone[-4:]
 
 
-# 验证工具函数
 def validate_phone(phone):
     """验证中国大陆手机号"""
     pattern = re.compile(r'^1[3-9]\d{9}$')
     return bool(pattern.match(phone))
 
 
+def encode_cursor(sent_at, record_id):
+    """将(sent_at, id)编码为分页游标"""
+    raw = f'{sent_at.isoformat()}|{record_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8')
+
+
+def decode_cursor(cursor):
+    """解析分页游标，返回(sent_at, id)，游标无效时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8')
+        sent_at, record_id = raw.split('|', 1)
+        return datetime.fromisoformat(sent_at), int(record_id)
+    except Exception as e:
+        raise ValueError(f'无效的分页游标: {cursor}') from e
+
+
 def validate_blessing_content(content):
     """验证祝福内容"""
     if not content or len(content.strip()) == 0:
@@ -143,4 +178,3 @@ def validate_blessing_content(content):
 
 # 初始化工具实例
 crypto_util = CryptoUtil()
-sensitive_filter = SensitiveWordFilter()
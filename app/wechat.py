@@ -0,0 +1,345 @@
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.config import Config
+from app.metrics import metrics
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# access_token失效相关的错误码：40001 token无效，40014 token不合法，42001 token过期
+TOKEN_INVALID_ERRCODES = {40001, 40014, 42001}
+
+# 文件锁被其他进程持有时的轮询间隔（秒）
+TOKEN_LOCK_POLL_INTERVAL = 0.05
+
+
+class WeChatTokenError(Exception):
+    """获取微信access_token失败"""
+
+    def __init__(self, wx_result):
+        super().__init__(f'获取微信access_token失败: {wx_result}')
+        self.wx_result = wx_result
+
+
+class AccessTokenManager:
+    """微信access_token管理器
+
+    - 在过期前refresh_margin秒内视为过期，提前刷新
+    - 进程内缓存 + 共享文件缓存，多个gunicorn worker共用同一个token
+    - 刷新时先加进程内锁再加文件锁，并发请求只会触发一次微信请求
+    """
+
+    def __init__(self, fetch_token, store_path, refresh_margin=300):
+        # fetch_token: 无参函数，返回微信cgi-bin/token接口的JSON结果
+        self.fetch_token = fetch_token
+        self.store_path = store_path
+        self.lock_path = store_path + '.lock'
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._cached = None
+
+    def _is_fresh(self, entry):
+        return bool(entry) and entry.get('expires_at', 0) - self.refresh_margin > time.time()
+
+    def _read_store(self):
+        try:
+            with open(self.store_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_store(self, entry):
+        # 先写临时文件再原子替换，其他进程不会读到写了一半的文件；文件只允许本用户读写
+        tmp_path = f'{self.store_path}.{os.getpid()}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.store_path)
+
+    def cached_token(self):
+        """进程内缓存的有效access_token，没有时返回None；不读文件、不加锁，可在事件循环中直接调用"""
+        entry = self._cached
+        if self._is_fresh(entry):
+            return entry['access_token']
+        return None
+
+    def get_token(self):
+        """获取有效的access_token，失败时抛出WeChatTokenError"""
+        token = self.cached_token()
+        if token:
+            return token
+
+        with self._lock:
+            # 等锁期间可能已被其他线程刷新
+            entry = self._cached
+            if self._is_fresh(entry):
+                return entry['access_token']
+
+            entry = self._read_store()
+            if self._is_fresh(entry):
+                self._cached = entry
+                return entry['access_token']
+
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                self._lock_file(lock_file)
+                try:
+                    # 等文件锁期间可能已被其他进程刷新
+                    entry = self._read_store()
+                    if not self._is_fresh(entry):
+                        entry = self._refresh()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            self._cached = entry
+            return entry['access_token']
+
+    def _lock_file(self, lock_file):
+        """加文件锁，等待其他进程刷新完成
+
+        不使用阻塞的flock：gevent模式下阻塞的系统调用会卡住整个worker的所有协程。
+        非阻塞加锁失败时用time.sleep轮询，gevent的monkey patch将其替换为协程切换
+        """
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                time.sleep(TOKEN_LOCK_POLL_INTERVAL)
+
+    def _refresh(self):
+        """请求微信获取新的access_token并写入共享文件"""
+        started = time.time()
+        result = self.fetch_token()
+        if result.get('errcode') or not result.get('access_token'):
+            logger.error('获取微信access_token失败: %s', result)
+            raise WeChatTokenError(result)
+
+        entry = {
+            'access_token': result['access_token'],
+            'expires_at': started + int(result.get('expires_in', 7200))
+        }
+        self._write_store(entry)
+        logger.info('微信access_token已刷新，有效期: %s秒', result.get('expires_in'))
+        return entry
+
+    def invalidate(self, access_token):
+        """微信返回token失效时调用，下次get_token会重新获取"""
+        with self._lock:
+            if self._cached and self._cached.get('access_token') == access_token:
+                self._cached = None
+            entry = self._read_store()
+            if entry and entry.get('access_token') == access_token:
+                try:
+                    os.remove(self.store_path)
+                except OSError:
+                    pass
+
+
+class WeChatClient:
+    """微信服务端API客户端
+
+    - 复用同一个Session，保持到api.weixin.qq.com的长连接；Session在进程内第一次请求时创建，
+      gunicorn preload_app时各worker不会共用master中的连接
+    - 所有请求都设置连接超时和读取超时
+    - 幂等的GET请求在连接失败、读取失败或5xx时按退避重试；
+      POST只重试未发出的连接失败（getuserphonenumber的code只能使用一次）
+    - 记录每个接口的耗时和错误码
+    """
+
+    def __init__(self, base_url, app_id, app_secret, timeout, pool_size=10, max_retries=2, backoff_factor=0.2):
+        self.base_url = base_url.rstrip('/')
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """带连接池和重试的Session，首次使用时创建"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    retry = Retry(
+                        total=self.max_retries,
+                        backoff_factor=self.backoff_factor,
+                        status_forcelist=(500, 502, 503, 504),
+                        allowed_methods=frozenset(['GET']),
+                        raise_on_status=False
+                    )
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _request(self, api, method, path, **kwargs):
+        """发送请求并返回JSON结果，同时记录耗时和错误码"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            result = response.json()
+        except requests.Timeout:
+            metrics.incr('wechat_api_errors', api=api, errcode='timeout')
+            raise
+        except (requests.RequestException, ValueError):
+            metrics.incr('wechat_api_errors', api=api, errcode='http')
+            raise
+        finally:
+            metrics.observe('wechat_api_seconds', time.perf_counter() - started, api=api)
+
+        if result.get('errcode'):
+            metrics.incr('wechat_api_errors', api=api, errcode=str(result['errcode']))
+        return result
+
+    def code2session(self, code):
+        """登录凭证校验，返回openid和session_key"""
+        params = {
+            'appid': self.app_id,
+            'secret': self.app_secret,
+            'js_code': code,
+            'grant_type': 'authorization_code'
+        }
+        return self._request('jscode2session', 'GET', '/sns/jscode2session', params=params)
+
+    def get_access_token(self):
+        """获取接口调用凭证access_token"""
+        params = {
+            'grant_type': 'client_credential',
+            'appid': self.app_id,
+            'secret': self.app_secret
+        }
+        return self._request('token', 'GET', '/cgi-bin/token', params=params)
+
+    def get_phone_number(self, access_token, code):
+        """用手机号获取凭证code换取用户手机号"""
+        return self._request('getuserphonenumber', 'POST', '/wxa/business/getuserphonenumber',
+                             params={'access_token': access_token}, json={'code': code})
+
+
+class AsyncWeChatClient:
+    """微信服务端API的异步客户端，供ASGI接口（app/asgi.py）使用，需安装aiohttp
+
+    超时、重试和指标与WeChatClient一致；aiohttp的ClientSession绑定到事件循环，在第一次请求时创建，
+    单个进程可以同时等待pool_size个微信请求
+    """
+
+    def __init__(self, base_url, app_id, app_secret, timeout, pool_size=200, max_retries=2, backoff_factor=0.2):
+        self.base_url = base_url.rstrip('/')
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+
+    @property
+    def session(self):
+        """带连接池的aiohttp.ClientSession，首次使用时创建"""
+        if self._session is None:
+            import aiohttp
+            connect_timeout, read_timeout = self.timeout
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout),
+                connector=aiohttp.TCPConnector(limit=self.pool_size)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _send(self, method, path, **kwargs):
+        """发送请求并解析JSON，GET在连接失败、读取失败或5xx时按退避重试，POST只重试未发出的连接失败"""
+        import aiohttp
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                async with self.session.request(method, self.base_url + path, **kwargs) as response:
+                    if method != 'GET' or response.status not in (500, 502, 503, 504) or last_attempt:
+                        return await response.json(content_type=None)
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError):
+                # 连接失败时请求未发出，POST也可以安全重试
+                if last_attempt:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if method != 'GET' or last_attempt:
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def _request(self, api, method, path, **kwargs):
+        """发送请求并返回JSON结果，同时记录耗时和错误码"""
+        import aiohttp
+        started = time.perf_counter()
+        try:
+            result = await self._send(method, path, **kwargs)
+        except asyncio.TimeoutError:
+            metrics.incr('wechat_api_errors', api=api, errcode='timeout')
+            raise
+        except (aiohttp.ClientError, ValueError):
+            metrics.incr('wechat_api_errors', api=api, errcode='http')
+            raise
+        finally:
+            metrics.observe('wechat_api_seconds', time.perf_counter() - started, api=api)
+
+        if result.get('errcode'):
+            metrics.incr('wechat_api_errors', api=api, errcode=str(result['errcode']))
+        return result
+
+    async def code2session(self, code):
+        """登录凭证校验，返回openid和session_key"""
+        params = {
+            'appid': self.app_id,
+            'secret': self.app_secret,
+            'js_code': code,
+            'grant_type': 'authorization_code'
+        }
+        return await self._request('jscode2session', 'GET', '/sns/jscode2session', params=params)
+
+    async def get_phone_number(self, access_token, code):
+        """用手机号获取凭证code换取用户手机号"""
+        return await self._request('getuserphonenumber', 'POST', '/wxa/business/getuserphonenumber',
+                                   params={'access_token': access_token}, json={'code': code})
+
+
+# 初始化微信客户端实例
+wx_client = WeChatClient(
+    Config.WX_API_BASE_URL,
+    Config.WX_APP_ID,
+    Config.WX_APP_SECRET,
+    timeout=(Config.WX_CONNECT_TIMEOUT, Config.WX_READ_TIMEOUT),
+    pool_size=Config.WX_POOL_SIZE,
+    max_retries=Config.WX_MAX_RETRIES
+)
+
+# 初始化access_token管理器实例
+token_manager = AccessTokenManager(
+    wx_client.get_access_token,
+    Config.WX_TOKEN_STORE_PATH,
+    refresh_margin=Config.WX_TOKEN_REFRESH_MARGIN
+)
+
+# 初始化异步微信客户端实例（ASGI接口使用，aiohttp在第一次请求时导入）
+async_wx_client = AsyncWeChatClient(
+    Config.WX_API_BASE_URL,
+    Config.WX_APP_ID,
+    Config.WX_APP_SECRET,
+    timeout=(Config.WX_CONNECT_TIMEOUT, Config.WX_READ_TIMEOUT),
+    pool_size=Config.WX_ASYNC_POOL_SIZE,
+    max_retries=Config.WX_MAX_RETRIES
+)
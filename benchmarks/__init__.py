@@ -0,0 +1,15 @@
+"""性能基准测试
+
+在项目根目录以模块方式运行，例如:
+    python -m benchmarks.bench_crypto
+"""
+import os
+
+# 基准测试不依赖真实密钥，未配置时使用合法长度的测试密钥
+os.environ.setdefault('AES_KEY', '0123456789abcdef0123456789abcdef')
+os.environ.setdefault('AES_IV', '0123456789abcdef')
+os.environ.setdefault('PHONE_HASH_KEY', 'benchmark-phone-hash-key')
+os.environ.setdefault('ALIYUN_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('ALIYUN_ACCESS_KEY_SECRET', 'benchmark')
+os.environ.setdefault('WX_APP_ID', 'benchmark')
+os.environ.setdefault('WX_APP_SECRET', 'benchmark')
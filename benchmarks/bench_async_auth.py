@@ -0,0 +1,196 @@
+"""微信授权接口ASGI实现（app/asgi.py）的并发压测
+
+启动单进程uvicorn，clients个客户端同时请求，统计吞吐量、延迟和同时等待微信返回的请求数。
+两种实现返回内容一致由 tests/test_asgi_parity.py 检查
+
+微信接口由本地asyncio服务模拟，每个请求固定耗时。需要安装starlette、aiohttp和uvicorn:
+    python -m benchmarks.bench_async_auth [--clients 500] [--rounds 4] [--upstream-latency 0.2]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+import benchmarks  # noqa: F401  设置测试环境变量
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSION_KEY = base64.b64encode(b'0123456789abcdef').decode()
+LOGIN_IV = base64.b64encode(b'fedcba9876543210').decode()
+
+
+class FakeWeChat:
+    """用asyncio实现的模拟微信接口，在后台线程的事件循环中运行
+
+    - jscode2session: code为bad时返回40029，否则返回openid-<code>和固定的session_key
+    - cgi-bin/token: 返回固定token
+    - getuserphonenumber: code为bad时返回40029，为nophone时缺少phone_info，否则返回明文手机号
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        threading.Thread(target=self._run, args=(started,), daemon=True).start()
+        started.wait()
+
+    def _run(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        started.set()
+        self.loop.run_forever()
+
+    def _route(self, method, target, body):
+        url = urlsplit(target)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/sns/jscode2session':
+            if params.get('js_code') == 'bad':
+                return {'errcode': 40029, 'errmsg': 'invalid code'}
+            return {'openid': f"openid-{params.get('js_code')}", 'session_key': SESSION_KEY}
+        if url.path == '/cgi-bin/token':
+            return {'access_token': 'fake-token', 'expires_in': 7200}
+        if url.path == '/wxa/business/getuserphonenumber' and method == 'POST':
+            code = json.loads(body or b'{}').get('code')
+            if code == 'bad':
+                return {'errcode': 40029, 'errmsg': 'invalid code'}
+            if code == 'nophone':
+                return {'errcode': 0, 'errmsg': 'ok'}
+            return {'errcode': 0, 'errmsg': 'ok', 'phone_info': {'phoneNumber': '13812345678'}}
+        return {'errcode': 404, 'errmsg': 'not found'}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(' ', 2)
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    if name.lower() == 'content-length':
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b''
+
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    await asyncio.sleep(self.latency)
+                finally:
+                    self.in_flight -= 1
+
+                payload = json.dumps(self._route(method, target, body)).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: ' + str(len(payload)).encode() + b'\r\n\r\n' + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def encrypt_login_phone(phone):
+    """按微信的方式用session_key加密手机号数据"""
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import pad
+    data = json.dumps({'phoneNumber': phone, 'watermark': {'appid': 'benchmark'}}).encode()
+    cipher = AES.new(base64.b64decode(SESSION_KEY), AES.MODE_CBC, base64.b64decode(LOGIN_IV))
+    return base64.b64encode(cipher.encrypt(pad(data, AES.block_size))).decode()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def load(port, clients, rounds):
+    """clients个客户端同时各请求rounds次，返回(总耗时, 各请求耗时, 失败数)"""
+    import aiohttp
+    latencies = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=clients)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(f'http://127.0.0.1:{port}', connector=connector, timeout=timeout) as session:
+        async def one(i):
+            nonlocal errors
+            for n in range(rounds):
+                if n % 2:
+                    path = f'/api/wx/phone?code=c{i}&openid=openid-{i}'
+                else:
+                    path = f'/api/wx/get_openid?code=c{i}'
+                started = time.perf_counter()
+                try:
+                    async with session.get(path) as response:
+                        if (await response.json(content_type=None)).get('code') != 200:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(clients)))
+        return time.perf_counter() - started, sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='微信授权接口 Flask vs ASGI')
+    parser.add_argument('--clients', type=int, default=500, help='同时请求的客户端数')
+    parser.add_argument('--rounds', type=int, default=4, help='每个客户端的请求次数')
+    parser.add_argument('--upstream-latency', type=float, default=0.2, help='模拟微信接口耗时（秒）')
+    args = parser.parse_args()
+
+    fake = FakeWeChat(args.upstream_latency)
+    workdir = tempfile.mkdtemp(prefix='beslove-bench-')
+    os.environ['WX_API_BASE_URL'] = f'http://127.0.0.1:{fake.port}'
+    os.environ['WX_TOKEN_STORE_PATH'] = os.path.join(workdir, 'wx_access_token.json')
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(workdir, 'bench.db'))
+
+    from app.app import app as flask_app
+    from app.extensions import db
+    with flask_app.app_context():
+        db.create_all()
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.asgi:app', '--host', '127.0.0.1',
+                               '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+                              cwd=ROOT, env=dict(os.environ), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError('uvicorn启动失败')
+                time.sleep(0.2)
+
+        elapsed, latencies, errors = asyncio.run(load(port, args.clients, args.rounds))
+    finally:
+        server.terminate()
+        server.wait()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f'单进程uvicorn，{args.clients}个客户端各请求{args.rounds}次，微信接口耗时 {args.upstream_latency * 1000:.0f}ms:')
+    print(f'  {len(latencies) / elapsed:.0f} req/s  p50 {percentile(0.5):.0f}ms  p99 {percentile(0.99):.0f}ms  '
+          f'失败 {errors}  同时等待微信返回的请求最多 {fake.max_in_flight} 个')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""手机号解密基准：逐行解密 vs 批量去重解密
+
+模拟已发送祝福列表：一个发送者反复给少数几个号码发送祝福。
+
+用法:
+    python -m benchmarks.bench_crypto [--distinct 5] [--repeat 20]
+"""
+import argparse
+import timeit
+
+from app.utils import CryptoUtil, mask_phone
+
+
+def build_rows(crypto_util, size, distinct):
+    """构造size条(密文, 盲索引)，其中只有distinct个不同号码"""
+    phones = [f'139{i:08d}' for i in range(distinct)]
+    rows = []
+    for i in range(size):
+        phone = phones[i % distinct]
+        rows.append((crypto_util.encrypt(phone), crypto_util.blind_index(phone)))
+    return rows
+
+
+def per_row(crypto_util, rows):
+    return [mask_phone(crypto_util.decrypt(ciphertext)) for ciphertext, _ in rows]
+
+
+def bulk(crypto_util, rows):
+    return crypto_util.decrypt_phones_masked([c for c, _ in rows], keys=[k for _, k in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='手机号批量解密基准测试')
+    parser.add_argument('--distinct', type=int, default=5, help='不同号码数量')
+    parser.add_argument('--repeat', type=int, default=20, help='每组重复次数')
+    args = parser.parse_args()
+
+    crypto_util = CryptoUtil()
+    print(f"{'rows':>6} {'per-row(ms)':>12} {'bulk(ms)':>10} {'speedup':>8}")
+    for size in (10, 100, 1000):
+        rows = build_rows(crypto_util, size, args.distinct)
+        assert per_row(crypto_util, rows) == bulk(crypto_util, rows)
+        t_row = min(timeit.repeat(lambda: per_row(crypto_util, rows), number=1, repeat=args.repeat))
+        t_bulk = min(timeit.repeat(lambda: bulk(crypto_util, rows), number=1, repeat=args.repeat))
+        print(f"{size:>6} {t_row * 1000:>12.3f} {t_bulk * 1000:>10.3f} {t_row / t_bulk:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
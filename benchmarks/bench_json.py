@@ -0,0 +1,67 @@
+"""JSON序列化基准：1000条祝福列表在各编码器下的序列化耗时
+
+对比原来的 逐条strftime + json.dumps(ensure_ascii=False) + encode，
+以及 app.responses 中的标准库编码器和orjson编码器（已安装时）:
+    python -m benchmarks.bench_json [--items 1000] [--rounds 200]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+import benchmarks  # noqa: F401  设置测试环境变量
+from app.responses import StdlibJSONEncoder, OrjsonEncoder, orjson
+
+
+def make_blessings(count):
+    """构造与 收到的祝福 接口相同结构的返回数据"""
+    started = datetime(2024, 2, 14, 8, 0, 0)
+    return [{
+        'id': i,
+        'sender_openid': f'oAbCdEfGhIjKlMnOpQrStUvWx{i:05d}',
+        'sender_name': '匿名用户' if i % 3 else f'用户{i}',
+        'content': '亲爱的，今天特别想告诉你：与你相遇是我生命中最美好的事情，愿我们的爱情永远甜蜜幸福！',
+        'sent_at': started + timedelta(minutes=i),
+        'status': 'sent'
+    } for i in range(count)]
+
+
+def timed(func, rounds):
+    func()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON序列化基准')
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    blessings = make_blessings(args.items)
+
+    def response_data(items):
+        return {'code': 200, 'message': '查询成功', 'data': {'blessings': items, 'total': len(items), 'next_cursor': None}}
+
+    def legacy():
+        items = [dict(b, sent_at=b['sent_at'].strftime('%Y-%m-%d %H:%M:%S')) for b in blessings]
+        return json.dumps(response_data(items), ensure_ascii=False).encode('utf-8')
+
+    encoders = [('原实现（strftime + json.dumps）', legacy),
+                ('标准库编码器', lambda: StdlibJSONEncoder().dumps(response_data(blessings)))]
+    if orjson is not None:
+        encoders.append(('orjson编码器', lambda: OrjsonEncoder().dumps(response_data(blessings))))
+    else:
+        print('未安装orjson，跳过orjson编码器')
+
+    expected = json.loads(legacy())
+    print(f'{args.items}条祝福，每种编码器序列化{args.rounds}次:')
+    for name, func in encoders:
+        assert json.loads(func()) == expected, f'{name} 输出与原实现不一致'
+        print(f'  {name}: {timed(func, args.rounds):.2f}ms，{len(func())}字节')
+
+
+if __name__ == "__main__":
+    main()
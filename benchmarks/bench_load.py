@@ -0,0 +1,415 @@
+"""全部接口的压测：生成测试数据，模拟微信和阿里云短信，以固定并发逐个接口压测并与基准结果比较
+
+1. 按规模生成SQLite测试数据：用户、每个接收者收到的祝福、未使用的短信验证码，规则固定，
+   压测时按同样的规则构造请求参数（openid、手机号、祝福id、验证码）
+2. 启动模拟微信接口（bench_async_auth.FakeWeChat）和gunicorn，短信worker使用假短信客户端
+   （sms_worker.py --backend fake）发送验证码和祝福短信，与线上一样和接口争用数据库写锁
+3. 依次对 app/routes.py 中的每个接口以固定并发发送固定数量的请求（先预热），
+   统计吞吐量和p50/p95/p99延迟，HTTP状态码不是200或业务码不是200的请求计为失败；
+   所有接口轮流压测 --rounds 轮，每个接口取各轮中最好的结果，减少机器波动的影响
+4. 结果保存为JSON（默认 benchmarks/results/），与基准结果比较，
+   p50/p95变慢或吞吐量下降超过 --tolerance、失败数增加时以非0状态退出
+
+用法:
+    python -m benchmarks.bench_load [--users 2000] [--blessings-per-receiver 20] [--verifications 1000]
+                                    [--concurrency 8] [--requests 300] [--rounds 3] [--workers 2]
+                                    [--routes /api/test,...]
+    python -m benchmarks.bench_load --save-baseline         # 将本次结果保存为基准
+    python -m benchmarks.bench_load --compare <结果.json>   # 不压测，只比较已有结果与基准
+
+基准结果与机器有关，换机器后需要先用 --save-baseline 重新生成
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+import benchmarks  # noqa: F401  设置测试环境变量
+from benchmarks.bench_async_auth import FakeWeChat, encrypt_login_phone, LOGIN_IV
+from benchmarks.bench_workers import start_gunicorn, free_port, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'load_baseline.json')
+
+# 祝福内容，不包含敏感词
+CONTENTS = ['祝你天天开心', '新年快乐，万事如意', '今天特别想你', '生日快乐，愿你被温柔以待', '早点休息，晚安']
+
+
+def user_openid(i):
+    return f'load-user-{i}'
+
+
+def user_phone(i):
+    return f'139{i:08d}'
+
+
+def verification_phone(i):
+    return f'137{i:08d}'
+
+
+def verification_code(i):
+    return f'{i * 7919 % 1000000:06d}'
+
+
+def blessing_sender(index, per_receiver, users):
+    """第index条祝福（从0开始，id为index+1）的发送者序号，每个用户发出和收到的祝福一样多"""
+    receiver, k = divmod(index, per_receiver)
+    return (receiver + k + 1) % users
+
+
+def seed(users, per_receiver, verifications, chunk_size=5000):
+    """在DATABASE_URL指向的空数据库中生成测试数据，返回各表行数"""
+    from sqlalchemy import insert
+    from app.app import app
+    from app.extensions import db
+    from app.models import User, BlessingMessage, SmsVerification
+    from app.routes import crypto_util
+
+    rng = random.Random(0)
+    now = datetime.utcnow()
+
+    def insert_chunks(model, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                db.session.execute(insert(model), chunk)
+                chunk = []
+        if chunk:
+            db.session.execute(insert(model), chunk)
+
+    with app.app_context():
+        db.create_all()
+        # 每个用户的手机号只加密一次，作为接收者时复用
+        encrypted = [crypto_util.encrypt(user_phone(i)) for i in range(users)]
+        hashes = [crypto_util.blind_index(user_phone(i)) for i in range(users)]
+        insert_chunks(User, ({'openid': user_openid(i), 'phone_number': encrypted[i], 'phone_hash': hashes[i],
+                              'nick_name': f'用户{i}', 'created_at': now - timedelta(days=30)}
+                             for i in range(users)))
+        insert_chunks(BlessingMessage, ({'id': index + 1,
+                                         'sender_openid': user_openid(blessing_sender(index, per_receiver, users)),
+                                         'receiver_phone': encrypted[index // per_receiver],
+                                         'receiver_phone_hash': hashes[index // per_receiver],
+                                         'content': rng.choice(CONTENTS),
+                                         'sent_at': now - timedelta(seconds=rng.randrange(30 * 86400)),
+                                         'status': 'sent', 'is_deleted': False}
+                                        for index in range(users * per_receiver)))
+        insert_chunks(SmsVerification, ({'phone_number': crypto_util.encrypt(verification_phone(i)),
+                                         'phone_hash': crypto_util.blind_index(verification_phone(i)),
+                                         'verification_code': verification_code(i), 'created_at': now,
+                                         'expires_at': now + timedelta(days=1), 'used': False}
+                                        for i in range(verifications)))
+        db.session.commit()
+    return {'users': users, 'blessing_messages': users * per_receiver, 'sms_verifications': verifications}
+
+
+def build_scenarios(users, per_receiver, sender_daily_limit):
+    """每个接口的请求构造函数：第i个请求 -> (方法, 路径, JSON请求体, 请求头)
+
+    写接口每个请求使用不同的手机号、IP或发送者，不触发限流；验证码和祝福按序号依次使用
+    """
+    login_data = encrypt_login_phone('13812345678')
+    blessings = users * per_receiver
+
+    def delete_blessing(i):
+        index = i % blessings
+        return ('POST', '/api/blessing/delete',
+                {'id': index + 1, 'openid': user_openid(blessing_sender(index, per_receiver, users))}, None)
+
+    return {
+        '/api/test': lambda i: ('GET', '/api/test', None, None),
+        '/api/wx/get_openid': lambda i: ('GET', f'/api/wx/get_openid?code=load{i}', None, None),
+        '/api/wx/login': lambda i: ('POST', '/api/wx/login',
+                                    {'code': f'load{i}', 'encryptedData': login_data, 'iv': LOGIN_IV}, None),
+        '/api/wx/phone': lambda i: ('GET', f'/api/wx/phone?code=load{i}&openid=openid-load{i}', None, None),
+        '/api/sms/send-code': lambda i: ('POST', '/api/sms/send-code', {'phone': f'136{i:08d}'},
+                                         {'X-Real-IP': f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'}),
+        '/api/sms/verify-code': lambda i: ('POST', '/api/sms/verify-code',
+                                           {'phone': verification_phone(i), 'code': verification_code(i)}, None),
+        '/metrics': lambda i: ('GET', '/metrics', None, None),
+        '/api/blessing/templates': lambda i: ('GET', '/api/blessing/templates', None, None),
+        '/api/blessing/check-limit': lambda i: ('POST', '/api/blessing/check-limit',
+                                                {'sender_openid': user_openid(i % users),
+                                                 'receiver_phone': user_phone((i + 1) % users)}, None),
+        '/api/blessing/received': lambda i: ('GET', f'/api/blessing/received?phone={user_phone(i % users)}',
+                                             None, None),
+        '/api/blessing/delete': delete_blessing,
+        '/api/blessing/send': lambda i: ('POST', '/api/blessing/send',
+                                         {'sender_openid': user_openid(i // sender_daily_limit % users),
+                                          'sender_nickname': f'用户{i // sender_daily_limit % users}',
+                                          'receiver_phone': f'135{i:08d}', 'content': CONTENTS[i % len(CONTENTS)]},
+                                         None),
+        '/api/user/phone': lambda i: ('GET', f'/api/user/phone?openid={user_openid(i % users)}', None, None),
+        '/api/user/sent-blessings': lambda i: ('GET', f'/api/user/sent-blessings?openid={user_openid(i % users)}',
+                                               None, None),
+    }
+
+
+def business_code(response):
+    """HTTP状态码不是200时返回http<状态码>，JSON响应返回code字段（没有时为200），其他响应返回200"""
+    if response.status_code != 200:
+        return f'http{response.status_code}'
+    if response.headers.get('Content-Type', '').startswith('application/json'):
+        return str(response.json().get('code', 200))
+    return '200'
+
+
+def run_pass(base_url, build, start, stop, concurrency):
+    """concurrency个客户端发送序号为[start, stop)的请求，返回(耗时, 各请求耗时, 各业务码次数)"""
+    counter = itertools.count(start)
+    latencies = []
+    codes = {}
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        local_latencies = []
+        local_codes = {}
+        while True:
+            i = next(counter)
+            if i >= stop:
+                break
+            method, path, body, headers = build(i)
+            started = time.perf_counter()
+            try:
+                code = business_code(session.request(method, base_url + path, json=body, headers=headers, timeout=30))
+            except (requests.RequestException, ValueError):
+                code = 'error'
+            local_latencies.append(time.perf_counter() - started)
+            local_codes[code] = local_codes.get(code, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for code, count in local_codes.items():
+                codes[code] = codes.get(code, 0) + count
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies), codes
+
+
+def summarize(passes):
+    """多轮结果合并：取各轮中最好的延迟和吞吐量（减少机器波动的影响），失败数和业务码累加"""
+    codes = {}
+    for _, _, pass_codes in passes:
+        for code, count in pass_codes.items():
+            codes[code] = codes.get(code, 0) + count
+    return {
+        'requests': sum(len(latencies) for _, latencies, _ in passes),
+        'errors': sum(value for code, value in codes.items() if code != '200'),
+        'codes': dict(sorted(codes.items())),
+        'rps': round(max(len(latencies) / elapsed for elapsed, latencies, _ in passes), 1),
+        'mean_ms': round(min(sum(latencies) / len(latencies) for _, latencies, _ in passes) * 1000, 2),
+        'p50_ms': round(min(percentile(latencies, 0.5) for _, latencies, _ in passes) * 1000, 2),
+        'p95_ms': round(min(percentile(latencies, 0.95) for _, latencies, _ in passes) * 1000, 2),
+        'p99_ms': round(min(percentile(latencies, 0.99) for _, latencies, _ in passes) * 1000, 2),
+        'max_ms': round(max(latencies[-1] for _, latencies, _ in passes) * 1000, 2),
+    }
+
+
+def git_revision():
+    """当前提交和工作区是否有未提交的修改，不是git仓库时返回(None, None)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD'], cwd=ROOT).returncode != 0
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def compare(result, baseline, tolerance, min_delta_ms):
+    """与基准结果比较，返回退化项的说明列表"""
+    regressions = []
+    for route, current in result['routes'].items():
+        old = baseline['routes'].get(route)
+        if old is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if current[key] > old[key] * (1 + tolerance) and current[key] - old[key] > min_delta_ms:
+                regressions.append(f'{route} {key[:3]} {old[key]:.1f}ms -> {current[key]:.1f}ms')
+        if current['rps'] < old['rps'] * (1 - tolerance):
+            regressions.append(f"{route} 吞吐量 {old['rps']:.0f} -> {current['rps']:.0f} req/s")
+        if current['errors'] > old['errors']:
+            regressions.append(f"{route} 失败 {old['errors']} -> {current['errors']}（{current['codes']}）")
+    return regressions
+
+
+def print_report(result, baseline):
+    print(f"{'接口':<28} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'失败':>5}  p95对比基准")
+    for route, stats in result['routes'].items():
+        old = (baseline or {}).get('routes', {}).get(route)
+        change = f"{(stats['p95_ms'] / old['p95_ms'] - 1) * 100:+.0f}%" if old and old['p95_ms'] else '-'
+        print(f"{route:<28} {stats['rps']:>7.0f} {stats['p50_ms']:>6.1f}ms {stats['p95_ms']:>6.1f}ms "
+              f"{stats['p99_ms']:>6.1f}ms {stats['errors']:>5}  {change}")
+
+
+def check_baseline(result, baseline_path, tolerance, min_delta_ms):
+    """打印结果并与基准比较，有退化时返回False"""
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if result.get('uncovered'):
+        print(f"没有压测场景的接口: {', '.join(result['uncovered'])}")
+    if baseline is None:
+        print(f'没有基准结果（{baseline_path}），可用 --save-baseline 保存本次结果为基准')
+        return True
+
+    if baseline['params'] != result['params']:
+        print(f"注意：压测参数与基准不同，比较结果仅供参考\n  基准: {baseline['params']}\n  本次: {result['params']}")
+    regressions = compare(result, baseline, tolerance, min_delta_ms)
+    print(f"基准: {baseline.get('commit')} {baseline.get('time')}，容差 {tolerance:.0%}")
+    if not regressions:
+        print('与基准相比没有退化')
+        return True
+    print('与基准相比退化:')
+    for item in regressions:
+        print(f'  {item}')
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全部接口的压测')
+    parser.add_argument('--users', type=int, default=2000, help='用户数，每个用户同时是接收者')
+    parser.add_argument('--blessings-per-receiver', type=int, default=20, help='每个接收者收到的祝福数')
+    parser.add_argument('--verifications', type=int, default=1000, help='未使用的短信验证码数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=300, help='每个接口每轮统计的请求数')
+    parser.add_argument('--rounds', type=int, default=3, help='所有接口轮流压测的轮数，每个接口取最好的一轮')
+    parser.add_argument('--warmup', type=int, default=20, help='每个接口预热的请求数，不计入统计')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker进程数')
+    parser.add_argument('--worker-class', default='gthread', help='gunicorn运行模式')
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='模拟微信接口耗时（秒）')
+    parser.add_argument('--routes', help='只压测这些接口，逗号分隔')
+    parser.add_argument('--no-sms-worker', action='store_true', help='不启动短信worker')
+    parser.add_argument('--output', help='结果文件，默认 benchmarks/results/load-<时间>-<提交>.json')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基准结果文件')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基准')
+    parser.add_argument('--compare', metavar='RESULT', help='不压测，只比较已有结果与基准')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='允许的p50/p95变慢和吞吐量下降比例')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='延迟增加小于该值（毫秒）时不算退化')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            result = json.load(f)
+        sys.exit(0 if check_baseline(result, args.baseline, args.tolerance, args.min_delta_ms) else 1)
+
+    # 应用读取的环境变量需在导入app之前设置，gunicorn和短信worker继承同样的环境变量
+    fake = FakeWeChat(args.upstream_latency)
+    workdir = tempfile.mkdtemp(prefix='beslove-bench-load-')
+    os.environ.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'load.db'),
+        'WX_API_BASE_URL': f'http://127.0.0.1:{fake.port}',
+        'WX_TOKEN_STORE_PATH': os.path.join(workdir, 'wx_access_token.json'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'SMS_BACKEND': 'fake',
+        'BLESSING_SMS_ENABLED': 'true',
+        'PROFILING_ENABLED': 'false',
+    })
+
+    from app.app import app
+    from app.config import Config
+
+    scenarios = build_scenarios(args.users, args.blessings_per_receiver, Config.SENDER_DAILY_LIMIT)
+    # 每个验证码只能验证一次，每个发送者24小时内只能发送SENDER_DAILY_LIMIT条
+    needed = args.warmup + args.rounds * args.requests
+    if args.verifications < needed:
+        parser.error(f'--verifications 至少为 {needed}')
+    if args.users * Config.SENDER_DAILY_LIMIT < needed:
+        parser.error(f'--users 至少为 {-(-needed // Config.SENDER_DAILY_LIMIT)}')
+    rules = [rule.rule for rule in app.url_map.iter_rules() if rule.endpoint.startswith('api.')]
+    uncovered = sorted(rule for rule in rules if rule not in scenarios)
+    selected = args.routes.split(',') if args.routes else list(scenarios)
+    unknown = [route for route in selected if route not in scenarios]
+    if unknown:
+        parser.error(f"没有这些接口的压测场景: {', '.join(unknown)}")
+
+    started = time.perf_counter()
+    rows = seed(args.users, args.blessings_per_receiver, args.verifications)
+    print(f'生成测试数据 {rows}，耗时 {time.perf_counter() - started:.1f}s')
+
+    env = dict(os.environ)
+    port = free_port()
+    server = start_gunicorn(args.worker_class, args.workers, port, env)
+    sms_worker = None
+    if not args.no_sms_worker:
+        sms_worker = subprocess.Popen([sys.executable, 'sms_worker.py', '--backend', 'fake'], cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    print(f'gunicorn {args.worker_class} {args.workers}个worker，并发客户端 {args.concurrency}，'
+          f'每个接口 {args.rounds} 轮各 {args.requests} 个请求，微信接口耗时 {args.upstream_latency * 1000:.0f}ms')
+
+    # 每个请求序号只使用一次：先预热，之后每轮使用新的序号
+    base_url = f'http://127.0.0.1:{port}'
+    passes = {route: [] for route in selected}
+    try:
+        for route in selected:
+            run_pass(base_url, scenarios[route], 0, args.warmup, args.concurrency)
+        for n in range(args.rounds):
+            start = args.warmup + n * args.requests
+            for route in selected:
+                passes[route].append(run_pass(base_url, scenarios[route], start, start + args.requests,
+                                              args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+        if sms_worker:
+            sms_worker.terminate()
+            sms_worker.wait()
+
+    with app.app_context():
+        from app.extensions import db
+        from app.models import SmsOutbox
+        outbox = dict(db.session.query(SmsOutbox.status, db.func.count()).group_by(SmsOutbox.status).all())
+
+    commit, dirty = git_revision()
+    result = {
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'params': {
+            'users': args.users, 'blessings_per_receiver': args.blessings_per_receiver,
+            'verifications': args.verifications, 'concurrency': args.concurrency, 'requests': args.requests,
+            'rounds': args.rounds, 'warmup': args.warmup, 'workers': args.workers, 'worker_class': args.worker_class,
+            'upstream_latency': args.upstream_latency, 'sms_worker': not args.no_sms_worker,
+        },
+        'sms_outbox': outbox,
+        'uncovered': uncovered,
+        'routes': {route: summarize(route_passes) for route, route_passes in passes.items()},
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    for path in [output] + ([args.baseline] if args.save_baseline else []):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f'结果已保存: {output}' + (f'，并保存为基准 {args.baseline}' if args.save_baseline else ''))
+    print(f'短信队列: {outbox}')
+
+    if args.save_baseline:
+        print_report(result, None)
+        return
+    sys.exit(0 if check_baseline(result, args.baseline, args.tolerance, args.min_delta_ms) else 1)
+
+
+if __name__ == "__main__":
+    main()
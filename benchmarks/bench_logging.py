@@ -0,0 +1,102 @@
+"""日志基准：多线程写日志时调用方的耗时
+
+对比原来的 同步RotatingFileHandler + 控制台处理器 + f-string，
+以及 app.logging_config 的异步处理器（JSON、脱敏，可选抽样）:
+    python -m benchmarks.bench_logging [--threads 8] [--requests 2000] [--interval 2] [--sample 0.1]
+
+每个线程模拟处理请求：每个请求写2条日志，请求之间间隔interval毫秒。
+日志写到临时目录，控制台输出丢弃；统计调用logger.info的平均和p99耗时，
+异步处理器另外统计写完队列的时间和队列满丢弃的条数
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import benchmarks  # noqa: F401  设置测试环境变量
+from app.logging_config import LOG_FORMAT, SamplingFilter, create_log_handler
+from app.metrics import metrics
+
+# 与 微信登录 接口相同结构的日志参数
+WX_RESULT = {'openid': 'oAbCdEfGhIjKlMnOpQrStUvWx00001', 'session_key': 'tiihtNczf5v6AKRyjwEUhQ==', 'unionid': None}
+
+
+def legacy_handlers(log_dir, devnull):
+    file_handler = RotatingFileHandler(os.path.join(log_dir, 'legacy.log'), maxBytes=10*1024*1024, backupCount=5)
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    console_handler = logging.StreamHandler(devnull)
+    console_handler.setLevel(logging.DEBUG)
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return [file_handler, console_handler]
+
+
+def run(logger, threads, requests, interval, eager):
+    """返回每个请求中写日志的耗时（秒）"""
+    durations = []
+
+    def worker(index):
+        local = []
+        for i in range(requests):
+            started = time.perf_counter()
+            if eager:
+                logger.info(f'微信登录，调用微信API返回: {WX_RESULT}')
+                logger.info(f'微信登录成功，openid: oAbC{index}{i}, 手机号: 13812345678')
+            else:
+                logger.info('微信登录，调用微信API返回: %s', WX_RESULT)
+                logger.info('微信登录成功，openid: oAbC%s%s, 手机号: %s', index, i, '13812345678')
+            local.append(time.perf_counter() - started)
+            time.sleep(interval)
+        durations.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sorted(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日志基准')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000, help='每个线程的请求数，每个请求写2条日志')
+    parser.add_argument('--interval', type=float, default=2, help='请求间隔（毫秒）')
+    parser.add_argument('--sample', type=float, default=0.1, help='抽样场景的保留比例')
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix='beslove-bench-')
+    devnull = open(os.devnull, 'w')
+    print(f'{args.threads}个线程，每个线程{args.requests}个请求，每个请求写2条日志:')
+
+    scenarios = [('原实现（同步处理器 + f-string）', legacy_handlers(log_dir, devnull), True, None),
+                 ('异步处理器', [create_log_handler(os.path.join(log_dir, 'async'), devnull)], False, None),
+                 (f'异步处理器 + 抽样{args.sample}', [create_log_handler(os.path.join(log_dir, 'sampled'), devnull)], False, args.sample)]
+    for name, handlers, eager, sample in scenarios:
+        logger = logging.getLogger(f'bench.{len(name)}')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for handler in handlers:
+            if sample is not None:
+                handler.filters = [SamplingFilter({logger.name: sample})]
+            logger.addHandler(handler)
+
+        dropped = metrics.snapshot()['counters'].get(('log_records_dropped', ()), 0)
+        durations = run(logger, args.threads, args.requests, args.interval / 1000, eager)
+        mean = sum(durations) / len(durations)
+        p99 = durations[int(len(durations) * 0.99)]
+        line = f'  {name}: 每个请求写日志 平均{mean * 1e6:.0f}us，p99 {p99 * 1e6:.0f}us'
+        handler = handlers[0]
+        if hasattr(handler, 'stop'):
+            started = time.perf_counter()
+            handler.stop()
+            dropped = metrics.snapshot()['counters'].get(('log_records_dropped', ()), 0) - dropped
+            line += f'，写完队列 {time.perf_counter() - started:.2f}s，丢弃{dropped:.0f}条'
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
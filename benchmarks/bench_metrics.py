@@ -0,0 +1,73 @@
+"""指标采集开销基准：每个请求统计请求数、耗时直方图和SQL条数的额外耗时
+
+用法:
+    python -m benchmarks.bench_metrics [--requests 20000] [--budget 30]
+
+- 直接调用请求前后的统计函数，测量每个请求的采集开销，超过预算（微秒）时以非0状态退出
+- 对比开启和关闭 METRICS_ENABLED 时 /api/test 的耗时
+- 测量汇总并输出 /metrics 的耗时
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import benchmarks  # noqa: F401  设置测试环境变量
+
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='beslove-bench-metrics-'))
+
+
+def timed(func, count):
+    func()
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指标采集开销基准')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--budget', type=float, default=30, help='每个请求采集开销的预算（微秒）')
+    args = parser.parse_args()
+
+    from flask import g
+    from app import create_app
+    from app.metrics_export import _before_request, _after_request, metrics_exporter
+    from app.routes import bp  # noqa: F401
+
+    db_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='beslove-bench-'), 'bench.db')
+    enabled = create_app({'SQLALCHEMY_DATABASE_URI': db_uri})
+    disabled = create_app({'SQLALCHEMY_DATABASE_URI': db_uri, 'METRICS_ENABLED': False})
+
+    # 请求前后的统计函数，模拟一个执行了3条SQL的请求
+    response = enabled.response_class('ok')
+    with enabled.test_request_context('/api/user/phone?openid=o1'):
+        def hooks():
+            _before_request()
+            g.sql_queries, g.sql_seconds = 3, 0.0005
+            _after_request(response)
+        overhead = timed(hooks, args.requests)
+    print(f'每个请求的采集开销: {overhead:.1f}us（预算 {args.budget:.0f}us）')
+
+    # 整个请求的耗时，交替测量减少波动
+    results = {'开启': [], '关闭': []}
+    for _ in range(3):
+        for name, app in (('开启', enabled), ('关闭', disabled)):
+            client = app.test_client()
+            results[name].append(timed(lambda: client.get('/api/test'), args.requests // 10))
+    for name, values in results.items():
+        print(f'/api/test 指标{name}: {min(values):.0f}us')
+
+    client = enabled.test_client()
+    series = len(metrics_exporter.metrics.snapshot()['counters']) + len(metrics_exporter.metrics.snapshot()['timings'])
+    print(f'/metrics 汇总并输出{series}个序列: {timed(lambda: client.get("/metrics"), 200):.0f}us')
+
+    if overhead > args.budget:
+        print('采集开销超过预算')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""请求性能分析开销基准
+
+对比 /api/user/phone 在以下情况下的耗时:
+- 关闭性能分析（不注册任何钩子）
+- 开启慢请求采样（每个请求都被采样线程观察，未超过阈值不保存）
+- 带 X-Profile 请求头，用cProfile分析并保存结果
+用法:
+    python -m benchmarks.bench_profiling [--requests 2000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import benchmarks  # noqa: F401  设置测试环境变量
+
+
+def timed(func, count):
+    func()
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='请求性能分析开销基准')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.extensions import db
+
+    work_dir = tempfile.mkdtemp(prefix='beslove-bench-')
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(work_dir, 'bench.db'),
+              'PROFILING_DIR': os.path.join(work_dir, 'profiles'), 'PROFILING_TOKEN': 'bench'}
+    apps = {
+        '关闭': create_app(dict(config, PROFILING_ENABLED=False)),
+        '慢请求采样': create_app(dict(config, PROFILING_ENABLED=True, PROFILING_SLOW_THRESHOLD=1.0)),
+    }
+    with apps['关闭'].app_context():
+        db.create_all()
+
+    # 交替测量减少波动
+    results = {name: [] for name in apps}
+    for _ in range(3):
+        for name, app in apps.items():
+            client = app.test_client()
+            results[name].append(timed(lambda: client.get('/api/user/phone?openid=bench'), args.requests))
+    for name, values in results.items():
+        print(f'{name}: {min(values):.0f}us')
+
+    client = apps['慢请求采样'].test_client()
+    profiled = timed(lambda: client.get('/api/user/phone?openid=bench', headers={'X-Profile': 'bench'}), 50)
+    print(f'X-Profile（cProfile并保存结果）: {profiled:.0f}us')
+
+
+if __name__ == "__main__":
+    main()
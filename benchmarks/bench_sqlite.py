@@ -0,0 +1,110 @@
+"""SQLite并发读写基准：默认设置 vs WAL调优参数
+
+模拟多个gunicorn worker进程同时读写同一个数据库文件：
+每个进程按比例执行 收到的祝福列表查询（读）和 插入祝福（写），
+统计吞吐量、延迟和 database is locked 错误数。
+
+用法:
+    python -m benchmarks.bench_sqlite [--processes 9] [--seconds 10] [--write-ratio 0.2]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+import benchmarks  # noqa: F401  设置测试环境变量
+
+RECEIVERS = 200
+
+
+def worker(db_url, tuning, seconds, write_ratio, seed, results):
+    """在独立进程中导入应用并持续读写，结果放入results队列"""
+    os.environ['DATABASE_URL'] = db_url
+    os.environ['SQLITE_TUNING'] = 'true' if tuning else 'false'
+    from sqlalchemy.exc import OperationalError
+    from app.app import app, db
+    from app.models import BlessingMessage
+
+    rng = random.Random(seed)
+    reads = writes = errors = 0
+    latencies = []
+    with app.app_context():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            receiver = f'receiver-{rng.randrange(RECEIVERS)}'
+            started = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    db.session.add(BlessingMessage(sender_openid='bench', receiver_phone='enc',
+                                                   receiver_phone_hash=receiver, content='祝你天天开心'))
+                    db.session.commit()
+                    writes += 1
+                else:
+                    BlessingMessage.query.filter_by(receiver_phone_hash=receiver)\
+                        .order_by(BlessingMessage.sent_at.desc()).limit(20).all()
+                    db.session.commit()
+                    reads += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+    results.put((reads, writes, errors, latencies))
+
+
+def prepare(db_url, rows):
+    """建表并写入初始数据"""
+    os.environ['DATABASE_URL'] = db_url
+    from app.app import app, db
+    from app.models import User, BlessingMessage
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(openid='bench', phone_number='enc'))
+        db.session.add_all(BlessingMessage(sender_openid='bench', receiver_phone='enc',
+                                           receiver_phone_hash=f'receiver-{i % RECEIVERS}', content='祝你天天开心')
+                           for i in range(rows))
+        db.session.commit()
+
+
+def run(tuning, processes, seconds, write_ratio, rows):
+    db_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='beslove-bench-'), 'bench.db')
+    ctx = multiprocessing.get_context('spawn')
+    setup = ctx.Process(target=prepare, args=(db_url, rows))
+    setup.start()
+    setup.join()
+
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(db_url, tuning, seconds, write_ratio, i, results))
+             for i in range(processes)]
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    reads = sum(r[0] for r in collected)
+    writes = sum(r[1] for r in collected)
+    errors = sum(r[2] for r in collected)
+    latencies = sorted(latency for r in collected for latency in r[3])
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    return reads, writes, errors, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite并发读写基准')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count() * 2 + 1)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--rows', type=int, default=20000, help='初始祝福条数')
+    args = parser.parse_args()
+
+    print(f'{args.processes}个进程，运行{args.seconds}秒，写比例{args.write_ratio}')
+    for name, tuning in (('默认设置', False), ('WAL调优', True)):
+        reads, writes, errors, p99 = run(tuning, args.processes, args.seconds, args.write_ratio, args.rows)
+        print(f'{name}: 读 {reads / args.seconds:.0f}/s，写 {writes / args.seconds:.0f}/s，'
+              f'database is locked {errors} 次，p99延迟 {p99 * 1000:.1f}ms')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""启动耗时基准：导入应用、第一个请求，以及preload_app下fork出的worker就绪时间
+
+每轮在新的Python进程中测量，取中位数:
+    python -m benchmarks.bench_startup [--rounds 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import benchmarks  # noqa: F401  设置测试环境变量
+
+# 在子进程中执行的测量脚本，输出JSON
+PROBE = r'''
+import json, os, time
+started = time.perf_counter()
+from app.app import app
+imported = time.perf_counter()
+client = app.test_client()
+client.get('/api/blessing/templates')
+first_request = time.perf_counter()
+
+# 模拟preload_app：应用已在当前进程导入，fork出的worker直接处理请求
+read_fd, write_fd = os.pipe()
+fork_started = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    app.test_client().get('/api/blessing/templates')
+    os.write(write_fd, str(time.perf_counter() - fork_started).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+forked_ready = float(os.read(read_fd, 64).decode())
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'preload_worker_ready_ms': forked_ready * 1000,
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用启动耗时基准')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='beslove-bench-'), 'bench.db'))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    samples = []
+    for _ in range(args.rounds):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=root, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f'{args.rounds}轮中位数:')
+    print(f"  导入应用（每个worker不使用preload_app时的启动成本）: {statistics.median(s['import_ms'] for s in samples):.0f}ms")
+    print(f"  第一个请求: {statistics.median(s['first_request_ms'] for s in samples):.1f}ms")
+    print(f"  preload_app下fork出的worker处理完第一个请求: "
+          f"{statistics.median(s['preload_worker_ready_ms'] for s in samples):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""祝福模板接口基准：每次序列化 vs 缓存的响应内容，以及带If-None-Match的304响应
+
+用法:
+    python -m benchmarks.bench_templates [--requests 20000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import benchmarks  # noqa: F401  设置测试环境变量
+
+
+def timed(func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='祝福模板接口基准')
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='beslove-bench-'), 'bench.db'))
+    from app.app import app
+    from app.config import Config
+    from app.blessing_templates import blessing_templates
+
+    with open(Config.BLESSING_TEMPLATES_PATH, 'r', encoding='utf-8') as f:
+        templates = json.load(f)
+
+    def serialize():
+        # 原实现：每次请求构造列表并序列化
+        response_data = {"code": 200, "message": "获取成功", "data": [dict(t) for t in templates]}
+        return json.dumps(response_data, ensure_ascii=False)
+
+    print(f'每次序列化: {timed(serialize, args.requests):.1f}us')
+    print(f'缓存的响应内容: {timed(blessing_templates.get, args.requests):.2f}us')
+
+    client = app.test_client()
+    response = client.get('/api/blessing/templates')
+    etag = response.headers['ETag']
+    count = args.requests // 4
+    full = timed(lambda: client.get('/api/blessing/templates'), count)
+    not_modified = timed(lambda: client.get('/api/blessing/templates', headers={'If-None-Match': etag}), count)
+    print(f'完整请求 200: {full:.0f}us，{len(response.data)}字节')
+    print(f'完整请求 304: {not_modified:.0f}us，0字节')
+
+
+if __name__ == "__main__":
+    main()
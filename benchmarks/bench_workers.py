@@ -0,0 +1,180 @@
+"""gunicorn运行模式压测：sync vs gthread vs gevent
+
+启动一个模拟微信接口的本地服务（每个请求固定耗时），用相同的worker进程数（相近的内存）
+分别以各模式启动gunicorn，并发请求 /api/wx/get_openid（等待微信接口）和
+/api/blessing/templates（本地处理），对比吞吐量、延迟和worker内存。
+
+需要安装gunicorn，gevent模式需要安装gevent:
+    python -m benchmarks.bench_workers [--workers 2] [--clients 50] [--seconds 10] [--upstream-latency 0.2]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+import requests
+
+import benchmarks  # noqa: F401  设置测试环境变量
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_fake_upstream(latency):
+    """启动模拟微信接口的服务，返回服务实例"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, payload):
+            time.sleep(latency)
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == '/sns/jscode2session':
+                self._reply({'openid': 'bench-openid', 'session_key': 'c2Vzc2lvbmtleQ=='})
+            elif path == '/cgi-bin/token':
+                self._reply({'access_token': 'bench-token', 'expires_in': 7200})
+            else:
+                self._reply({'errcode': 404})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            self._reply({'errcode': 0, 'phone_info': {'phoneNumber': '13812345678'}})
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def worker_rss_mb(master_pid):
+    """master下所有worker进程的常驻内存之和（MB）"""
+    total = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            continue
+        if int(status.get('PPid', '0').strip()) == master_pid:
+            total += int(status['VmRSS'].split()[0])
+    return total / 1024
+
+
+def start_gunicorn(mode, workers, port, env):
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'app/gunicorn_config.py',
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+               '--access-logfile', '/dev/null', '--error-logfile', '-', '--log-level', 'warning',
+               'app.app:app']
+    process = subprocess.Popen(command, cwd=ROOT, env=dict(env, GUNICORN_WORKER_CLASS=mode),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/api/test', timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'gunicorn {mode} 启动失败')
+
+
+def run_load(port, clients, seconds, io_ratio):
+    """clients个并发客户端持续请求seconds秒，返回(各请求耗时, 失败数)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        local_latencies = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            if rng.random() < io_ratio:
+                url = f'http://127.0.0.1:{port}/api/wx/get_openid?code=bench'
+            else:
+                url = f'http://127.0.0.1:{port}/api/blessing/templates'
+            started = time.perf_counter()
+            try:
+                response = session.get(url, timeout=30)
+                if response.status_code != 200 or response.json().get('code', 200) != 200:
+                    local_errors += 1
+            except requests.RequestException:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0]
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gunicorn运行模式压测')
+    parser.add_argument('--modes', default='sync,gthread,gevent')
+    parser.add_argument('--workers', type=int, default=2, help='各模式相同的worker进程数')
+    parser.add_argument('--clients', type=int, default=50, help='并发客户端数')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--upstream-latency', type=float, default=0.2, help='模拟微信接口耗时（秒）')
+    parser.add_argument('--io-ratio', type=float, default=0.8, help='请求微信接口的请求比例')
+    args = parser.parse_args()
+
+    upstream = start_fake_upstream(args.upstream_latency)
+    env = dict(os.environ)
+    env['WX_API_BASE_URL'] = f'http://127.0.0.1:{upstream.server_address[1]}'
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='beslove-bench-'), 'bench.db'))
+
+    print(f'worker进程数 {args.workers}，并发客户端 {args.clients}，微信接口耗时 {args.upstream_latency * 1000:.0f}ms，'
+          f'等待微信接口的请求占 {args.io_ratio:.0%}')
+    for mode in args.modes.split(','):
+        port = free_port()
+        process = start_gunicorn(mode, args.workers, port, env)
+        try:
+            latencies, errors = run_load(port, args.clients, args.seconds, args.io_ratio)
+            rss = worker_rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f'{mode:8s} {len(latencies) / args.seconds:7.1f} req/s  p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  '
+              f'p99 {percentile(latencies, 0.99) * 1000:7.1f}ms  失败 {errors}  worker内存 {rss:.0f}MB')
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
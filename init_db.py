@@ -8,11 +8,9 @@ def init_database():
         print("数据库初始化成功，所有表已创建")
         
         # 检查users表结构
-        with db.engine.connect() as conn:
-            result = conn.execute(db.text("PRAGMA table_info(users);")).fetchall()
-            print("\nUsers表结构:")
-            for row in result:
-                print(f"列名: {row[1]}, 类型: {row[2]}, 是否可为空: {row[3]}, 默认值: {row[4]}")
+        print("\nUsers表结构:")
+        for column in db.inspect(db.engine).get_columns('users'):
+            print(f"列名: {column['name']}, 类型: {column['type']}, 是否可为空: {column['nullable']}, 默认值: {column['default']}")
 
 if __name__ == "__main__":
     init_database()
@@ -0,0 +1,47 @@
+"""过期数据清理
+
+删除过期验证码、已完成的短信队列消息和过期限流计数，归档超过保留期的祝福消息，
+并回收数据库空闲空间。可由cron定时执行，也可在sms_worker中以后台线程运行（MAINTENANCE_INTERVAL）:
+    python maintenance.py                              # 执行一次清理并打印报告
+    python maintenance.py --lock-slice 0.1             # 单个写事务不超过0.1秒
+    python maintenance.py --enable-incremental-vacuum  # 一次性切换为增量vacuum（需停服）
+"""
+import argparse
+
+from app.app import app
+from app.maintenance import MaintenanceRunner, enable_incremental_vacuum
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BesLove 过期数据清理')
+    parser.add_argument('--batch-size', type=int, default=None, help='每批最多删除的行数')
+    parser.add_argument('--lock-slice', type=float, default=None, help='单个写事务的目标最长耗时（秒）')
+    parser.add_argument('--archive-dir', default=None, help='祝福消息归档目录')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='切换为incremental auto_vacuum并执行一次完整VACUUM（需停服）')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.enable_incremental_vacuum:
+            enabled = enable_incremental_vacuum()
+            print('已启用incremental auto_vacuum' if enabled else '启用失败，请检查数据库类型')
+            return
+
+        runner = MaintenanceRunner(batch_size=args.batch_size, lock_slice=args.lock_slice,
+                                   archive_dir=args.archive_dir)
+        report = runner.run()
+
+    if report is None:
+        print('其他进程正在执行数据清理，本次跳过')
+        return
+    print(f"删除过期验证码: {report['sms_verifications']} 行")
+    print(f"删除短信队列消息: {report['sms_outbox']} 行")
+    print(f"删除限流计数: {report['rate_limit_counters']} 行")
+    print(f"归档祝福消息: {report['blessing_messages']} 行" +
+          (f"，归档文件: {report['archive_file']}" if report['archive_file'] else ''))
+    print(f"回收空间: {report['bytes_reclaimed'] / 1024:.1f} KB")
+    print(f"耗时: {report['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
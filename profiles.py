@@ -0,0 +1,113 @@
+"""请求性能分析结果查看
+
+开启 PROFILING_ENABLED 后，慢请求和带 X-Profile 请求头的请求的分析结果保存在 PROFILING_DIR 中:
+    python profiles.py list                    # 列出最近的分析结果
+    python profiles.py show 20240214-083000    # 显示调用树和SQL（id可以只写前缀或末尾的序号）
+    python profiles.py show <id> --min-percent 5 --json
+    python profiles.py clear                   # 删除所有分析结果
+"""
+import argparse
+import json
+import os
+import sys
+
+from app.profiling import profile_store
+
+# 项目根目录，显示文件路径时省略
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def short_path(path):
+    """省略项目目录和site-packages之前的路径"""
+    if '/site-packages/' in path:
+        return path.split('/site-packages/', 1)[1]
+    if path.startswith(PROJECT_DIR + os.sep):
+        return path[len(PROJECT_DIR) + 1:]
+    return path
+
+
+def print_tree(node, total, min_percent, depth=0):
+    for child in node['children']:
+        percent = child['seconds'] / total * 100 if total else 0
+        if percent < min_percent:
+            continue
+        location = f"{short_path(child['file'])}:{child['line']}" if child['line'] else short_path(child['file'])
+        print(f"{'  ' * depth}{child['seconds'] * 1000:8.1f}ms {percent:5.1f}%  {child['function']}  {location}")
+        print_tree(child, total, min_percent, depth + 1)
+
+
+def list_captures(args):
+    ids = profile_store.ids()[-args.limit:]
+    if not ids:
+        print(f'没有分析结果（{profile_store.directory}）')
+        return
+    print(f"{'id':<30} {'耗时':>9} {'SQL':>4}  {'触发':<6} {'状态':<4} 请求")
+    for capture_id in ids:
+        capture = profile_store.load(capture_id)
+        if capture is None:
+            continue  # 列出之后被其他进程轮转删除
+        sql_seconds = sum(item['seconds'] for item in capture['sql'])
+        print(f"{capture_id:<30} {capture['seconds'] * 1000:7.1f}ms {len(capture['sql']):>4}  "
+              f"{capture['trigger']:<6} {capture['status']:<4} {capture['method']} {capture['path']}"
+              f"（SQL {sql_seconds * 1000:.1f}ms）")
+
+
+def show_capture(args):
+    capture = profile_store.load(args.id)
+    if capture is None:
+        print(f'找不到分析结果: {args.id}（id不存在或前缀不唯一）')
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(capture, ensure_ascii=False, indent=2))
+        return
+
+    query = f"?{capture['query']}" if capture['query'] else ''
+    print(f"{capture['id']}  {capture['time']}  进程{capture['process']}")
+    print(f"{capture['method']} {capture['path']}{query}  状态{capture['status']} 业务码{capture['code']}  "
+          f"耗时{capture['seconds'] * 1000:.1f}ms  触发: {capture['trigger']}（{capture['mode']}）")
+
+    tree = capture['tree']
+    print(f"\n调用树（{'cProfile' if capture['mode'] == 'cprofile' else '采样'}，省略占比低于{args.min_percent}%的调用）:")
+    print_tree(tree, tree['seconds'], args.min_percent)
+
+    sql = capture['sql']
+    print(f"\nSQL {len(sql)}条，共{sum(item['seconds'] for item in sql) * 1000:.1f}ms:")
+    for item in sql:
+        print(f"  {item['seconds'] * 1000:7.2f}ms  {' '.join(item['statement'].split())}")
+
+    if capture.get('functions'):
+        print('\n自身耗时最多的函数:')
+        print(f"  {'自身':>9} {'累计':>9} {'调用次数':>8}  函数")
+        for item in capture['functions'][:args.top]:
+            print(f"  {item['self_seconds'] * 1000:7.2f}ms {item['cumulative_seconds'] * 1000:7.2f}ms {item['calls']:>8}  "
+                  f"{item['function']}  {short_path(item['file'])}:{item['line']}")
+
+
+def clear_captures(args):
+    print(f'已删除 {profile_store.clear()} 个分析结果')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BesLove 请求性能分析结果')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='列出最近的分析结果')
+    list_parser.add_argument('--limit', type=int, default=20)
+    list_parser.set_defaults(func=list_captures)
+
+    show_parser = subparsers.add_parser('show', help='显示调用树、SQL和耗时最多的函数')
+    show_parser.add_argument('id')
+    show_parser.add_argument('--min-percent', type=float, default=1.0, help='省略占比低于该值的调用')
+    show_parser.add_argument('--top', type=int, default=15, help='显示自身耗时最多的函数个数（cProfile）')
+    show_parser.add_argument('--json', action='store_true', help='输出原始JSON')
+    show_parser.set_defaults(func=show_capture)
+
+    clear_parser = subparsers.add_parser('clear', help='删除所有分析结果')
+    clear_parser.set_defaults(func=clear_captures)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
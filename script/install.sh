@@ -140,8 +140,10 @@ cat > $GUNICORN_CONFIG << 'EOF'
 import multiprocessing
 
 bind = "0.0.0.0:5000"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# 每个进程用多个线程处理请求，等待微信接口返回期间可以处理其他请求
+worker_class = "gthread"
+workers = multiprocessing.cpu_count() + 1
+threads = 8
 timeout = 30
 accesslog = "/var/log/beslove/access.log"
 errorlog = "/var/log/beslove/error.log"
@@ -169,7 +171,7 @@ User=root
 Group=root
 WorkingDirectory=/opt/beslove
 Environment="PATH=/opt/beslove/venv/bin"
-ExecStart=/opt/beslove/venv/bin/gunicorn -c /opt/beslove/gunicorn_config.py app:app
+ExecStart=/opt/beslove/venv/bin/gunicorn -c /opt/beslove/gunicorn_config.py app.app:app
 Restart=always
 
 [Install]
@@ -0,0 +1,46 @@
+"""短信发送worker
+
+从 sms_outbox 队列中领取短信并调用短信服务发送，与Web服务分开部署:
+    python sms_worker.py                 # 持续运行
+    python sms_worker.py --once          # 发送完当前积压的短信后退出
+    python sms_worker.py --backend fake  # 使用本地假短信客户端
+
+配置了 MAINTENANCE_INTERVAL 时，同时在后台线程中定时执行过期数据清理
+"""
+import argparse
+import signal
+
+from app.app import app
+from app.config import Config
+from app.maintenance import MaintenanceThread
+from app.sms import create_sms_client
+from app.sms_queue import SmsWorker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BesLove 短信发送worker')
+    parser.add_argument('--once', action='store_true', help='处理完当前积压消息后退出')
+    parser.add_argument('--concurrency', type=int, default=None, help='同时发送的短信数')
+    parser.add_argument('--backend', choices=['aliyun', 'fake'], default=None, help='短信客户端')
+    args = parser.parse_args()
+
+    worker = SmsWorker(create_sms_client(args.backend), concurrency=args.concurrency)
+
+    # 收到停止信号后处理完当前批次再退出
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+
+    maintenance = None
+    if Config.MAINTENANCE_INTERVAL and not args.once:
+        maintenance = MaintenanceThread(app, Config.MAINTENANCE_INTERVAL)
+        maintenance.start()
+
+    with app.app_context():
+        worker.run(once=args.once)
+
+    if maintenance:
+        maintenance.stop()
+
+
+if __name__ == "__main__":
+    main()
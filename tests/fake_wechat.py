@@ -0,0 +1,84 @@
+"""可编排的本地模拟微信接口，在后台线程中运行
+
+每个路径可预先排入若干个响应(状态码, JSON, 延迟秒数)，排完后使用默认响应；记录收到的每个请求。
+也可传入respond(方法, 路径, 查询参数, 请求体)按请求内容生成JSON，返回None时按上述规则响应
+"""
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_RESPONSES = {
+    '/sns/jscode2session': {'openid': 'openid-test', 'session_key': 'c2Vzc2lvbmtleQ=='},
+    '/cgi-bin/token': {'access_token': 'token-test', 'expires_in': 7200},
+    '/wxa/business/getuserphonenumber': {'errcode': 0, 'errmsg': 'ok', 'phone_info': {'phoneNumber': '13812345678'}},
+}
+
+
+class FakeWeChatServer:
+
+    def __init__(self, respond=None):
+        self.respond = respond
+        self.calls = []
+        self.delays = {}
+        self._queued = {}
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                request_body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, payload, delay = fake._next_response(self.command, url.path, url.query, request_body)
+                if delay:
+                    time.sleep(delay)
+                body = json.dumps(payload).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    # 客户端已超时断开
+                    pass
+
+            do_GET = do_POST = _handle
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _next_response(self, method, path, query='', body=b''):
+        with self._lock:
+            self.calls.append((method, path))
+            queued = self._queued.get(path)
+            if queued:
+                return queued.pop(0)
+        if self.respond:
+            params = {key: values[0] for key, values in parse_qs(query).items()}
+            payload = self.respond(method, path, params, body)
+            if payload is not None:
+                return 200, payload, self.delays.get(path, 0)
+        return 200, DEFAULT_RESPONSES.get(path, {'errcode': 404}), self.delays.get(path, 0)
+
+    def enqueue(self, path, status=200, payload=None, delay=0):
+        """排入path的下一个响应"""
+        with self._lock:
+            self._queued.setdefault(path, []).append(
+                (status, payload if payload is not None else DEFAULT_RESPONSES.get(path, {}), delay))
+
+    def count(self, path):
+        with self._lock:
+            return sum(1 for _, called in self.calls if called == path)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,84 @@
+"""微信access_token：并发请求和多个worker进程共用同一个token，只请求一次微信接口"""
+import multiprocessing
+import os
+import stat
+import threading
+
+import pytest
+import requests
+
+from app.wechat import AccessTokenManager, wx_client, token_manager
+from tests.fake_wechat import FakeWeChatServer
+
+TOKEN = '/cgi-bin/token'
+PHONE = '/wxa/business/getuserphonenumber'
+WORKERS = 4
+
+
+@pytest.fixture
+def fake():
+    server = FakeWeChatServer()
+    # 拉长刷新token的耗时，保证其他请求在刷新期间到达
+    server.delays[TOKEN] = 0.3
+    yield server
+    server.close()
+
+
+def test_concurrent_phone_requests_fetch_token_once(fake, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(wx_client, 'base_url', fake.url)
+    monkeypatch.setattr(token_manager, 'store_path', str(tmp_path / 'wx_access_token.json'))
+    monkeypatch.setattr(token_manager, 'lock_path', str(tmp_path / 'wx_access_token.json.lock'))
+    monkeypatch.setattr(token_manager, '_cached', None)
+
+    barrier = threading.Barrier(10)
+    codes = []
+
+    def request_phone(n):
+        barrier.wait()
+        codes.append(client.get(f'/api/wx/phone?code=c{n}&openid=openid-{n}').get_json()['code'])
+
+    threads = [threading.Thread(target=request_phone, args=(n,)) for n in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert codes == [200] * 10
+    assert fake.count(TOKEN) == 1
+    assert fake.count(PHONE) == 10
+
+
+def get_token_in_worker(token_url, store_path, barrier, results):
+    """子进程：模拟一个gunicorn worker，使用各自的AccessTokenManager和同一个共享文件"""
+    manager = AccessTokenManager(lambda: requests.get(token_url, timeout=5).json(), store_path)
+    barrier.wait()
+    results.put(manager.get_token())
+
+
+def test_workers_share_token_file(fake, tmp_path):
+    store_path = str(tmp_path / 'wx_access_token.json')
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(WORKERS)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=get_token_in_worker, args=(fake.url + TOKEN, store_path, barrier, results))
+                 for _ in range(WORKERS)]
+    for process in processes:
+        process.start()
+    tokens = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+    assert tokens == ['token-test'] * WORKERS
+    assert fake.count(TOKEN) == 1
+
+
+def test_token_file_private(fake, tmp_path):
+    manager = AccessTokenManager(lambda: requests.get(fake.url + TOKEN, timeout=5).json(),
+                                 str(tmp_path / 'wx_access_token.json'))
+    old_umask = os.umask(0o022)
+    try:
+        manager.get_token()
+    finally:
+        os.umask(old_umask)
+    assert stat.S_IMODE(os.stat(manager.store_path).st_mode) == 0o600
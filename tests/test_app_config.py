@@ -0,0 +1,37 @@
+"""create_app传入的配置覆盖Config中的默认值，对限流和分页生效"""
+import pytest
+
+RECEIVER_PHONE = '13800138000'
+
+
+@pytest.fixture
+def client(make_app):
+    # 与默认值（发送者3条、接收者2条、每页20条、最多100条）不同
+    return make_app(SENDER_DAILY_LIMIT=2, RECEIVER_DAILY_LIMIT=3, PAGE_DEFAULT_LIMIT=1, PAGE_MAX_LIMIT=2).test_client()
+
+
+def send(client, sender_openid, receiver_phone):
+    return client.post('/api/blessing/send', json={
+        'sender_openid': sender_openid, 'receiver_phone': receiver_phone, 'content': '祝你天天开心'
+    }).get_json()['code']
+
+
+def test_overridden_rate_limits(client):
+    assert [send(client, 'sender', f'1390000000{i}') for i in range(3)] == [200, 200, 429]
+    assert [send(client, f'sender-{i}', RECEIVER_PHONE) for i in range(4)] == [200, 200, 200, 429]
+
+    data = client.post('/api/blessing/check-limit', json={
+        'sender_openid': 'sender', 'receiver_phone': RECEIVER_PHONE
+    }).get_json()['data']
+    assert (data['sender_count'], data['sender_limit']) == (2, 2)
+    assert (data['receiver_count'], data['receiver_limit']) == (3, 3)
+
+
+def test_overridden_page_limits(client):
+    for i in range(3):
+        assert send(client, f'sender-{i}', RECEIVER_PHONE) == 200
+
+    received = client.get(f'/api/blessing/received?phone={RECEIVER_PHONE}').get_json()['data']
+    assert len(received['blessings']) == 1
+    received = client.get(f'/api/blessing/received?phone={RECEIVER_PHONE}&limit=100').get_json()['data']
+    assert len(received['blessings']) == 2
@@ -0,0 +1,101 @@
+"""微信授权接口：Flask实现与ASGI实现（app/asgi.py）对同一组请求返回相同的响应
+
+两种实现都请求同一个本地模拟微信接口（tests/fake_wechat.py），比较HTTP状态码、Content-Type和JSON内容
+"""
+import base64
+import json
+
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('aiohttp')
+pytest.importorskip('httpx')
+
+from starlette.testclient import TestClient  # noqa: E402
+
+from tests.fake_wechat import FakeWeChatServer  # noqa: E402
+
+SESSION_KEY = base64.b64encode(b'0123456789abcdef').decode()
+LOGIN_IV = base64.b64encode(b'fedcba9876543210').decode()
+
+
+def respond(method, path, params, body):
+    """code为bad时微信返回40029，手机号接口code为nophone时缺少phone_info"""
+    if path == '/sns/jscode2session':
+        if params.get('js_code') == 'bad':
+            return {'errcode': 40029, 'errmsg': 'invalid code'}
+        return {'openid': f"openid-{params.get('js_code')}", 'session_key': SESSION_KEY}
+    if path == '/wxa/business/getuserphonenumber':
+        code = json.loads(body or b'{}').get('code')
+        if code == 'bad':
+            return {'errcode': 40029, 'errmsg': 'invalid code'}
+        if code == 'nophone':
+            return {'errcode': 0, 'errmsg': 'ok'}
+    return None
+
+
+def encrypt_login_phone(phone):
+    """按微信的方式用session_key加密手机号数据"""
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import pad
+    data = json.dumps({'phoneNumber': phone, 'watermark': {'appid': 'test'}}).encode()
+    cipher = AES.new(base64.b64decode(SESSION_KEY), AES.MODE_CBC, base64.b64decode(LOGIN_IV))
+    return base64.b64encode(cipher.encrypt(pad(data, AES.block_size))).decode()
+
+
+# (方法, 路径, JSON请求体)，覆盖参数错误、微信返回错误码、解密失败、手机号格式错误和正常情况
+CASES = [
+    ('GET', '/api/wx/get_openid', None),
+    ('GET', '/api/wx/get_openid?code=abc', None),
+    ('GET', '/api/wx/get_openid?code=bad', None),
+    ('POST', '/api/wx/login', {'code': 'abc'}),
+    ('POST', '/api/wx/login', {'code': 'abc', 'iv': LOGIN_IV}),
+    ('POST', '/api/wx/login', {'code': '', 'encryptedData': 'x', 'iv': LOGIN_IV}),
+    ('POST', '/api/wx/login', {'code': 'bad', 'encryptedData': encrypt_login_phone('13812345678'), 'iv': LOGIN_IV}),
+    ('POST', '/api/wx/login', {'code': 'abc', 'encryptedData': encrypt_login_phone('13812345678'), 'iv': LOGIN_IV}),
+    ('POST', '/api/wx/login', {'code': 'abc', 'encryptedData': encrypt_login_phone('12345'), 'iv': LOGIN_IV}),
+    ('POST', '/api/wx/login', {'code': 'abc', 'encryptedData': 'bm90LWNpcGhlcg==', 'iv': LOGIN_IV}),
+    ('GET', '/api/wx/phone?code=abc', None),
+    ('GET', '/api/wx/phone?code=abc&openid=openid-abc', None),
+    ('GET', '/api/wx/phone?code=bad&openid=openid-abc', None),
+    ('GET', '/api/wx/phone?code=nophone&openid=openid-abc', None),
+]
+
+
+@pytest.fixture(scope='module')
+def clients():
+    """(Flask测试客户端, ASGI测试客户端)，两种实现的微信客户端都指向模拟微信接口"""
+    from app.app import app as flask_app
+    from app.asgi import app as asgi_app
+    from app.extensions import db
+    from app.wechat import wx_client, async_wx_client, token_manager
+
+    fake = FakeWeChatServer(respond=respond)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for client in (wx_client, async_wx_client):
+            monkeypatch.setattr(client, 'base_url', fake.url)
+        monkeypatch.setattr(token_manager, '_cached', None)
+        with flask_app.app_context():
+            db.create_all()
+        with TestClient(asgi_app) as asgi_client:
+            yield flask_app.test_client(), asgi_client
+    fake.close()
+
+
+@pytest.mark.parametrize('method, path, body', CASES)
+def test_same_response(clients, method, path, body):
+    flask_client, asgi_client = clients
+    expected = flask_client.open(path, method=method, json=body)
+    actual = asgi_client.request(method, path, json=body)
+
+    assert actual.status_code == expected.status_code
+    assert actual.headers['Content-Type'] == expected.headers['Content-Type']
+    assert actual.json() == expected.get_json()
+
+
+@pytest.mark.parametrize('body', [{'code': 'abc'}, {'code': 'abc', 'iv': LOGIN_IV}])
+def test_login_missing_encrypted_data(clients, body):
+    """缺少encryptedData时两种实现都返回参数错误，而不是500"""
+    flask_client, asgi_client = clients
+    assert flask_client.post('/api/wx/login', json=body).get_json() == {'code': 400, 'message': '参数错误'}
+    assert asgi_client.post('/api/wx/login', json=body).json() == {'code': 400, 'message': '参数错误'}
@@ -0,0 +1,101 @@
+"""与数据库类型相关的SQL：统计信息更新、插入或更新、删除旧索引、copy-to 迁移
+
+在测试数据库上运行，设置 TEST_DATABASE_URL 即可覆盖PostgreSQL、MySQL（见 tests/conftest.py）
+"""
+from datetime import datetime
+
+from app import create_app
+from app.extensions import db
+from app.maintenance import analyze_tables
+from app.db_routing import upsert_statement
+from app.models import User, BlessingMessage, RateLimitCounter, RecentWrite
+
+
+def test_analyze_tables(app):
+    with app.app_context():
+        db.session.add(User(openid='u1', phone_number='密文', nick_name='用户1'))
+        db.session.commit()
+        with db.engine.begin() as conn:
+            analyze_tables(conn, ['users', 'blessing_messages'])
+            analyze_tables(conn)
+
+
+def test_upsert_statement(app):
+    with app.app_context():
+        table = RateLimitCounter.__table__
+        for _ in range(3):
+            db.session.execute(upsert_statement(
+                table, {'key': 'k', 'bucket': 60, 'count': 1}, [table.c.key, table.c.bucket],
+                {'count': table.c.count + 1}
+            ))
+        db.session.execute(upsert_statement(
+            table, {'key': 'k', 'bucket': 120, 'count': 1}, [table.c.key, table.c.bucket],
+            {'count': table.c.count + 1}
+        ))
+        db.session.commit()
+        assert dict(db.session.query(RateLimitCounter.bucket, RateLimitCounter.count)
+                    .filter_by(key='k').all()) == {60: 3, 120: 1}
+
+        table = RecentWrite.__table__
+        for written_at in (datetime(2024, 1, 1), datetime(2024, 1, 2)):
+            db.session.execute(upsert_statement(
+                table, {'key': 'openid', 'written_at': written_at}, [table.c.key], {'written_at': written_at}
+            ))
+        db.session.commit()
+        assert db.session.query(RecentWrite.written_at).filter_by(key='openid').scalar() == datetime(2024, 1, 2)
+
+
+def test_copy_to(database_url, make_app, tmp_path, monkeypatch):
+    import migrate_db
+
+    # 源库为临时SQLite数据库，目标库为测试数据库（表由copy_to创建）
+    source = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'source.db'), 'TESTING': True})
+    monkeypatch.setattr(migrate_db, 'app', source)
+    with source.app_context():
+        db.create_all()
+        for i in range(5):
+            db.session.add(User(openid=f'u{i}', phone_number=f'密文{i}', nick_name=f'用户{i}'))
+            db.session.add(BlessingMessage(sender_openid=f'u{i}', receiver_phone='密文', content=f'祝福{i}'))
+        db.session.add(RateLimitCounter(key='k', bucket=60, count=2))
+        db.session.commit()
+
+    migrate_db.copy_to(database_url, chunk_size=2)
+
+    # 再次执行：自增主键的表从断点继续，其他表按主键更新已有行
+    with source.app_context():
+        db.session.get(User, 'u0').nick_name = '改名'
+        db.session.get(RateLimitCounter, ('k', 60)).count = 3
+        db.session.add_all([BlessingMessage(sender_openid='u1', receiver_phone='密文', content=f'新祝福{i}')
+                            for i in range(3)])
+        db.session.commit()
+        source_blessings = db.session.query(BlessingMessage.id, BlessingMessage.content)\
+            .order_by(BlessingMessage.id).all()
+        db.engine.dispose()
+
+    migrate_db.copy_to(database_url, chunk_size=2)
+
+    with make_app().app_context():
+        assert db.session.query(User).count() == 5
+        assert db.session.get(User, 'u0').nick_name == '改名'
+        assert db.session.get(RateLimitCounter, ('k', 60)).count == 3
+        assert db.session.query(BlessingMessage.id, BlessingMessage.content)\
+            .order_by(BlessingMessage.id).all() == source_blessings
+
+        # 自增序列已调整到最大主键之后，新插入的行不会主键冲突
+        blessing = BlessingMessage(sender_openid='u2', receiver_phone='密文', content='迁移后的祝福')
+        db.session.add(blessing)
+        db.session.commit()
+        assert blessing.id == source_blessings[-1].id + 1
+
+
+def test_drop_obsolete_indexes(app):
+    import migrate_db
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(db.text('CREATE INDEX ix_blessing_sender_sent_at ON blessing_messages (sender_openid, sent_at)'))
+        assert migrate_db.drop_obsolete_indexes() == ['ix_blessing_sender_sent_at']
+        assert migrate_db.drop_obsolete_indexes() == []
+        names = {index['name'] for index in db.inspect(db.engine).get_indexes('blessing_messages')}
+        assert 'ix_blessing_sender_sent_at' not in names
+        assert 'ix_blessing_sender_deleted_sent_at' in names
@@ -0,0 +1,64 @@
+"""多进程指标汇总：已退出worker的指标文件由gunicorn master合并后删除，计数器不减少也不重复计算"""
+import multiprocessing
+import os
+
+from app.metrics import Metrics
+from app.metrics_export import MetricsExporter, EXITED_FILE
+
+REQUESTS = ('http_requests', (('route', '/api/test'),))
+SECONDS = ('http_request_seconds', (('route', '/api/test'),))
+
+
+def run_worker(directory, requests):
+    """子进程：模拟一个gunicorn worker，处理requests个请求后写入最后的指标并退出"""
+    metrics = Metrics()
+    exporter = MetricsExporter(metrics, directory, interval=60)
+    for _ in range(requests):
+        metrics.incr('http_requests', route='/api/test')
+        metrics.observe('http_request_seconds', 0.01, route='/api/test')
+    exporter.flush()
+
+
+def start_worker(directory, requests):
+    worker = multiprocessing.get_context('fork').Process(target=run_worker, args=(directory, requests))
+    worker.start()
+    worker.join(timeout=30)
+    assert worker.exitcode == 0
+    return worker.pid
+
+
+def test_exited_workers_merged(tmp_path):
+    directory = str(tmp_path)
+    master = MetricsExporter(Metrics(), directory, interval=60)
+    master.metrics.incr('http_requests', route='/api/test')
+
+    for requests in (1, 2, 3):
+        pid = start_worker(directory, requests)
+        [name] = [name for name in os.listdir(directory) if name != EXITED_FILE]
+        assert name.startswith(f'metrics-{pid}-')
+        # gunicorn child_exit
+        master.merge_exited(pid)
+
+    assert os.listdir(directory) == [EXITED_FILE]
+    merged, processes = master.collect()
+    assert merged['counters'][REQUESTS] == 1 + 1 + 2 + 3
+    assert merged['timings'][SECONDS][0] == 1 + 2 + 3
+    assert processes == 1
+
+
+def test_merged_file_not_counted_twice(tmp_path):
+    directory = str(tmp_path)
+    master = MetricsExporter(Metrics(), directory, interval=60)
+    pid = start_worker(directory, 2)
+    [name] = os.listdir(directory)
+    with open(os.path.join(directory, name), 'rb') as f:
+        content = f.read()
+
+    master.merge_exited(pid)
+    # 模拟汇总文件已替换、进程文件尚未删除时读取
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(content)
+
+    merged, processes = master.collect()
+    assert merged['counters'][REQUESTS] == 2
+    assert processes == 1
@@ -0,0 +1,62 @@
+"""列表接口的游标分页：沿next_cursor翻页不重复、不遗漏；格式错误的limit与格式错误的cursor一样返回400"""
+from datetime import datetime, timedelta
+
+import pytest
+
+RECEIVER_PHONE = '13800138000'
+
+
+@pytest.mark.parametrize('query', ['limit=abc', 'limit=1.5', 'limit=', 'limit=0', 'limit=-1', 'cursor=abc'])
+def test_invalid_page_args_rejected(client, query):
+    assert client.get(f'/api/blessing/received?phone={RECEIVER_PHONE}&{query}').get_json()['code'] == 400
+    assert client.get(f'/api/user/sent-blessings?openid=sender&{query}').get_json()['code'] == 400
+
+
+@pytest.mark.parametrize('query', ['', 'limit=5', 'limit=1000'])
+def test_valid_page_args_accepted(client, query):
+    assert client.get(f'/api/blessing/received?phone={RECEIVER_PHONE}&{query}').get_json()['code'] == 200
+
+
+def seed_blessings(count):
+    """写入count条同一发送者发给同一接收者的祝福，每3条的发送时间相同，返回按(sent_at, id)倒序的id"""
+    from app.extensions import db
+    from app.models import User, BlessingMessage
+    from app.routes import crypto_util
+
+    db.session.add(User(openid='sender', phone_number=crypto_util.encrypt('13900000000'), nick_name='发送者'))
+    base = datetime(2024, 1, 1, 8, 0, 0, 250000)
+    blessings = [
+        BlessingMessage(sender_openid='sender', receiver_phone=crypto_util.encrypt(RECEIVER_PHONE),
+                        receiver_phone_hash=crypto_util.blind_index(RECEIVER_PHONE), content=f'祝福{i}',
+                        status='sent', sent_at=base + timedelta(minutes=i // 3))
+        for i in range(count)
+    ]
+    db.session.add_all(blessings)
+    db.session.commit()
+    return [b.id for b in sorted(blessings, key=lambda b: (b.sent_at, b.id), reverse=True)]
+
+
+def traverse(client, url, limit):
+    """从第一页沿next_cursor翻到最后一页，返回(所有id, 页数)"""
+    ids, pages, cursor = [], 0, None
+    while True:
+        query = f'&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(url + query).get_json()['data']
+        pages += 1
+        ids.extend(blessing['id'] for blessing in data['blessings'])
+        cursor = data['next_cursor']
+        if not cursor:
+            return ids, pages
+        assert pages < 100, '分页没有结束'
+
+
+@pytest.mark.parametrize('count, limit, pages', [(11, 4, 3), (8, 4, 2), (3, 1, 3)])
+def test_cursor_traversal(app, client, count, limit, pages):
+    with app.app_context():
+        expected = seed_blessings(count)
+
+    for url in (f'/api/blessing/received?phone={RECEIVER_PHONE}', '/api/user/sent-blessings?openid=sender'):
+        ids, page_count = traverse(client, url, limit)
+        # 不重复、不遗漏，按(sent_at, id)倒序；最后一页没有next_cursor，恰好整页时不多出空页
+        assert ids == expected
+        assert page_count == pages
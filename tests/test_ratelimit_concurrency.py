@@ -0,0 +1,73 @@
+"""祝福发送限流：多个进程同时发送时，接受的次数不超过每日限额"""
+import multiprocessing
+
+from app import create_app
+from app.config import Config
+from app.extensions import db
+from app.models import BlessingMessage
+
+PROCESSES = 8
+SENDS_PER_PROCESS = 5
+
+
+def send_blessings(db_uri, barrier, results, payloads):
+    """子进程：创建独立的应用，所有进程就绪后同时发送，返回每个请求的业务码"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': db_uri, 'TESTING': True})
+    client = app.test_client()
+    barrier.wait()
+    results.put([client.post('/api/blessing/send', json=payload).get_json()['code'] for payload in payloads])
+
+
+def run_parallel(db_uri, payloads_of):
+    """PROCESSES个进程同时发送，payloads_of(进程序号)返回该进程的请求体列表，返回所有业务码"""
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(PROCESSES)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=send_blessings, args=(db_uri, barrier, results, payloads_of(n)))
+                 for n in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    codes = [code for _ in processes for code in results.get(timeout=60)]
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    return codes
+
+
+def create_database(make_app):
+    """建表后关闭父进程的连接，子进程不继承打开的连接"""
+    app = make_app()
+    with app.app_context():
+        db.engine.dispose()
+    return app
+
+
+def count_blessings(app, **filters):
+    with app.app_context():
+        count = BlessingMessage.query.filter_by(**filters).count()
+        db.engine.dispose()
+        return count
+
+
+def test_sender_limit_under_concurrency(make_app, database_url):
+    app = create_database(make_app)
+    codes = run_parallel(database_url, lambda n: [
+        {'sender_openid': 'sender', 'receiver_phone': f'139{n:04d}{i:04d}', 'content': '祝你天天开心'}
+        for i in range(SENDS_PER_PROCESS)
+    ])
+
+    assert codes.count(200) == Config.SENDER_DAILY_LIMIT
+    assert codes.count(429) == PROCESSES * SENDS_PER_PROCESS - Config.SENDER_DAILY_LIMIT
+    assert count_blessings(app, sender_openid='sender') == Config.SENDER_DAILY_LIMIT
+
+
+def test_receiver_limit_under_concurrency(make_app, database_url):
+    app = create_database(make_app)
+    codes = run_parallel(database_url, lambda n: [
+        {'sender_openid': f'sender-{n}-{i}', 'receiver_phone': '13800138000', 'content': '祝你天天开心'}
+        for i in range(SENDS_PER_PROCESS)
+    ])
+
+    assert codes.count(200) == Config.RECEIVER_DAILY_LIMIT
+    assert codes.count(429) == PROCESSES * SENDS_PER_PROCESS - Config.RECEIVER_DAILY_LIMIT
+    assert count_blessings(app) == Config.RECEIVER_DAILY_LIMIT
@@ -0,0 +1,44 @@
+"""查看收到的祝福：每个请求执行的SQL条数不随祝福数量增加"""
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import User, BlessingMessage
+from app.routes import crypto_util
+
+RECEIVER_PHONE = '13800138000'
+
+
+def seed_blessings(count):
+    """写入count条发给同一接收者的祝福，每条来自不同的发送者"""
+    receiver_hash = crypto_util.blind_index(RECEIVER_PHONE)
+    for i in range(count):
+        db.session.add(User(openid=f'sender-{i}', phone_number=crypto_util.encrypt(f'139{i:08d}'),
+                            nick_name=f'发送者{i}'))
+        db.session.add(BlessingMessage(sender_openid=f'sender-{i}', receiver_phone=crypto_util.encrypt(RECEIVER_PHONE),
+                                       receiver_phone_hash=receiver_hash, content='祝你天天开心', status='sent'))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('count', [1, 10, 50])
+def test_received_blessings_single_statement(app, client, count):
+    with app.app_context():
+        seed_blessings(count)
+        engine = db.engine
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(f'/api/blessing/received?phone={RECEIVER_PHONE}&limit=100')
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    data = response.get_json()
+    assert data['code'] == 200
+    assert len(data['data']['blessings']) == count
+    assert {blessing['sender_name'] for blessing in data['data']['blessings']} == {f'发送者{i}' for i in range(count)}
+    assert len(statements) == 1, statements
@@ -0,0 +1,140 @@
+"""短信发送：worker领取、发送结果写回、超时未完成和结果未知的消息不重发，使用假短信客户端"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import Config
+from app.extensions import db
+from app.maintenance import MaintenanceRunner
+from app.models import SmsOutbox, BlessingMessage
+from app.sms import FakeSMS
+from app.sms_queue import SmsWorker, enqueue_sms
+
+
+def make_worker(client, **kwargs):
+    return SmsWorker(client, concurrency=2, **kwargs)
+
+
+def outbox(message_id):
+    db.session.expire_all()
+    return db.session.get(SmsOutbox, message_id)
+
+
+def test_stale_sending_marked_unknown_not_resent(app):
+    client = FakeSMS()
+    worker = make_worker(client)
+    with app.app_context():
+        message = enqueue_sms('13800138000', '祝你天天开心')
+        db.session.commit()
+        assert worker.claim_batch()
+        # 领取后worker崩溃，消息停在sending
+        stale_at = datetime.utcnow() - timedelta(seconds=Config.SMS_SENDING_TIMEOUT + 1)
+        SmsOutbox.query.filter_by(id=message.id).update({'updated_at': stale_at})
+        db.session.commit()
+
+        assert worker.process_batch() == 0
+        assert MaintenanceRunner().expire_sending_sms(datetime.utcnow()) == 1
+        assert worker.process_batch() == 0
+        assert outbox(message.id).status == 'unknown'
+        assert client.calls == 0
+
+
+def test_result_not_written_after_claim_lost(app):
+    client = FakeSMS()
+    worker = make_worker(client)
+    with app.app_context():
+        message = enqueue_sms('13800138000', '祝你天天开心')
+        db.session.commit()
+        claimed = worker.claim_batch()
+        # 其他worker已重新领取该消息
+        claim_token = claimed[0].claimed_by
+        SmsOutbox.query.filter_by(id=message.id).update({'claimed_by': 'other-worker'}, synchronize_session=False)
+        db.session.commit()
+
+        assert worker.record_result(claimed[0], claim_token, True, 'OK') is None
+        db.session.commit()
+        row = outbox(message.id)
+        assert (row.status, row.claimed_by, row.attempts) == ('sending', 'other-worker', 0)
+
+
+def test_aliyun_error_after_request_is_uncertain(monkeypatch):
+    pytest.importorskip('aliyunsdkcore')
+    from app.sms import AliyunSMS
+
+    class Client:
+        def do_action_with_exception(self, request):
+            return b'[]'  # 请求已发出，响应无法按预期解析
+
+    sms = AliyunSMS()
+    monkeypatch.setattr(sms._local, 'client', Client(), raising=False)
+    success, info = sms.send_sms('13800138000', '祝你天天开心')
+    assert success is None
+    assert info.startswith('发送结果未知')
+    assert {success for success, _ in sms.send_batch_sms(['13800138000'], ['祝你天天开心'])} == {None}
+
+
+def due_now(message_id):
+    """让等待重试的消息立即到期"""
+    SmsOutbox.query.filter_by(id=message_id).update({'next_attempt_at': datetime.utcnow()})
+    db.session.commit()
+
+
+def test_outbox_pipeline(app):
+    client = FakeSMS(fail_numbers=['13900000009'], timeout_numbers=['13900000008'])
+    worker = make_worker(client, max_attempts=3, retry_backoff=10)
+    with app.app_context():
+        sent = [enqueue_sms(f'1390000000{i}', f'祝福{i}', template_code='T1') for i in range(2)]
+        failing = enqueue_sms('13900000009', '祝福9', template_code='T1')
+        # 不同模板单独调用，超时只影响这一次调用
+        timeout = enqueue_sms('13900000008', '祝福8', template_code='T2')
+        db.session.commit()
+
+        assert worker.process_batch() == 4
+        assert [outbox(m.id).status for m in sent] == ['sent', 'sent']
+        assert outbox(timeout.id).status == 'unknown'
+        for attempt in (1, 2):
+            row = outbox(failing.id)
+            assert (row.status, row.attempts) == ('pending', attempt)
+            expected = row.updated_at + timedelta(seconds=attempt * 10)
+            assert abs((row.next_attempt_at - expected).total_seconds()) < 1
+            assert worker.process_batch() == 0  # 退避时间未到，不重新领取
+            due_now(failing.id)
+            assert worker.process_batch() == 1
+        row = outbox(failing.id)
+        assert (row.status, row.attempts) == ('failed', 3)
+        assert row.last_error
+
+        # 结果未知的消息不重发，成功的消息只发送一次
+        assert worker.process_batch() == 0
+        assert sorted(phone for phone, _ in client.sent) == ['13900000000', '13900000001', '13900000008']
+
+
+@pytest.fixture
+def sms_app(make_app):
+    return make_app(BLESSING_SMS_ENABLED=True)
+
+
+def test_endpoints_enqueue_without_calling_client(sms_app, monkeypatch):
+    from app.sms import AliyunSMS
+
+    def no_network(*args, **kwargs):
+        raise AssertionError('接口请求中不应调用短信接口')
+
+    monkeypatch.setattr(AliyunSMS, 'send_sms', no_network)
+    monkeypatch.setattr(AliyunSMS, 'send_batch_sms', no_network)
+    client = FakeSMS()
+    monkeypatch.setattr('app.sms.sms_client', client)
+    http = sms_app.test_client()
+
+    assert http.post('/api/sms/send-code', json={'phone': '13800138000'}).get_json()['code'] == 200
+    assert http.post('/api/blessing/send', json={
+        'sender_openid': 'sender', 'receiver_phone': '13800138001', 'content': '祝你天天开心'
+    }).get_json()['code'] == 200
+    assert client.calls == 0
+
+    with sms_app.app_context():
+        assert SmsOutbox.query.filter_by(status='pending').count() == 2
+        assert make_worker(client).process_batch() == 2
+        assert SmsOutbox.query.filter_by(status='sent').count() == 2
+        assert BlessingMessage.query.one().status == 'sent'
+    assert sorted(phone for phone, _ in client.sent) == ['13800138000', '13800138001']
@@ -0,0 +1,112 @@
+"""微信接口客户端：重试和超时，使用本地模拟微信接口；access_token文件锁在gevent模式下的等待"""
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+import requests
+
+from app.wechat import WeChatClient
+from tests.fake_wechat import FakeWeChatServer
+
+CODE2SESSION = '/sns/jscode2session'
+PHONE = '/wxa/business/getuserphonenumber'
+
+
+@pytest.fixture
+def fake():
+    server = FakeWeChatServer()
+    yield server
+    server.close()
+
+
+def make_client(fake, read_timeout=1.0):
+    return WeChatClient(fake.url, 'app-id', 'app-secret', timeout=(1, read_timeout), max_retries=2, backoff_factor=0)
+
+
+def test_get_retried_on_5xx(fake):
+    fake.enqueue(CODE2SESSION, status=503, payload={'errcode': -1})
+    fake.enqueue(CODE2SESSION, status=502, payload={'errcode': -1})
+
+    result = make_client(fake).code2session('code')
+
+    assert result['openid'] == 'openid-test'
+    assert fake.count(CODE2SESSION) == 3
+
+
+def test_get_returns_last_5xx_after_retries(fake):
+    for _ in range(3):
+        fake.enqueue(CODE2SESSION, status=503, payload={'errcode': -1, 'errmsg': 'system busy'})
+
+    assert make_client(fake).code2session('code')['errcode'] == -1
+    assert fake.count(CODE2SESSION) == 3
+
+
+def test_post_not_retried_on_5xx(fake):
+    fake.enqueue(PHONE, status=503, payload={'errcode': -1})
+
+    assert make_client(fake).get_phone_number('token', 'code')['errcode'] == -1
+    assert fake.count(PHONE) == 1
+
+
+def test_post_not_retried_after_read_timeout(fake):
+    fake.enqueue(PHONE, delay=1.0)
+
+    started = time.perf_counter()
+    with pytest.raises(requests.Timeout):
+        make_client(fake, read_timeout=0.2).get_phone_number('token', 'code')
+
+    assert time.perf_counter() - started < 0.9
+    time.sleep(1.0)
+    assert fake.count(PHONE) == 1
+
+
+def test_read_timeout_applied(fake):
+    fake.delays[CODE2SESSION] = 1.0
+
+    started = time.perf_counter()
+    with pytest.raises(requests.RequestException):
+        make_client(fake, read_timeout=0.1).code2session('code')
+
+    # 3次尝试各在读取超时后放弃，远少于模拟接口的耗时总和
+    assert time.perf_counter() - started < 1.5
+    assert fake.count(CODE2SESSION) == 3
+
+
+# gevent模式下等待其他进程持有的文件锁：等待的协程不能卡住其他协程
+GEVENT_LOCK_WAIT = textwrap.dedent("""
+    from gevent import monkey
+    monkey.patch_all()
+    import fcntl
+    import sys
+    import gevent
+    from app.wechat import AccessTokenManager
+
+    manager = AccessTokenManager(lambda: {'access_token': 'token-new', 'expires_in': 7200}, sys.argv[1])
+    ticks = []
+
+    def tick():
+        while True:
+            ticks.append(1)
+            gevent.sleep(0.01)
+
+    with open(manager.lock_path, 'a') as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        waiter = gevent.spawn(manager.get_token)
+        gevent.spawn(tick)
+        gevent.sleep(0.3)
+        assert not waiter.ready()
+        assert len(ticks) >= 10, len(ticks)
+        fcntl.flock(held, fcntl.LOCK_UN)
+    assert waiter.get(timeout=2) == 'token-new'
+""")
+
+
+def test_token_file_lock_wait_does_not_block_gevent_hub(tmp_path):
+    pytest.importorskip('gevent')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', GEVENT_LOCK_WAIT, str(tmp_path / 'wx_access_token.json')],
+                            cwd=root, capture_output=True, text=True, timeout=15)
+    assert result.returncode == 0, result.stderr